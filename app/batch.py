@@ -0,0 +1,63 @@
+import asyncio
+import json
+import logging
+from typing import AsyncIterator, List, Optional
+from app.flow import check_authenticity
+from core.config import batch_settings
+from core.singleflight import SharedCache
+from core.deadline import Deadline
+
+logger = logging.getLogger(__name__)
+
+
+class EventCollector:
+    """Websocket stand-in that keeps the events of one check."""
+
+    def __init__(self):
+        self.events: List[dict] = []
+
+    async def send_text(self, text: str):
+        self.events.append(json.loads(text))
+
+    def result(self, url: str) -> dict:
+        for event in self.events:
+            if event.get("step") == "completed":
+                return {"url": url, "status": "completed", "response": event.get("response"), "timings": event.get("timings")}
+        errors = [event.get("message") for event in self.events if event.get("step") == "error"]
+        return {"url": url, "status": "failed", "message": errors[-1] if errors else "Check did not complete"}
+
+
+async def run_batch(urls: List[str], workers: int = None, deadline: Optional[float] = None) -> AsyncIterator[dict]:
+    """Check many reels on a worker pool, yielding one result per URL in completion order.
+
+    All checks share one SharedCache, so searches, page fetches and
+    embeddings common to several reels are only done once. `deadline` is the
+    budget in seconds for each reel, counted from when its check starts.
+    `workers` can lower the concurrency but not raise it above BATCH_WORKERS.
+    """
+    workers = max(1, min(workers or batch_settings.workers, batch_settings.workers))
+    pending = list(dict.fromkeys(url.strip() for url in urls if url and url.strip()))
+    total = len(pending)
+    shared = SharedCache()
+    results: asyncio.Queue = asyncio.Queue()
+
+    async def worker():
+        while pending:
+            url = pending.pop(0)
+            collector = EventCollector()
+            try:
+                await check_authenticity(collector, url, shared=shared, deadline=Deadline(deadline))
+                await results.put(collector.result(url))
+            except Exception as e:
+                logger.error(f"Batch check failed for {url}: {e}")
+                await results.put({"url": url, "status": "failed", "message": str(e)})
+
+    tasks = [asyncio.create_task(worker()) for _ in range(min(workers, total))]
+    try:
+        for _ in range(total):
+            yield await results.get()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        logger.info(f"Batch of {total} reels finished, shared stage cache {shared.stats()}")
@@ -1,14 +1,24 @@
 from fastapi import WebSocket
+import asyncio
 import json
-import os
 import logging
+from collections import Counter
 from modules.wed_data_extractor.pipeline import get_wed_data
-from app.steps.get_url_from_link import get_link_from_url
+from modules.wed_data_extractor.evidence_compressor import compress_evidence
+from app.steps.get_url_from_link import get_link_from_url, link_expired
 from app.steps.save_audio_locally import save_audio_locally
 from app.steps.get_audio_transcription import audio_to_text
-from app.steps.claims_extractor import extract_claims
-from app.steps.claim_verifier import verify_claim
-from app.steps.responce_generator import generate_responce
+from app.steps.speech_detector import detect_speech
+from app.steps.claims_extractor import EarlyClaims
+from app.steps.claim_verifier import verify_claim, partial_verdict
+from app.steps.responce_generator import stream_responce, fallback_responce
+from core.config import job_settings, deadline_settings, store_settings, speech_settings
+from core.deadline import Deadline, DeadlineExceeded
+from core.metrics import StageTimings, BACKGROUND_STAGES, SPEECH_CHECKS_TOTAL, SPEECH_SKIPPED_AUDIO
+from core.singleflight import SharedCache
+from core.concurrency import whisper_pool, transcription_pool, http_pool
+from core import store
+from core import media_store
 
 logging.basicConfig(
     level=logging.INFO,
@@ -17,40 +27,177 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def load_data():
-    if os.path.exists('db/data.json'):
+def load_data(url_key: str) -> dict:
+    """Cached stage results for one reel, shared by all server processes."""
+    return store.get_entry(url_key)
+
+def update_data(url_key: str, field: str, value):
+    store.set_field(url_key, field, value)
+
+_background_stages = set()
+# Cacheable stages running in this process by lease name, and how many checks await each
+_stage_runs = {}
+_stage_waiters = Counter()
+
+NO_SPEECH_MESSAGE = "This reel has no verifiable speech (it is music, silent or has no talking), so there are no claims to check."
+
+async def run_cacheable(url_key: str, field: str, pool, func, *args):
+    """Run a stage whose result is cached, letting it outlive a cancelled check.
+
+    func is a blocking function run on the pool's threads, or, with no pool,
+    a coroutine function that limits its own concurrency.
+
+    If the check is cancelled (the client went away) the stage keeps running in
+    the background and still writes its result to the cache, so the next check
+    of the same reel starts from there. At most job_settings.background_limit
+    such stages run at once, each for at most background_timeout seconds.
+
+    Within the process, checks of the same reel share one running stage. A
+    lease in the store makes it single-flight across server processes too:
+    while another process runs the same stage for the same reel, this one
+    waits for its cached result instead of repeating the work. Store leases
+    belong to the process, so they cannot tell apart two checks within it.
+    """
+    lease = f"stage:{field}:{url_key}"
+
+    async def run_and_cache():
+        while not store.acquire_lease(lease, job_settings.background_timeout):
+            value = store.get_field(url_key, field)
+            if value is not None:
+                return value
+            await asyncio.sleep(store_settings.lease_poll_interval)
         try:
-            with open('db/data.json', 'r') as f:
-                return json.load(f)
-        except (json.JSONDecodeError, FileNotFoundError):
-            return {}
-    return {}
+            # Another process may have finished it between our check and taking the lease
+            value = store.get_field(url_key, field)
+            if value is None:
+                value = await (pool.run_in_thread(func, *args) if pool is not None else func(*args))
+                update_data(url_key, field, value)
+            return value
+        finally:
+            store.release_lease(lease)
+
+    task = _stage_runs.get(lease)
+    if task is None:
+        task = asyncio.create_task(run_and_cache())
+        _stage_runs[lease] = task
+        task.add_done_callback(lambda done: _stage_runs.pop(lease) if _stage_runs.get(lease) is done else None)
+    _stage_waiters[lease] += 1
+    try:
+        return await asyncio.shield(task)
+    except asyncio.CancelledError:
+        if _stage_waiters[lease] > 1 or task in _background_stages:
+            # Another check still needs the result, or it already finishes in the background
+            raise
+        if len(_background_stages) < job_settings.background_limit:
+            _background_stages.add(task)
+            task.add_done_callback(_background_stages.discard)
+            asyncio.get_running_loop().call_later(job_settings.background_timeout, task.cancel)
+            BACKGROUND_STAGES.labels(stage=field, outcome="finished_in_background").inc()
+            logger.info(f"Check cancelled, finishing {field} in the background")
+        else:
+            task.cancel()
+            BACKGROUND_STAGES.labels(stage=field, outcome="cancelled").inc()
+        raise
+    finally:
+        _stage_waiters[lease] -= 1
+        if not _stage_waiters[lease]:
+            del _stage_waiters[lease]
+
+def audio_size(audio_url: str):
+    """Size in bytes of a saved audio file referenced as /reels/audio/<name>."""
+    audio_path = media_store.audio_path(media_store.audio_name(audio_url))
+    return audio_path.stat().st_size if audio_path.is_file() else None
+
+async def transcribe_streaming(url_key: str, audio_url: str, websocket: WebSocket, deadline: Deadline, early: EarlyClaims):
+    """Transcribe and cache the audio, sending each chunk's text as soon as it is ready.
 
-def save_data(data):
-    os.makedirs('db', exist_ok=True)
-    with open('db/data.json', 'w') as f:
-        json.dump(data, f, indent=2)
+    The text so far is handed to early claim extraction after every chunk.
+    If another process is already transcribing this reel there are no chunks
+    to forward; the full transcription arrives once it is cached.
+    """
+    loop = asyncio.get_running_loop()
+    segments: asyncio.Queue = asyncio.Queue()
 
-async def check_authenticity(websocket: WebSocket = None,url: str = None):
-    data = load_data()
+    def on_segment(segment: dict):
+        loop.call_soon_threadsafe(segments.put_nowait, segment)
+
+    async def announce(task: asyncio.Task, seconds: float):
+        if not task.cancelled() and task.result():
+            await websocket.send_text(json.dumps({
+                "step": "success", "message": f"Found {len(task.result())} claims in the first {seconds:.0f}s of the reel"
+            }))
+
+    texts = []
+
+    async def forward(segment: dict):
+        if segment["text"]:
+            texts.append(segment["text"])
+            await websocket.send_text(json.dumps({
+                "step": "transcript", "message": segment["text"], "start": segment["start"], "end": segment["end"],
+            }))
+        if early.feed(" ".join(texts), segment["final"]):
+            early.task.add_done_callback(lambda task: asyncio.create_task(announce(task, segment["end"])))
+
+    transcribing = asyncio.create_task(deadline.within(
+        run_cacheable(url_key, 'transcription', transcription_pool, audio_to_text, audio_url, on_segment)
+    ))
+    try:
+        while not transcribing.done():
+            next_segment = asyncio.create_task(segments.get())
+            await asyncio.wait({next_segment, transcribing}, return_when=asyncio.FIRST_COMPLETED)
+            if next_segment.done():
+                await forward(next_segment.result())
+            else:
+                next_segment.cancel()
+        while not segments.empty():
+            await forward(segments.get_nowait())
+        return transcribing.result()
+    finally:
+        if not transcribing.done():
+            # The check was cancelled; run_cacheable still finishes the transcription in the background
+            transcribing.cancel()
+            early.cancel()
+
+async def check_authenticity(websocket: WebSocket = None,url: str = None, timings: StageTimings = None, shared: SharedCache = None, deadline: Deadline = None):
+    timings = timings or StageTimings()
+    # Every stage sizes its timeouts from what is left of this budget
+    deadline = deadline or Deadline()
 
     url_key = url.strip()
+    cached = load_data(url_key)
     
     results = {}
 
-    if url_key not in data:
-        data[url_key] = {}
-
     logger.info("Getting link from url")
     await websocket.send_text(json.dumps({"step": "processing", "message": "Extracting link from url"}))
     
-    if 'link' not in data[url_key]:
-        link = get_link_from_url(url)
-        data[url_key]['link'] = link
-        save_data(data)
-    else:
-        link = data[url_key]['link']
-        logger.info("Using cached link")
+    saved = cached.get('video_and_audio')
+    if saved and saved.get('success') and not media_store.has_audio(saved.get('audio')):
+        # The audio was evicted or deleted since it was cached, so download it again
+        store.forget_audio(saved.get('audio'))
+        del cached['video_and_audio']
+
+    with timings.stage("link") as stage:
+        needs_download = 'video_and_audio' not in cached and 'transcription' not in cached
+        if 'link' in cached and (not cached['link'].get('success') or (needs_download and link_expired(cached['link']))):
+            # A failure may only mean Instagram was unavailable, and signed media URLs
+            # expire, so the reel is resolved again rather than reusing either
+            logger.info("Cached link failed or has expired, resolving it again")
+            store.delete_field(url_key, 'link')
+            del cached['link']
+            stage["refreshed"] = True
+        if 'link' not in cached:
+            try:
+                link = await deadline.within(run_cacheable(url_key, 'link', http_pool, get_link_from_url, url, deadline.timeout(15)))
+            except DeadlineExceeded:
+                link = {'success': False, 'message': 'Timed out extracting the link'}
+            cached['link'] = link
+            stage["cache"] = "miss"
+        else:
+            link = cached['link']
+            logger.info("Using cached link")
+            stage["cache"] = "hit"
+        stage["bytes"] = len(json.dumps(link))
     
     results['link'] = link
     if link.get('success'):
@@ -58,7 +205,7 @@ async def check_authenticity(websocket: WebSocket = None,url: str = None):
         await websocket.send_text(json.dumps({"step": "success", "message": "Extracted link from url"}))
     else:
         logger.error("Link not found")
-        await websocket.send_text(json.dumps({"step": "error", "message": "Invalid URL"}))
+        await websocket.send_text(json.dumps({"step": "error", "message": link.get('message') if deadline.expired() else "Invalid URL"}))
     if not link.get('success'):
         results['final'] = link
         return results
@@ -67,13 +214,31 @@ async def check_authenticity(websocket: WebSocket = None,url: str = None):
     logger.info("Saving video and audio locally")
     await websocket.send_text(json.dumps({"step": "processing", "message": "Saving video and audio locally"}))
     
-    if 'video_and_audio' not in data[url_key]:
-        video_and_audio = save_audio_locally(link['videoUrl'], link['filename'])
-        data[url_key]['video_and_audio'] = video_and_audio
-        save_data(data)
-    else:
-        video_and_audio = data[url_key]['video_and_audio']
-        logger.info("Using cached video and audio")
+    with timings.stage("download") as stage:
+        if 'video_and_audio' not in cached and 'transcription' in cached:
+            # Only transcription reads the audio, so an evicted reel is not downloaded again
+            video_and_audio = {'success': True, 'audio': None, 'source': 'not_needed', 'downloaded_bytes': 0}
+            stage["cache"] = "hit"
+        elif 'video_and_audio' not in cached:
+            try:
+                video_and_audio = await deadline.within(run_cacheable(
+                    url_key, 'video_and_audio', None, save_audio_locally,
+                    link['videoUrl'], link['filename'], deadline.timeout(30), link.get('audioUrls'),
+                ))
+            except DeadlineExceeded:
+                video_and_audio = {'success': False, 'message': 'Timed out saving video and audio'}
+            cached['video_and_audio'] = video_and_audio
+            stage["cache"] = "miss"
+        else:
+            video_and_audio = cached['video_and_audio']
+            logger.info("Using cached video and audio")
+            if video_and_audio.get('success'):
+                media_store.touch_audio(media_store.audio_name(video_and_audio.get('audio')))
+            stage["cache"] = "hit"
+        stage["bytes"] = audio_size(video_and_audio.get('audio'))
+        stage["source"] = video_and_audio.get('source')
+        # Bytes this check transferred: the audio-only track is a fraction of the mp4
+        stage["downloaded"] = video_and_audio.get('downloaded_bytes') if stage["cache"] == "miss" else 0
     
     results['video_and_audio'] = video_and_audio
     if video_and_audio.get('success'):
@@ -86,16 +251,52 @@ async def check_authenticity(websocket: WebSocket = None,url: str = None):
         results['final'] = video_and_audio
         return results
 
+    if speech_settings.enabled and 'transcription' not in cached:
+        await websocket.send_text(json.dumps({"step": "processing", "message": "Checking the audio for speech"}))
+        with timings.stage("speech") as stage:
+            if 'speech' not in cached:
+                try:
+                    speech = await deadline.within(run_cacheable(url_key, 'speech', whisper_pool, detect_speech, video_and_audio['audio']))
+                    SPEECH_CHECKS_TOTAL.labels(outcome=speech['reason'] or "speech").inc()
+                    if not speech['speech']:
+                        SPEECH_SKIPPED_AUDIO.inc(speech['duration'])
+                except Exception as e:
+                    # Detection only saves work, so without a result the reel is transcribed as usual
+                    logger.warning(f"Speech detection failed, transcribing anyway: {e}")
+                    speech = None
+                stage["cache"] = "miss"
+            else:
+                speech = cached['speech']
+                stage["cache"] = "hit"
+        if speech and not speech['speech']:
+            logger.info(f"No speech in the audio ({speech['reason']}), skipping transcription of {speech['duration']}s")
+            final_msg = {"final_msg": NO_SPEECH_MESSAGE, "claims": []}
+            results['final'] = {'success': True, 'message': NO_SPEECH_MESSAGE}
+            await websocket.send_text(json.dumps({"step": "success", "message": "No speech found in the audio"}))
+            await websocket.send_text(json.dumps({"step": "completed", "message": "Final response generated", "response": final_msg, "timings": timings.as_dict()}))
+            return results
+        await websocket.send_text(json.dumps({"step": "success", "message": "Checked the audio for speech"}))
+
     logger.info("Getting transcription of audio")
     await websocket.send_text(json.dumps({"step": "processing", "message": "Getting audio transcription"}))
     
-    if 'transcription' not in data[url_key]:
-        transcription = audio_to_text(video_and_audio['audio'])
-        data[url_key]['transcription'] = transcription
-        save_data(data)
-    else:
-        transcription = data[url_key]['transcription']
-        logger.info("Using cached transcription")
+    # Claims can be extracted from the first chunks while the rest is still being transcribed
+    early = EarlyClaims(deadline)
+    with timings.stage("transcription") as stage:
+        if 'transcription' not in cached:
+            try:
+                transcription = await transcribe_streaming(url_key, video_and_audio['audio'], websocket, deadline, early)
+            except DeadlineExceeded:
+                # The transcription keeps running in the background and is cached for the next check
+                logger.error("Transcription did not finish within the time budget")
+                transcription = None
+            cached['transcription'] = transcription
+            stage["cache"] = "miss"
+        else:
+            transcription = cached['transcription']
+            logger.info("Using cached transcription")
+            stage["cache"] = "hit"
+        stage["bytes"] = len(transcription or "")
     
     results['transcription'] = transcription
     if transcription:
@@ -105,12 +306,15 @@ async def check_authenticity(websocket: WebSocket = None,url: str = None):
         logger.error("Failed to get transcription")
         await websocket.send_text(json.dumps({"step": "warning", "message": "Failed to get audio transcription, proceeding with video analysis"}))
     if not transcription:
+        early.cancel()
         fail_msg = {'success': False, 'message': 'Failed to get transcription'}
         results['final'] = fail_msg
         return results
     
     await websocket.send_text(json.dumps({"step": "processing", "message": "Extracting claims from transcription"}))
-    claims = await extract_claims(transcription)
+    with timings.stage("claims") as stage:
+        claims = await early.finish(transcription)
+        stage["bytes"] = len(json.dumps(claims))
     logger.info(f" {len(claims)} Claims extracted")
 
     await websocket.send_text(json.dumps({"step": "success", "message": f"There are {len(claims)} claims made in the video"}))
@@ -122,12 +326,34 @@ async def check_authenticity(websocket: WebSocket = None,url: str = None):
     
     await websocket.send_text(json.dumps({"step": "processing", "message": "Verifying claims with web data"}))
     relavent_content = []
-    for claim in claims:
-        content = await get_wed_data(claim['claim'],websocket=websocket)
-        evidence_list = [result['snippet'] for result in content['results']]
+    # Claims may only use the budget minus what the final verdict needs
+    claims_deadline = deadline.reserve(deadline_settings.responce_reserve)
+    for index, claim in enumerate(claims):
+        if claims_deadline.expired():
+            skipped = len(claims) - index
+            logger.warning(f"Time budget exhausted, skipping {skipped} claims")
+            await websocket.send_text(json.dumps({"step": "warning", "message": f"Time budget exhausted, {skipped} claims were not verified"}))
+            for remaining in claims[index:]:
+                relavent_content.append({'claim': remaining['claim'], 'content': {}, 'result': "Not verified (time budget exhausted)"})
+            break
+        content = await get_wed_data(claim['claim'],websocket=websocket, timings=timings, shared=shared, deadline=claims_deadline)
+        # Only needed to compress this claim's evidence, and not serializable
+        query_embedding = content.pop('query_embedding', None)
+        # Keep only the sentences that matter for this claim so the prompt stays short
+        with timings.stage("compress") as stage:
+            evidence = await compress_evidence(claim['claim'], content.get('results', []), query_embedding=query_embedding, shared=shared)
+            evidence_list = [f"{item['text']} (source: {item['url']})" for item in evidence]
+            stage["bytes"] = sum(len(ev) for ev in evidence_list)
         await websocket.send_text(json.dumps({"step": "processing", "message": f"Verifying claim: {claim['claim'][:100]}..."}))
-        result = await verify_claim(claim['claim'], evidence_list)
-        await websocket.send_text(json.dumps({"step": "success", "message": f"Claim: {claim['claim'][:100]}... verified"}))
+        with timings.stage("verify") as stage:
+            result = await verify_claim(claim['claim'], evidence_list, deadline=claims_deadline)
+            stage["bytes"] = len(result or "")
+        if result:
+            await websocket.send_text(json.dumps({"step": "success", "message": f"Claim: {claim['claim'][:100]}... verified"}))
+        else:
+            # The LLM failed or ran out of time; report what was found rather than fail the check
+            result = partial_verdict(claim['claim'], evidence_list)
+            await websocket.send_text(json.dumps({"step": "warning", "message": f"Claim: {claim['claim'][:100]}... could not be verified, reporting the evidence found"}))
         relavent_content.append({'claim': claim['claim'], 'content': content, 'result': result})
     results['relavent_content'] = relavent_content
     if relavent_content:
@@ -143,7 +369,25 @@ async def check_authenticity(websocket: WebSocket = None,url: str = None):
     
     await websocket.send_text(json.dumps({"step": "processing", "message": "Generating final response"}))
     formatted_data = [{'claim': item['claim'], 'verfication_result': item['result']} for item in relavent_content]
-    responce = await generate_responce(formatted_data)
+    # Forward the verdict as it is generated so the user sees the first tokens
+    # instead of waiting for the whole assessment
+    responce = ""
+    with timings.stage("responce") as stage:
+        if deadline.remaining() >= deadline_settings.min_responce_time:
+            async for token in stream_responce(formatted_data, deadline=deadline):
+                responce += token
+                await websocket.send_text(json.dumps({"step": "partial", "message": token}))
+            responce = responce.strip()
+        if not responce:
+            # Too little time left for the LLM, or it failed, so answer from the per-claim results
+            if deadline.remaining() < deadline_settings.min_responce_time:
+                logger.warning("Time budget too low for the final response, composing it from claim results")
+                responce = fallback_responce(formatted_data)
+            else:
+                logger.warning("LLM returned no final response, composing it from claim results")
+                responce = fallback_responce(formatted_data, reason="by the language model")
+            await websocket.send_text(json.dumps({"step": "partial", "message": responce}))
+        stage["bytes"] = len(responce)
     results['responce'] = responce
     if responce:
         logger.info("Responce generated")
@@ -164,9 +408,9 @@ async def check_authenticity(websocket: WebSocket = None,url: str = None):
             'verfication_result': items['result'],
             'sources': []
         }
-        for source in items['content']['results']:
+        for source in items['content'].get('results', []):
             item['sources'].append(source['url'])
         final_msg['claims'].append(item)
         print(final_msg)
-    await websocket.send_text(json.dumps({"step": "completed", "message": "Final response generated", "response": final_msg}))
+    await websocket.send_text(json.dumps({"step": "completed", "message": "Final response generated", "response": final_msg, "timings": timings.as_dict()}))
     return 
\ No newline at end of file
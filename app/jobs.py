@@ -0,0 +1,297 @@
+import asyncio
+import json
+import logging
+import math
+import time
+import uuid
+from typing import AsyncIterator, Dict, List, Optional
+from app.flow import check_authenticity
+from core.config import job_settings, concurrency_settings, store_settings, profile_settings
+from core.deadline import Deadline
+from core import store, profiling
+from core.metrics import JOB_QUEUE_DEPTH, JOB_WORKERS_BUSY, JOB_WORKERS_TOTAL, JOBS_TOTAL, JOBS_REJECTED, JOBS_CANCELLED, StageTimings
+
+logger = logging.getLogger(__name__)
+
+# Assumed job duration until real ones have been measured
+DEFAULT_JOB_SECONDS = 30.0
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, retry_after: int) -> None:
+        super().__init__(f"Server is busy, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+class Job:
+    """A single check whose progress events are kept for replay.
+
+    Job exposes send_text so check_authenticity can report into it exactly as
+    it would into a websocket. Every event gets a sequence number; clients
+    that reconnect pass the last one they saw to resume from there.
+
+    Jobs started from the extension websocket are cancelled once their last
+    client has been gone for the disconnect grace period; jobs submitted
+    through the job API keep running until they finish.
+
+    A deadline given at submission also covers the time spent queued;
+    without one the default budget starts when a worker picks the job up.
+
+    Jobs submitted with profile=True save a sampling profile of their run;
+    with PROFILE_SLOW_SECONDS set, every job is sampled and the profile is
+    kept when the run took longer than that.
+    """
+
+    def __init__(self, url: str, cancel_on_disconnect: bool = False, deadline: Optional[Deadline] = None, profile: bool = False):
+        self.id = uuid.uuid4().hex
+        self.url = url
+        self.status = "queued"  # queued, running, completed, failed, cancelled
+        self.events: List[dict] = []
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.position: Optional[int] = None
+        self.cancel_on_disconnect = cancel_on_disconnect
+        self.deadline = deadline
+        self.profile = profile
+        self.subscribers = 0
+        self.timings = StageTimings()
+        self.task: Optional[asyncio.Task] = None
+        # Set when the manager cancels the check, so that is told apart from the worker being cancelled
+        self.cancel_requested = False
+        self._cancel_handle: Optional[asyncio.TimerHandle] = None
+        self._changed = asyncio.Condition()
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("completed", "failed", "cancelled")
+
+    async def send_text(self, text: str):
+        event = json.loads(text)
+        event["seq"] = len(self.events)
+        self.events.append(event)
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def finish(self, status: str):
+        self.status = status
+        self.finished_at = time.time()
+        JOBS_TOTAL.labels(status=status).inc()
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def stream(self, after: int = -1) -> AsyncIterator[dict]:
+        """Yield events with seq > after, then follow new ones until the job is done."""
+        index = after + 1
+        while True:
+            while index < len(self.events):
+                yield self.events[index]
+                index += 1
+            if self.done:
+                return
+            async with self._changed:
+                if index >= len(self.events) and not self.done:
+                    await self._changed.wait()
+
+    def summary(self) -> dict:
+        return {
+            "job_id": self.id,
+            "url": self.url,
+            "status": self.status,
+            "events": len(self.events),
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobManager:
+    """Runs checks on a fixed pool of background workers fed by a local queue.
+
+    The queue is bounded: once max_queue_depth jobs are waiting, new ones are
+    rejected straight away with a retry hint, so a spike cannot pile up work
+    that would only finish after clients have given up. Every waiting job
+    holds a lease in the shared store, so the bound applies to the jobs
+    queued across all server processes, not per process.
+    """
+
+    def __init__(self, workers: int = job_settings.workers, max_queue_depth: int = concurrency_settings.max_queue_depth):
+        self.worker_count = workers
+        self.max_queue_depth = max_queue_depth
+        self.queue: asyncio.Queue = None
+        self.jobs: Dict[str, Job] = {}
+        self.waiting: List[Job] = []
+        self.workers: List[asyncio.Task] = []
+        self.busy = 0
+        self.avg_duration = DEFAULT_JOB_SECONDS
+        self._stopping = False
+
+    async def start(self):
+        self.queue = asyncio.Queue()
+        self.workers = [asyncio.create_task(self._worker(i)) for i in range(self.worker_count)]
+        JOB_WORKERS_TOTAL.set(self.worker_count)
+        self._update_gauges()
+        logger.info(f"Started {self.worker_count} job workers")
+
+    async def stop(self):
+        self._stopping = True
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+        store.release_owned_leases()
+
+    async def submit(self, url: str, cancel_on_disconnect: bool = False, deadline: Optional[Deadline] = None, profile: bool = False) -> Job:
+        url = url.strip()
+        # Reattach to an in-flight check of the same reel instead of starting over
+        for job in self.jobs.values():
+            if job.url == url and not job.done:
+                if not cancel_on_disconnect:
+                    job.cancel_on_disconnect = False
+                # Only takes effect if the job has not started yet or is sampled anyway
+                job.profile = job.profile or profile
+                return job
+
+        if store.count_leases("queued:") >= self.max_queue_depth:
+            JOBS_REJECTED.inc()
+            raise AdmissionRejected(self.retry_after())
+
+        self._prune()
+        job = Job(url, cancel_on_disconnect=cancel_on_disconnect, deadline=deadline, profile=profile)
+        self.jobs[job.id] = job
+        store.acquire_lease(f"queued:{job.id}", store_settings.queue_lease_ttl)
+        self.waiting.append(job)
+        self._update_gauges()
+        self.queue.put_nowait(job)
+        logger.info(f"Queued job {job.id} for {url}")
+        await self._announce_positions()
+        return job
+
+    def retry_after(self) -> int:
+        """Rough seconds until a queue slot frees up, based on recent job durations."""
+        return max(1, math.ceil(len(self.waiting) / max(1, self.worker_count) * self.avg_duration))
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    def attach(self, job: Job):
+        """Register a connected client, aborting any pending disconnect cancellation."""
+        job.subscribers += 1
+        if job._cancel_handle:
+            job._cancel_handle.cancel()
+            job._cancel_handle = None
+
+    def detach(self, job: Job):
+        """Unregister a client; cancel the job after a grace period if nobody is left."""
+        job.subscribers -= 1
+        if job.subscribers <= 0 and job.cancel_on_disconnect and not job.done:
+            # The grace period lets a reloaded tab reattach before work is thrown away
+            job._cancel_handle = asyncio.get_running_loop().call_later(
+                job_settings.disconnect_grace, lambda: asyncio.create_task(self.cancel(job))
+            )
+
+    async def cancel(self, job: Job):
+        if job.done or (job.subscribers > 0 and job.cancel_on_disconnect):
+            return
+        stage = job.timings.current or ("queued" if job in self.waiting else "between_stages")
+        logger.info(f"Cancelling job {job.id} during {stage}")
+        JOBS_CANCELLED.labels(stage=stage).inc()
+        if job in self.waiting:
+            self.waiting.remove(job)
+            store.release_lease(f"queued:{job.id}")
+            self._update_gauges()
+            await job.finish("cancelled")
+            await self._announce_positions()
+        elif job.task:
+            job.cancel_requested = True
+            job.task.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": len(self.waiting),
+            "queue_depth_all_processes": store.count_leases("queued:"),
+            "max_queue_depth": self.max_queue_depth,
+            "workers": self.worker_count,
+            "busy_workers": self.busy,
+            "utilisation": round(self.busy / self.worker_count, 4) if self.worker_count else 0.0,
+        }
+
+    async def _worker(self, index: int):
+        while True:
+            job = await self.queue.get()
+            if job.done:
+                # Cancelled while it was still waiting
+                self.queue.task_done()
+                continue
+            self.waiting.remove(job)
+            store.release_lease(f"queued:{job.id}")
+            self.busy += 1
+            self._update_gauges()
+            job.status = "running"
+            job.position = None
+            started = time.monotonic()
+            await self._announce_positions()
+            capture = profiling.start_capture(lambda: job.timings.current) if job.profile or profile_settings.slow_seconds else None
+            job.task = asyncio.create_task(check_authenticity(job, job.url, timings=job.timings, deadline=job.deadline))
+            try:
+                await job.task
+                completed = any(event.get("step") == "completed" for event in job.events)
+                await job.finish("completed" if completed else "failed")
+            except asyncio.CancelledError:
+                worker = asyncio.current_task()
+                # Python 3.11+ can tell whether the cancellation is aimed at this worker too
+                worker_cancelled = hasattr(worker, "cancelling") and worker.cancelling() > 0
+                if job.cancel_requested and job.task.cancelled() and not worker_cancelled and not self._stopping:
+                    # Only a cancellation of the job itself (the client went away) is absorbed
+                    await job.finish("cancelled")
+                else:
+                    job.task.cancel()
+                    await job.finish("failed")
+                    raise
+            except Exception as e:
+                logger.error(f"Job {job.id} failed: {e}")
+                await job.send_text(json.dumps({"step": "error", "message": f"An error occurred: {str(e)}"}))
+                await job.finish("failed")
+            finally:
+                self.busy -= 1
+                self._update_gauges()
+                self.queue.task_done()
+                # Exponential moving average keeps the retry hint current
+                self.avg_duration = 0.8 * self.avg_duration + 0.2 * (time.monotonic() - started)
+                if capture:
+                    await self._save_profile(job, capture)
+
+    async def _save_profile(self, job: Job, capture: profiling.ProfileCapture):
+        capture.stop()
+        if job.profile:
+            reason = "requested"
+        elif capture.duration >= profile_settings.slow_seconds:
+            reason = "slow"
+        else:
+            return
+        try:
+            await asyncio.to_thread(profiling.save_profile, capture, job.url, job.timings.as_dict(), reason)
+        except OSError as e:
+            logger.error(f"Could not save profile of job {job.id}: {e}")
+
+    def _update_gauges(self):
+        JOB_QUEUE_DEPTH.set(len(self.waiting))
+        JOB_WORKERS_BUSY.set(self.busy)
+
+    async def _announce_positions(self):
+        """Tell every waiting job its place in the queue when it changes."""
+        for index, job in enumerate(list(self.waiting)):
+            position = index + 1
+            if job.position != position:
+                job.position = position
+                await job.send_text(json.dumps({
+                    "step": "queued",
+                    "message": f"Waiting in queue (position {position})",
+                    "position": position,
+                }))
+
+    def _prune(self):
+        cutoff = time.time() - job_settings.retention
+        for job_id in [j.id for j in self.jobs.values() if j.done and j.finished_at < cutoff]:
+            del self.jobs[job_id]
+
+
+job_manager = JobManager()
@@ -1,9 +1,10 @@
 from typing import List
 import logging
 from modules.llm_clients.client import get_llm_client
+from core.deadline import Deadline
 logger = logging.getLogger(__name__)
 
-async def verify_claim(claim: str , evidence: List[str]) -> str:
+async def verify_claim(claim: str , evidence: List[str], deadline: Deadline = None) -> str:
     prompt = f"""You are a fact-checking assistant. Analyze the claim against the provided evidence and determine if it is correct, partially correct, or incorrect.
 
 CLAIM: {claim}
@@ -22,8 +23,16 @@ Respond now:"""
     
     try:
         logger.info(f"Verifying claim: {claim[:100]}...")
-        raw_response = await get_llm_client(prompt)
+        raw_response = await get_llm_client(prompt, deadline=deadline)
         return raw_response
     except Exception as e:
         logger.error(f"Error verifying claim: {e}")
-        return None
\ No newline at end of file
+        return None
+
+def partial_verdict(claim: str, evidence: List[str], limit: int = 3) -> str:
+    """A result for a claim the LLM did not verify, made from the evidence collected for it."""
+    if not evidence:
+        return "Not verified (no verdict could be generated and no evidence was found)"
+    lines = ["Not verified (no verdict could be generated). Evidence found:"]
+    lines += [f"- {ev}" for ev in evidence[:limit]]
+    return "\n".join(lines)
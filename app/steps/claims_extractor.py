@@ -1,12 +1,57 @@
-import json
+import asyncio
 import logging
+import re
+from typing import List, Literal, Optional
+from pydantic import BaseModel, Field, ValidationError
 from modules.llm_clients.client import get_llm_client
+from core.metrics import CLAIM_EXTRACTION_TOTAL
+from core.deadline import Deadline
+from core.config import transcription_settings
 
 logger = logging.getLogger(__name__)
 
-async def extract_claims(transcription: str):   
+ClaimCategory = Literal[
+    "health_medical", "political_news", "celebrity_gossip", "financial_market", "scientific_fact",
+    "historical_event", "product_review", "social_issue", "technology_tech", "sports_entertainment",
+    "weather_natural", "business_economy", "education_academic", "legal_regulatory", "cultural_trend",
+]
+
+SKIP_PHRASES = [
+    'i think', 'i believe', 'in my opinion', 'personally',
+    'you should', 'try this', 'works for me', 'recommend'
+]
+
+
+class Claim(BaseModel):
+    claim: str = Field(min_length=1, description="Complete, specific, independent statement with all details")
+    category: ClaimCategory
+
+
+class ClaimList(BaseModel):
+    claims: List[Claim]
+
+
+CLAIMS_SCHEMA = ClaimList.model_json_schema()
+
+# The prompt asks for at most this many claims
+MAX_CLAIMS = 3
+# Word overlap above which two claims are taken to be the same
+DUPLICATE_OVERLAP = 0.6
+
+async def extract_claims(transcription: str, deadline: Deadline = None, earlier: Optional[str] = None, found: Optional[List[dict]] = None):
     if not transcription or not transcription.strip():
         raise ValueError("Transcription cannot be empty")
+
+    # When only the end of a transcript is searched, the start is given for
+    # context and the claims already taken from it are listed so they are not repeated
+    context = ""
+    if earlier:
+        context += f"""
+EARLIER IN THE SAME VIDEO (already checked, use it only to resolve names and references in the transcription below):
+{earlier.strip()}
+"""
+    if found:
+        context += "\nCLAIMS ALREADY EXTRACTED (do not repeat them):\n" + "\n".join(f"- {claim['claim']}" for claim in found) + "\n"
     
     # Enhanced prompt for better claim extraction
     prompt = f"""
@@ -43,64 +88,137 @@ WHAT DOES NOT QUALIFY:
 - Motivational content
 
 RESPONSE FORMAT:
-Return ONLY a valid JSON array. Each object must have exactly these fields:
+Return ONLY a valid JSON object with a single "claims" array. Each object in the array must have exactly these fields:
 - "claim": Complete, specific, independent statement with all details
 - "category": One category from the list below
 
 CATEGORIES: health_medical, political_news, celebrity_gossip, financial_market, scientific_fact, historical_event, product_review, social_issue, technology_tech, sports_entertainment, weather_natural, business_economy, education_academic, legal_regulatory, cultural_trend
 
+{context}
 TRANSCRIPTION:
 {transcription.strip()}
 
-RESPOND WITH JSON ONLY - NO OTHER TEXT. If no significant verifiable claims exist, return an empty array []:
+RESPOND WITH JSON ONLY - NO OTHER TEXT. If no significant verifiable claims exist, return {{"claims": []}}:
 """
     
     try:
         logger.info(f"Extracting claims from transcription: {transcription[:100]}...")
-        raw_response = await get_llm_client(prompt)
-        
-        # Clean and parse JSON response
+        raw_response = await get_llm_client(prompt, json_schema=CLAIMS_SCHEMA, deadline=deadline)
+        if raw_response is None:
+            CLAIM_EXTRACTION_TOTAL.labels(outcome="failed").inc()
+            return []
+
         try:
-            # Remove any potential markdown code blocks or extra text
-            if "```json" in raw_response:
-                raw_response = raw_response.split("```json")[1].split("```")[0].strip()
-            elif "```" in raw_response:
-                raw_response = raw_response.split("```")[1].strip()
-            
-            # Try to find JSON array in response
-            start_idx = raw_response.find('[')
-            end_idx = raw_response.rfind(']') + 1
-            
-            if start_idx != -1 and end_idx > start_idx:
-                json_str = raw_response[start_idx:end_idx]
-                claims_data = json.loads(json_str)
-                
-                if isinstance(claims_data, list):
-                    # Filter out any claims that might be too generic or not worth verifying
-                    filtered_claims = []
-                    for claim in claims_data:
-                        if isinstance(claim, dict) and claim.get('claim'):
-                            claim_text = claim['claim'].lower()
-                            # Skip claims that are too generic or opinion-based
-                            if not any(skip_word in claim_text for skip_word in [
-                                'i think', 'i believe', 'in my opinion', 'personally', 
-                                'you should', 'try this', 'works for me', 'recommend'
-                            ]):
-                                filtered_claims.append(claim)
-                    
-                    logger.info(f"Successfully extracted {len(filtered_claims)} claims")
-                    return filtered_claims
-                else:
-                    logger.warning("Invalid claims format")
-                    return []
-            else:
-                logger.error("No valid JSON array found in response")
-                return []
-                
-        except json.JSONDecodeError as e:
-            logger.error(f"JSON parsing failed: {e}")
-            logger.error(f"Raw response: {raw_response}")
+            claim_list = ClaimList.model_validate_json(raw_response)
+            outcome = "ok"
+        except ValidationError as e:
+            # One bounded repair attempt: show the model its output and the validation errors
+            logger.warning(f"Claims did not match schema, attempting repair: {e}")
+            claim_list = await repair_claims(raw_response, e, deadline)
+            outcome = "repaired"
+
+        if claim_list is None:
+            CLAIM_EXTRACTION_TOTAL.labels(outcome="failed").inc()
             return []
+        CLAIM_EXTRACTION_TOTAL.labels(outcome=outcome).inc()
+
+        # Filter out any claims that might be too generic or not worth verifying
+        filtered_claims = [
+            claim.model_dump() for claim in claim_list.claims
+            if not any(skip_word in claim.claim.lower() for skip_word in SKIP_PHRASES)
+        ]
+        logger.info(f"Successfully extracted {len(filtered_claims)} claims")
+        return filtered_claims
     except Exception as e:
+        CLAIM_EXTRACTION_TOTAL.labels(outcome="failed").inc()
         logger.error(f"Claim extraction failed: {e}")
-        return []
\ No newline at end of file
+        return []
+
+
+async def repair_claims(raw_response: str, error: ValidationError, deadline: Deadline = None):
+    prompt = f"""The following output was supposed to be a JSON object with a "claims" array, but it failed validation.
+
+OUTPUT:
+{raw_response}
+
+VALIDATION ERRORS:
+{error}
+
+Return the corrected JSON object only. Each claim needs a "claim" string and a "category" from: {", ".join(ClaimCategory.__args__)}.
+If nothing can be recovered, return {{"claims": []}}:"""
+
+    if deadline and deadline.expired():
+        logger.warning("No time left to repair claims")
+        return None
+    repaired = await get_llm_client(prompt, json_schema=CLAIMS_SCHEMA, deadline=deadline)
+    if repaired is None:
+        return None
+    try:
+        return ClaimList.model_validate_json(repaired)
+    except ValidationError as e:
+        logger.error(f"Claim repair failed: {e}")
+        logger.error(f"Raw response: {raw_response}")
+        return None
+
+
+def claim_words(claim: dict) -> set:
+    return set(re.findall(r"\w+", claim["claim"].lower()))
+
+
+def merge_claims(first: List[dict], second: List[dict]) -> List[dict]:
+    """Claims of both lists without near-duplicates, first list first, at most MAX_CLAIMS."""
+    merged = list(first)
+    for claim in second:
+        words = claim_words(claim)
+        if not any(len(words & claim_words(kept)) / max(1, len(words | claim_words(kept))) >= DUPLICATE_OVERLAP for kept in merged):
+            merged.append(claim)
+    return merged[:MAX_CLAIMS]
+
+
+class EarlyClaims:
+    """Claim extraction started on the transcript of a reel that is still being transcribed.
+
+    Chunks are final once transcribed, so the text so far is a stable prefix
+    of the full transcript. Once it has EARLY_CLAIMS_MIN_WORDS words, claims
+    are extracted from it in the background; when the transcript is complete,
+    only the rest of it is searched for further claims, unless the early
+    extraction failed or found none, in which case the whole is searched.
+    """
+
+    def __init__(self, deadline: Deadline = None, min_words: int = transcription_settings.early_claims_words):
+        self.deadline = deadline
+        self.min_words = min_words
+        self.prefix = ""
+        self.task: Optional[asyncio.Task] = None
+
+    def feed(self, prefix: str, final: bool) -> bool:
+        """Offer the transcript so far; returns True if extraction started on it."""
+        if self.task or final or not self.min_words or len(prefix.split()) < self.min_words:
+            return False
+        self.prefix = prefix
+        self.task = asyncio.create_task(extract_claims(prefix, deadline=self.deadline))
+        return True
+
+    async def finish(self, transcription: str) -> List[dict]:
+        if not self.task or not transcription.startswith(self.prefix):
+            self.cancel()
+            return await extract_claims(transcription, deadline=self.deadline)
+
+        try:
+            claims = await self.task
+        except Exception as e:
+            logger.warning(f"Early claim extraction failed: {e}")
+            claims = []
+        if not claims:
+            # An LLM error or timeout looks like a prefix without claims, so search it again
+            return await extract_claims(transcription, deadline=self.deadline)
+
+        rest = transcription[len(self.prefix):].strip()
+        if not rest or len(claims) >= MAX_CLAIMS:
+            return claims[:MAX_CLAIMS]
+        logger.info(f"Extracted {len(claims)} claims early, searching the remaining {len(rest.split())} words")
+        return merge_claims(claims, await extract_claims(rest, deadline=self.deadline, earlier=self.prefix, found=claims))
+
+    def cancel(self):
+        if self.task and not self.task.done():
+            self.task.cancel()
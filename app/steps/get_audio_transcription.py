@@ -1,11 +1,40 @@
 import os
-import whisper
-
-def audio_to_text(audio_path: str) -> str:
-    if audio_path.startswith("/reels/audio/"):
-        filename = os.path.basename(audio_path)
-        audio_path = os.path.join(os.path.dirname(__file__), "../../reels/audio", filename)
-        audio_path = os.path.normpath(audio_path)
-    model = whisper.load_model("base")
-    result = model.transcribe(audio_path, task="translate")
-    return result["text"]
\ No newline at end of file
+from typing import Callable, Optional
+from modules.model_server.models import transcribe, transcribe_samples
+from modules.model_server.audio import SAMPLE_RATE, load_audio, split_on_pauses
+from core.media_store import AUDIO_URL_PREFIX, audio_path as stored_audio_path
+from core.config import transcription_settings
+
+def local_audio_path(audio_path: str) -> str:
+    if audio_path.startswith(AUDIO_URL_PREFIX):
+        # Resolve against the media store save_audio_locally wrote to
+        audio_path = str(stored_audio_path(os.path.basename(audio_path)))
+    # The model server may run from another directory, so always pass an absolute path
+    return os.path.abspath(audio_path)
+
+def audio_to_text(audio_path: str, on_segment: Optional[Callable[[dict], None]] = None) -> str:
+    """Transcribe a reel's audio, chunk by chunk when it is longer than one chunk.
+
+    on_segment is called with each chunk's text as soon as it is transcribed,
+    from the thread doing the transcription.
+    """
+    audio_path = local_audio_path(audio_path)
+    if not transcription_settings.chunk_seconds:
+        return transcribe(audio_path)
+
+    audio = load_audio(audio_path)
+    ranges = split_on_pauses(audio, transcription_settings.chunk_seconds, transcription_settings.cut_window)
+    texts = []
+    for index, (start, end) in enumerate(ranges):
+        text = transcribe_samples(audio[start:end], prompt=" ".join(texts) or None).strip()
+        if text:
+            texts.append(text)
+        if on_segment:
+            on_segment({
+                "index": index,
+                "start": round(start / SAMPLE_RATE, 2),
+                "end": round(end / SAMPLE_RATE, 2),
+                "text": text,
+                "final": index == len(ranges) - 1,
+            })
+    return " ".join(texts)
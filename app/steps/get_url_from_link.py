@@ -1,9 +1,14 @@
 import re
 import json
+import time
 import urllib.parse
-from typing import Dict, Any, Optional
+import xml.etree.ElementTree as ElementTree
+from typing import Dict, Any, List, Optional
 import requests
 from bs4 import BeautifulSoup
+from core.config import instagram_settings
+from core import store
+from core import outbound
 
 
 class HTTPError(Exception):
@@ -12,7 +17,15 @@ class HTTPError(Exception):
         self.status = status
 
 
-def get_link_from_url(url: str) -> Dict[str, Any]:
+# Seconds allowed for each request to Instagram
+REQUEST_TIMEOUT = 15
+
+MPD_NAMESPACE = {"mpd": "urn:mpeg:dash:schema:mpd:2011"}
+# The DASH manifest is embedded in the post page's JSON as an escaped string
+DASH_MANIFEST_REGEX = re.compile(r'"video_dash_manifest"\s*:\s*("(?:[^"\\]|\\.)*")')
+
+
+def get_link_from_url(url: str, timeout: float = REQUEST_TIMEOUT) -> Dict[str, Any]:
     if not url:
         raise ValueError("URL is required")
 
@@ -21,28 +34,45 @@ def get_link_from_url(url: str) -> Dict[str, Any]:
         raise ValueError(validation_error)
 
     try:
-        post_id = get_post_id_from_url(url)
+        post_id = get_post_id_from_url(url, timeout)
         if not post_id:
             raise ValueError("Invalid Post URL - Could not extract ID")
 
-        post_json = get_video_info(post_id)
+        post_json = store.get_metadata(f"media:{post_id}")
+        if post_json is None:
+            try:
+                post_json = get_video_info(post_id, timeout)
+            except (outbound.BreakerOpen, outbound.RateLimited):
+                # Instagram is unavailable; URLs due for a refresh may still work
+                stale = store.get_metadata(f"media:{post_id}", stale=True)
+                if stale is None or link_expired(stale, margin=0):
+                    raise
+                stale['success'] = True
+                return stale
+            post_json['expiresAt'] = link_expires_at(post_json)
+            # Reused until shortly before the signed URLs stop working
+            fresh_until = post_json['expiresAt'] or time.time() + instagram_settings.link_ttl
+            store.set_metadata(f"media:{post_id}", post_json, fresh_until - instagram_settings.link_refresh_margin)
         post_json['success'] = True
         return post_json
     except Exception as error:
         return {'success': False, 'message': str(error)}
 
 
-def get_post_id_from_url(post_url: str) -> str:
+def get_post_id_from_url(post_url: str, timeout: float = REQUEST_TIMEOUT) -> str:
     share_regex = r"^https://(?:www\.)?instagram\.com/share/([a-zA-Z0-9_-]+)/?.*"
     post_regex = r"^https://(?:www\.)?instagram\.com/p/([a-zA-Z0-9_-]+)/?.*"
     reel_regex = r"^https://(?:www\.)?instagram\.com/reels?/([a-zA-Z0-9_-]+)/?.*"
 
-    if re.match(share_regex, post_url):
-        try:
-            reel_id = fetch_reel_id_from_share_url(post_url)
-            return reel_id
-        except Exception as error:
-            raise error
+    share_match = re.match(share_regex, post_url)
+    if share_match:
+        # A share link always points at the same reel, so it is resolved once
+        key = f"share:{share_match.group(1)}"
+        reel_id = store.get_metadata(key)
+        if reel_id is None:
+            reel_id = fetch_reel_id_from_share_url(post_url, timeout)
+            store.set_metadata(key, reel_id)
+        return reel_id
 
     post_match = re.match(post_regex, post_url)
     if post_match and post_match.group(1):
@@ -55,12 +85,12 @@ def get_post_id_from_url(post_url: str) -> str:
     raise ValueError("Unable to extract ID from URL")
 
 
-def fetch_reel_id_from_share_url(share_url):
+def fetch_reel_id_from_share_url(share_url, timeout=REQUEST_TIMEOUT):
     try:
         headers = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
         }
-        response = requests.get(share_url, headers=headers, allow_redirects=True)
+        response = outbound.instagram.call(requests.get, share_url, headers=headers, allow_redirects=True, timeout=timeout)
         if not response.ok:
             raise ValueError(f"Failed to fetch share URL: {response.status_code}")
 
@@ -101,6 +131,33 @@ def is_valid_instagram_url(post_url: str) -> Optional[str]:
     return None
 
 
+def url_expires_at(url: str) -> Optional[float]:
+    """When a signed Instagram CDN URL stops working, from its oe parameter (a hex Unix time)."""
+    values = urllib.parse.parse_qs(urllib.parse.urlsplit(url or "").query).get("oe")
+    try:
+        return float(int(values[0], 16)) if values else None
+    except ValueError:
+        return None
+
+
+def link_expires_at(link: Dict[str, Any]) -> Optional[float]:
+    """The earliest expiry of a link's media URLs, or None if none of them is signed."""
+    expiries = [url_expires_at(url) for url in [link.get("videoUrl"), *(link.get("audioUrls") or [])]]
+    expiries = [expiry for expiry in expiries if expiry is not None]
+    return min(expiries) if expiries else None
+
+
+def link_expired(link: Dict[str, Any], margin: Optional[float] = None) -> bool:
+    """Whether a link's media URLs expire within margin (INSTAGRAM_LINK_REFRESH_MARGIN) seconds.
+
+    Links cached before expiresAt was recorded are checked from their URLs.
+    """
+    if margin is None:
+        margin = instagram_settings.link_refresh_margin
+    expires_at = link.get("expiresAt") or link_expires_at(link)
+    return expires_at is not None and expires_at - margin <= time.time()
+
+
 def get_ig_video_filename(reel_id: str):
     """Generate filename for video using reel ID"""
     return f"reel_{reel_id}.mp4"
@@ -148,18 +205,65 @@ def encode_graphql_request_data(shortcode):
     return urllib.parse.urlencode(request_data)
 
 
+def get_audio_urls_from_manifest(manifest: str) -> Optional[List[str]]:
+    """URLs of the lowest-bitrate audio-only representation in a DASH manifest, in playback order.
+
+    Whisper resamples to 16 kHz mono, so a higher bitrate would only mean more
+    bytes. Returns None when the manifest has no audio representation that
+    can be fetched as a file or a list of segments.
+    """
+    try:
+        root = ElementTree.fromstring(manifest)
+    except ElementTree.ParseError:
+        return None
+
+    candidates = []
+    for adaptation_set in root.iterfind(".//mpd:AdaptationSet", MPD_NAMESPACE):
+        for representation in adaptation_set.iterfind("mpd:Representation", MPD_NAMESPACE):
+            mime_type = representation.get("mimeType") or adaptation_set.get("mimeType") or ""
+            content_type = adaptation_set.get("contentType") or mime_type.split("/")[0]
+            if content_type == "audio":
+                candidates.append(representation)
+    candidates.sort(key=lambda representation: int(representation.get("bandwidth") or 0))
+
+    for representation in candidates:
+        base_url = (representation.findtext("mpd:BaseURL", default="", namespaces=MPD_NAMESPACE) or "").strip()
+        segment_list = representation.find("mpd:SegmentList", MPD_NAMESPACE)
+        if segment_list is None:
+            if base_url and representation.find("mpd:SegmentTemplate", MPD_NAMESPACE) is None:
+                return [base_url]
+            continue
+        urls = []
+        initialization = segment_list.find("mpd:Initialization", MPD_NAMESPACE)
+        if initialization is not None and initialization.get("sourceURL"):
+            urls.append(urllib.parse.urljoin(base_url, initialization.get("sourceURL")))
+        urls.extend(
+            urllib.parse.urljoin(base_url, segment.get("media"))
+            for segment in segment_list.iterfind("mpd:SegmentURL", MPD_NAMESPACE)
+            if segment.get("media")
+        )
+        if urls:
+            return urls
+    return None
+
+
 def format_graphql_json(data, reel_id):
     filename = get_ig_video_filename(reel_id)
     width = str(data["dimensions"]["width"])
     height = str(data["dimensions"]["height"])
     video_url = data["video_url"]
 
-    return {
+    video_json = {
         "filename": filename,
         "width": width,
         "height": height,
         "videoUrl": video_url,
     }
+    manifest = (data.get("dash_info") or {}).get("video_dash_manifest")
+    audio_urls = get_audio_urls_from_manifest(manifest) if manifest else None
+    if audio_urls:
+        video_json["audioUrls"] = audio_urls
+    return video_json
 
 
 def format_page_json(post_html, reel_id):
@@ -186,17 +290,31 @@ def format_page_json(post_html, reel_id):
     }
 
 
-def get_video_json_from_html(post_id):
-    data = get_post_page_html(post_id)
+def get_audio_urls_from_html(data: str) -> Optional[List[str]]:
+    match = DASH_MANIFEST_REGEX.search(data)
+    if not match:
+        return None
+    try:
+        return get_audio_urls_from_manifest(json.loads(match.group(1)))
+    except ValueError:
+        return None
+
+
+def get_video_json_from_html(post_id, timeout=REQUEST_TIMEOUT):
+    data = get_post_page_html(post_id, timeout)
     post_html = BeautifulSoup(data, 'html.parser')
     video_element = post_html.find("meta", {"property": "og:video"})
     if not video_element:
         return None
-    return format_page_json(post_html, post_id)
+    video_json = format_page_json(post_html, post_id)
+    audio_urls = get_audio_urls_from_html(data) if video_json else None
+    if audio_urls:
+        video_json["audioUrls"] = audio_urls
+    return video_json
 
 
-def get_video_json_from_graphql(post_id):
-    data = get_post_graphql_data(post_id)
+def get_video_json_from_graphql(post_id, timeout=REQUEST_TIMEOUT):
+    data = get_post_graphql_data(post_id, timeout)
     media_data = data.get("data", {}).get("xdt_shortcode_media")
     if not media_data:
         return None
@@ -205,26 +323,34 @@ def get_video_json_from_graphql(post_id):
     return format_graphql_json(media_data, post_id)
 
 
-def get_video_info(post_id: str) -> Dict[str, Any]:
+def get_video_info(post_id: str, timeout: float = REQUEST_TIMEOUT) -> Dict[str, Any]:
+    unavailable = None
     try:
-        video_info = get_video_json_from_html(post_id)
+        video_info = get_video_json_from_html(post_id, timeout)
         if video_info:
             return video_info
+    except (outbound.BreakerOpen, outbound.RateLimited) as error:
+        unavailable = error
     except Exception:
         pass
 
     try:
-        video_info = get_video_json_from_graphql(post_id)
+        video_info = get_video_json_from_graphql(post_id, timeout)
         if video_info:
             return video_info
+    except (outbound.BreakerOpen, outbound.RateLimited) as error:
+        unavailable = error
     except Exception:
         pass
 
+    # Instagram not answering says nothing about whether the post is public
+    if unavailable is not None:
+        raise unavailable
     raise ValueError("Video link for this post is not public or accessible.")
 
 
-def get_post_page_html(post_id):
-    url = f"https://www.instagram.com/p/{post_id}/"
+def get_post_page_html(post_id, timeout=REQUEST_TIMEOUT):
+    url = f"{instagram_settings.base_url}/p/{post_id}/"
     headers = {
         "accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
         "accept-language": "en-US,en;q=0.5",
@@ -236,15 +362,15 @@ def get_post_page_html(post_id):
         "upgrade-insecure-requests": "1",
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:109.0) Gecko/20100101 Firefox/117.0",
     }
-    response = requests.get(url, headers=headers)
+    response = outbound.instagram.call(requests.get, url, headers=headers, timeout=timeout)
     if not response.ok:
         raise ValueError(f"Failed to fetch Instagram page: {response.status_code}")
     return response.text
 
 
-def get_post_graphql_data(post_id):
+def get_post_graphql_data(post_id, timeout=REQUEST_TIMEOUT):
     encoded_data = encode_graphql_request_data(post_id)
-    url = "https://www.instagram.com/api/graphql"
+    url = f"{instagram_settings.base_url}/api/graphql"
     headers = {
         "Accept": "*/*",
         "Accept-Language": "en-US,en;q=0.5",
@@ -259,7 +385,7 @@ def get_post_graphql_data(post_id):
         "Sec-Fetch-Site": "same-origin",
         "User-Agent": "Mozilla/5.0 (Linux; Android 11; SAMSUNG SM-G973U) AppleWebKit/537.36 (KHTML, like Gecko) SamsungBrowser/14.2 Chrome/87.0.4280.141 Mobile Safari/537.36",
     }
-    response = requests.post(url, data=encoded_data, headers=headers)
+    response = outbound.instagram.call(requests.post, url, data=encoded_data, headers=headers, timeout=timeout)
     if not response.ok:
         raise ValueError(f"GraphQL request failed: {response.status_code}")
     return response.json()
\ No newline at end of file
@@ -1,8 +1,10 @@
-from typing import List
+from typing import List, AsyncIterator
 import logging
-from modules.llm_clients.client import get_llm_client
+from modules.llm_clients.client import get_llm_client, stream_llm_client
+from core.deadline import Deadline
 logger = logging.getLogger(__name__)
-async def generate_responce(data: List[dict]) -> str:
+
+def build_responce_prompt(data: List[dict]) -> str:
     formatted_data = "\n".join([f"Claim: {item['claim']}\nVerfication Result: {item['verfication_result']}" for item in data])
     prompt = f"""You are a video authenticity analyst. After thoroughly examining a video's content and fact-checking its claims, provide your final assessment.
 
@@ -21,6 +23,27 @@ INSTRUCTIONS:
 - Keep your entire response between 1000 and 1500 characters including spaces
 
 Respond now:"""
-    
+    return prompt
+
+async def generate_responce(data: List[dict]) -> str:
+    prompt = build_responce_prompt(data)
     raw_response = await get_llm_client(prompt)
-    return raw_response
\ No newline at end of file
+    return raw_response
+
+async def stream_responce(data: List[dict], deadline: Deadline = None) -> AsyncIterator[str]:
+    """Stream the final assessment as it is generated."""
+    prompt = build_responce_prompt(data)
+    async for token in stream_llm_client(prompt, deadline=deadline):
+        yield token
+
+def fallback_responce(data: List[dict], reason: str = "in time") -> str:
+    """Compose the assessment from the verification results alone, without the LLM.
+
+    Used when the time budget is too low to generate the verdict, or the LLM
+    did not produce one.
+    """
+    lines = [f"The full assessment could not be generated {reason}. Verification results per claim:"]
+    for item in data:
+        result = item['verfication_result'] or "Not verified"
+        lines.append(f"- {item['claim']}: {result.strip()}")
+    return "\n".join(lines)
\ No newline at end of file
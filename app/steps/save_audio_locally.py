@@ -1,18 +1,28 @@
+import asyncio
 import os
-from audio_extract import extract_audio
 import subprocess
 import requests
 from pathlib import Path
 import logging
+import time
+from typing import List, Optional
+from core.media_store import ROOT_DIR, VIDEO_DIR, AUDIO_DIR, add_audio, audio_path as stored_audio_path, audio_url, temp_path, touch_audio
+from core.metrics import DOWNLOAD_BYTES
+from core.concurrency import http_pool
 
 logger = logging.getLogger(__name__)
 
-ROOT_DIR = Path.cwd() / "reels"
-VIDEO_DIR = ROOT_DIR / "video"
-AUDIO_DIR = ROOT_DIR / "audio"
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
+}
+# Bytes read per chunk while downloading
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+# Audio saved by an earlier check: converted from the mp4, or the DASH audio track as served
+AUDIO_EXTENSIONS = (".mp3", ".m4a")
 
-for d in [ROOT_DIR, VIDEO_DIR, AUDIO_DIR]:
-    d.mkdir(parents=True, exist_ok=True)
+def ensure_media_dirs():
+    for d in [ROOT_DIR, VIDEO_DIR, AUDIO_DIR]:
+        d.mkdir(parents=True, exist_ok=True)
 
 def check_ffmpeg_installation() -> bool:
     try:
@@ -26,87 +36,164 @@ def check_ffmpeg_installation() -> bool:
     except (subprocess.CalledProcessError, FileNotFoundError):
         return False
 
-def save_audio_locally(url: str, filename: str):
+async def save_audio_locally(url: str, filename: str, timeout: float = 30, audio_urls: Optional[List[str]] = None):
+    """Save a reel's audio in the media store.
+
+    When the link step found an audio-only DASH representation, only its
+    segments are downloaded, on the event loop, and kept as they are.
+    Otherwise the whole mp4 is downloaded and its audio extracted in a
+    worker thread. Both hold an http_pool slot. downloaded_bytes in the
+    result is what was transferred, and source says which way it was fetched.
+    """
     try:
         if not url or not filename:
             return {"success": False}
+        ensure_media_dirs()
 
         # Check if audio already exists
         video_name = os.path.splitext(filename)[0]
-        audio_path = AUDIO_DIR / f"{video_name}.mp3"
-        
-        if audio_path.exists():
-            logger.info("Audio already exists, skipping download and processing")
-            audio_filename = f"{video_name}.mp3"
-            audio_url = f"/reels/audio/{audio_filename}"
-            return {
-                "success": True,
-                "audio": audio_url
-            }
-
-        logger.info("Downloading video")
-        video_path = download_reel(url, filename)
-        if video_path:
-            logger.info("Video downloaded")
-        else:
-            logger.error("Failed to download video")
-            
-        if not video_path:
-            return {"success": False}
+        for extension in AUDIO_EXTENSIONS:
+            if stored_audio_path(f"{video_name}{extension}").exists():
+                logger.info("Audio already exists, skipping download and processing")
+                touch_audio(f"{video_name}{extension}")
+                return {
+                    "success": True,
+                    "audio": audio_url(f"{video_name}{extension}"),
+                    "source": "local",
+                    "downloaded_bytes": 0,
+                }
 
-        logger.info("Converting video to audio")
-        audio_path = video_to_audio(video_path)
+        if audio_urls:
+            audio_path = stored_audio_path(f"{video_name}.m4a")
+            try:
+                logger.info(f"Downloading audio track ({len(audio_urls)} segments)")
+                async with http_pool.acquire():
+                    downloaded = await download_audio_segments(audio_urls, audio_path, timeout)
+                DOWNLOAD_BYTES.labels(source="dash_audio").inc(downloaded)
+                add_audio(audio_path.name)
+                return {
+                    "success": True,
+                    "audio": audio_url(audio_path.name),
+                    "source": "dash_audio",
+                    "downloaded_bytes": downloaded,
+                }
+            except Exception as e:
+                logger.warning(f"Failed to download audio track, downloading the video instead: {e}")
+
+        return await http_pool.run_in_thread(save_video_audio, url, filename, timeout)
+    except Exception as e:
+        logger.error(f"Error in save_audio_locally: {e}")
+        return {"success": False}
+
+def save_video_audio(url: str, filename: str, timeout: float = 30) -> dict:
+    """Download the whole mp4 and keep only its audio; blocking."""
+    logger.info("Downloading video")
+    video_path = download_reel(url, filename, timeout)
+    if video_path:
+        logger.info("Video downloaded")
+    else:
+        logger.error("Failed to download video")
         
-        # Delete the video file after extracting audio
+    if not video_path:
+        return {"success": False}
+    downloaded = os.path.getsize(video_path)
+    DOWNLOAD_BYTES.labels(source="mp4").inc(downloaded)
+
+    logger.info("Converting video to audio")
+    try:
+        audio_path = video_to_audio(video_path, f"{os.path.splitext(filename)[0]}.mp3")
+    finally:
+        # Delete the video file after extracting audio, whether or not that worked
         try:
             if os.path.exists(video_path):
                 os.remove(video_path)
                 logger.info("Video file deleted after audio extraction")
         except Exception as e:
             logger.warning(f"Failed to delete video file: {e}")
-        
-        if not audio_path:
-            return {"success": False}
-        
-        audio_filename = os.path.basename(audio_path)
-        audio_url = f"/reels/audio/{audio_filename}"
-
-        return {
-            "success": True,
-            "audio": audio_url
-        }
-    except Exception as e:
-        logger.error(f"Error in save_audio_locally: {e}")
+    
+    if not audio_path:
         return {"success": False}
+    add_audio(os.path.basename(audio_path))
+
+    return {
+        "success": True,
+        "audio": audio_url(os.path.basename(audio_path)),
+        "source": "mp4",
+        "downloaded_bytes": downloaded,
+    }
+
+async def download_audio_segments(urls: List[str], file_path: Path, timeout: float = 30) -> int:
+    """Fetch the segments concurrently and write them to file_path in order; returns the bytes downloaded."""
+    import httpx
+
+    async def fetch(client: httpx.AsyncClient, url: str) -> bytes:
+        data = bytearray()
+        async with client.stream("GET", url) as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                data.extend(chunk)
+        return bytes(data)
+
+    async with httpx.AsyncClient(headers=HEADERS, timeout=timeout, follow_redirects=True) as client:
+        # The httpx timeout only bounds each read, so the whole transfer gets its own limit
+        segments = await asyncio.wait_for(asyncio.gather(*(fetch(client, url) for url in urls)), timeout)
+
+    await asyncio.to_thread(write_segments, segments, file_path)
+    return sum(len(segment) for segment in segments)
+
+def write_segments(segments: List[bytes], file_path: Path):
+    partial_path = temp_path(file_path)
+    try:
+        with open(partial_path, "wb") as writer:
+            for segment in segments:
+                writer.write(segment)
+        # Renamed only when complete, so a failed download never looks like saved audio
+        os.replace(partial_path, file_path)
+    finally:
+        partial_path.unlink(missing_ok=True)
+
+def download_reel(url: str, filename: str, timeout: float = 30) -> str:
+    """Download the reel, giving up if the whole transfer takes longer than timeout seconds.
 
-def download_reel(url: str, filename: str) -> str:
+    The video is saved under a unique temporary name, so concurrent downloads
+    of the same reel never write to one file.
+    """
+    file_path = temp_path(VIDEO_DIR / filename)
     try:
-        file_path = VIDEO_DIR / filename
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
-        }
-        response = requests.get(url, stream=True, timeout=30, headers=headers)
+        started = time.monotonic()
+        response = requests.get(url, stream=True, timeout=timeout, headers=HEADERS)
         response.raise_for_status()
         with open(file_path, 'wb') as writer:
-            for chunk in response.iter_content(chunk_size=8192):
+            for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
                 if chunk:
                     writer.write(chunk)
+                # The requests timeout only bounds each read, so a slow trickle needs its own check
+                if time.monotonic() - started > timeout:
+                    raise TimeoutError(f"Download took longer than {timeout:.0f}s")
         return str(file_path)
     except Exception as e:
         logger.error(f"Error downloading reel: {e}")
+        if os.path.exists(file_path):
+            os.remove(file_path)
         return None
 
-def video_to_audio(video_path: str) -> str:
+def video_to_audio(video_path: str, audio_filename: Optional[str] = None) -> str:
+    partial_path = None
     try:
-        video_filename = os.path.basename(video_path)
-        video_name = os.path.splitext(video_filename)[0]
-        audio_path = AUDIO_DIR / f"{video_name}.mp3"
+        if not audio_filename:
+            audio_filename = os.path.splitext(os.path.basename(video_path))[0] + ".mp3"
+        audio_path = stored_audio_path(audio_filename)
         if audio_path.exists():
             return str(audio_path)
         if not os.path.exists(video_path):
             return None
-        extract_audio(input_path=video_path, output_path=str(audio_path))
+        from audio_extract import extract_audio
+        partial_path = temp_path(audio_path)
+        extract_audio(input_path=video_path, output_path=str(partial_path))
+        os.replace(partial_path, audio_path)
         return str(audio_path)
     except Exception as e:
         logger.error(f"Error converting video to audio: {e}")
+        if partial_path is not None:
+            partial_path.unlink(missing_ok=True)
         return None
@@ -0,0 +1,32 @@
+import logging
+from modules.model_server.audio import SAMPLE_RATE, load_audio, active_ratio
+from modules.model_server.models import no_speech_probability
+from app.steps.get_audio_transcription import local_audio_path
+from core.config import speech_settings
+
+logger = logging.getLogger(__name__)
+
+def detect_speech(audio_path: str) -> dict:
+    """Decide cheaply whether a reel has speech worth transcribing.
+
+    Near-silent audio is rejected on its level alone. Otherwise Whisper
+    listens to the first SPEECH_PROBE_SECONDS and reports how likely it is
+    that nobody speaks, which catches music-only reels.
+    """
+    audio = load_audio(local_audio_path(audio_path))
+    result = {
+        "speech": True,
+        "reason": None,
+        "duration": round(len(audio) / SAMPLE_RATE, 2),
+        "active_ratio": round(active_ratio(audio, speech_settings.silence_db), 4),
+        "no_speech_prob": None,
+    }
+    if result["active_ratio"] < speech_settings.min_active_ratio:
+        result.update(speech=False, reason="silent")
+    else:
+        probability = no_speech_probability(audio[:int(speech_settings.probe_seconds * SAMPLE_RATE)])
+        result["no_speech_prob"] = round(probability, 4)
+        if probability >= speech_settings.no_speech_threshold:
+            result.update(speech=False, reason="no_speech")
+    logger.info(f"Speech detection: {result}")
+    return result
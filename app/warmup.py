@@ -0,0 +1,69 @@
+"""Background warmup and readiness state for the API server.
+
+Heavy dependencies (torch through Whisper and sentence-transformers, sklearn,
+audio-extract) are imported where they are first used, so importing main.py
+is fast and the server starts listening straight away. This task then loads
+them ahead of the first check, and /readyz reports when it is done.
+"""
+import asyncio
+import logging
+import time
+from core.config import model_settings
+from modules.model_server.models import get_embedding_model, get_whisper_model, request
+from modules.wed_data_extractor.lexical_index import load_corpus
+
+logger = logging.getLogger(__name__)
+
+# Seconds between attempts to reach a model server that is not up yet
+MODEL_SERVER_RETRY = 2
+
+state = {"status": "starting", "error": None, "started_at": time.time(), "ready_at": None}
+
+
+def import_dependencies():
+    import sklearn.feature_extraction.text  # noqa: F401
+    import audio_extract  # noqa: F401
+    import ddgs  # noqa: F401
+
+
+def load_models():
+    if model_settings.server_socket:
+        request({"op": "ping"})
+    else:
+        get_embedding_model()
+        get_whisper_model()
+
+
+async def warmup():
+    if not model_settings.warmup:
+        mark_ready()
+        return
+    try:
+        await asyncio.to_thread(import_dependencies)
+        while True:
+            try:
+                await asyncio.to_thread(load_models)
+                break
+            except OSError as e:
+                if not model_settings.server_socket:
+                    raise
+                logger.info(f"Waiting for the model server: {e}")
+                await asyncio.sleep(MODEL_SERVER_RETRY)
+        # The local corpus is indexed in every process, model server or not
+        await asyncio.to_thread(load_corpus)
+    except Exception as e:
+        state["status"] = "failed"
+        state["error"] = str(e)
+        logger.error(f"Warmup failed: {e}")
+        return
+    mark_ready()
+
+
+def mark_ready():
+    state["status"] = "ready"
+    state["ready_at"] = time.time()
+    logger.info(f"Server ready after {state['ready_at'] - state['started_at']:.1f}s")
+
+
+def is_ready() -> bool:
+    return state["status"] == "ready"
@@ -0,0 +1,28 @@
+import argparse
+import asyncio
+import json
+import sys
+
+from app.batch import run_batch
+
+
+async def main(urls, workers, deadline):
+    async for result in run_batch(urls, workers, deadline):
+        print(json.dumps(result), flush=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check many reels and print NDJSON results as they complete")
+    parser.add_argument("file", nargs="?", help="file with one reel URL per line (default: stdin)")
+    parser.add_argument("--workers", type=int, default=None, help="reels checked concurrently, at most BATCH_WORKERS")
+    parser.add_argument("--deadline", type=float, default=None, help="time budget in seconds for each reel")
+    args = parser.parse_args()
+
+    try:
+        source = open(args.file) if args.file else sys.stdin
+        with source:
+            urls = [line.strip() for line in source if line.strip()]
+        asyncio.run(main(urls, args.workers, args.deadline))
+    except KeyboardInterrupt:
+        print("\nBatch stopped by user", file=sys.stderr)
+        sys.exit(0)
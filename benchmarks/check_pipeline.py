@@ -0,0 +1,338 @@
+"""Offline, repeatable benchmark of check_authenticity and its stages.
+
+Everything the pipeline normally reaches over the network is replaced by a
+local stand-in, so results depend only on the code and the machine:
+
+* Instagram pages, GraphQL and the reel video come from fixture_server
+* web search returns the saved results in fixtures/search.json, and the
+  pages themselves are served by fixture_server
+* the LLM is the Ollama stub from modules.llm_clients.stubs, answering with
+  fixtures/llm.json after --llm-latency seconds
+
+Whisper and MiniLM run for real. Their weights must already be in the local
+cache, because the Hugging Face hub is switched to offline mode.
+
+    python benchmarks/check_pipeline.py --iterations 5 --json results.json
+    python benchmarks/check_pipeline.py --stage transcription --iterations 10
+    python benchmarks/check_pipeline.py --compare results.json
+
+Each iteration checks every fixture reel. "cold" iterations start with an
+empty cache; "warm" ones reuse the cached link, download and transcription.
+The generated tone has no speech in it. When Whisper returns nothing for it,
+the fixture transcript is used from the claims stage on. Pass --audio with a
+real recording to time Whisper on speech.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Dict, List
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from benchmarks.fixture_server import FIXTURES_DIR, FixtureServer, build_media, install_stand_ins, reel_ids  # noqa: E402
+
+STAGE_NAMES = ["link", "download", "speech", "transcription", "claims", "web", "compress", "verify", "responce"]
+
+
+def percentile(values: List[float], p: float):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))], 4)
+
+
+def git_revision() -> str:
+    try:
+        revision = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT_DIR, capture_output=True, text=True).stdout.strip()
+        return revision + ("-dirty" if dirty else "")
+    except Exception:
+        return "unknown"
+
+
+def start_llm_stub(port: int, latency: float) -> subprocess.Popen:
+    answers = json.loads((FIXTURES_DIR / "llm.json").read_text())
+    stub = subprocess.Popen(
+        [
+            sys.executable, "-m", "modules.llm_clients.stubs", "ollama",
+            "--port", str(port), "--latency", str(latency), "--jitter", "0",
+            "--response", answers["response"], "--json-response", json.dumps(answers["claims"]),
+        ],
+        cwd=ROOT_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    import httpx
+    started = time.monotonic()
+    while time.monotonic() - started < 30:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/api/tags", timeout=1).raise_for_status()
+            return stub
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    stub.terminate()
+    raise RuntimeError("LLM stub did not start")
+
+
+def configure(fixture_url: str, llm_port: int, work_dir: Path, audio: str = None):
+    """Point the app at the stand-ins; must run before any app module is imported."""
+    os.environ.update({
+        # The generated tone is not speech, so detection would end every check early
+        "SPEECH_DETECTION": "true" if audio else "false",
+        "INSTAGRAM_BASE_URL": fixture_url,
+        "OLLAMA_API_BASE": f"http://127.0.0.1:{llm_port}",
+        "LLM_PROVIDER": "ollama",
+        "STORE_PATH": str(work_dir / "db" / "cache.db"),
+        "MODEL_SERVER_SOCKET": "",
+        # The stand-ins are local, so outbound rate limits would only skew the timings
+        "OUTBOUND_INSTAGRAM_RATE": "0",
+        "OUTBOUND_PAGE_RATE": "0",
+        "HF_HUB_OFFLINE": "1",
+        "TRANSFORMERS_OFFLINE": "1",
+    })
+    # Reels are saved under the working directory
+    os.chdir(work_dir)
+
+
+def reset_caches():
+    from core import store, media_store
+    from app.steps.save_audio_locally import AUDIO_DIR, VIDEO_DIR
+    store.clear_cache()
+    media_store.remove_all_audio()
+    # Whatever is left are partial downloads and files the store never recorded
+    for directory in (AUDIO_DIR, VIDEO_DIR):
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+async def run_checks(urls: List[str], iterations: int, warmup: int, concurrency: int, cold: bool) -> dict:
+    from app.flow import check_authenticity
+    from app.batch import EventCollector
+    from core.metrics import StageTimings
+    from core.deadline import Deadline
+
+    records = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(url: str):
+        async with semaphore:
+            collector = EventCollector()
+            timings = StageTimings()
+            # A generous budget so the deadline never changes what is measured
+            await check_authenticity(collector, url, timings=timings, deadline=Deadline(3600))
+            return {"url": url, "status": collector.result(url)["status"], "timings": timings.as_dict()}
+
+    measured_seconds = 0.0
+    for iteration in range(warmup + iterations):
+        if cold or iteration == 0:
+            reset_caches()
+        started = time.perf_counter()
+        results = await asyncio.gather(*(one(url) for url in urls))
+        if iteration >= warmup:
+            measured_seconds += time.perf_counter() - started
+            records.extend(results)
+    return summarise(records, measured_seconds)
+
+
+def summarise(records: List[dict], seconds: float) -> dict:
+    durations: Dict[str, List[float]] = defaultdict(list)
+    cache: Dict[str, Counter] = defaultdict(Counter)
+    downloaded: Dict[str, List[int]] = defaultdict(list)
+    for record in records:
+        for stage in record["timings"]["stages"]:
+            durations[stage["stage"]].append(stage["duration"])
+            if stage["cache"]:
+                cache[stage["stage"]][stage["cache"]] += 1
+            if stage.get("downloaded") is not None:
+                downloaded[stage["stage"]].append(stage["downloaded"])
+
+    completed = [r for r in records if r["status"] == "completed"]
+    totals = [r["timings"]["total"] for r in records]
+    return {
+        "checks": len(records),
+        "completed": len(completed),
+        "seconds": round(seconds, 3),
+        "throughput": round(len(completed) / seconds, 4) if seconds else 0.0,
+        "total": {"p50": percentile(totals, 50), "p95": percentile(totals, 95)},
+        "stages": {
+            name: {
+                "count": len(values),
+                "p50": percentile(values, 50),
+                "p95": percentile(values, 95),
+                "cache_hit_rate": round(cache[name]["hit"] / sum(cache[name].values()), 4) if cache[name] else None,
+                **({"downloaded_bytes": round(sum(downloaded[name]) / len(downloaded[name]))} if downloaded[name] else {}),
+            }
+            for name, values in durations.items()
+        },
+    }
+
+
+async def prepare_inputs(url: str) -> dict:
+    """Run the pipeline once by hand so any single stage can be repeated on real inputs."""
+    from app.steps.get_url_from_link import get_link_from_url
+    from app.steps.save_audio_locally import save_audio_locally
+    from app.steps.claims_extractor import extract_claims
+    from app.flow import audio_to_text
+    from modules.wed_data_extractor.pipeline import get_wed_data
+    from modules.wed_data_extractor.evidence_compressor import compress_evidence
+
+    link = get_link_from_url(url)
+    audio = (await save_audio_locally(link["videoUrl"], link["filename"], audio_urls=link.get("audioUrls")))["audio"]
+    transcription = audio_to_text(audio)
+    claim = (await extract_claims(transcription))[0]["claim"]
+    content = await get_wed_data(claim)
+    evidence = await compress_evidence(claim, content.get("results", []), query_embedding=content.pop("query_embedding", None))
+    return {
+        "url": url, "link": link, "audio": audio, "transcription": transcription, "claim": claim,
+        "content": content, "evidence": [f"{item['text']} (source: {item['url']})" for item in evidence],
+    }
+
+
+async def run_stage(name: str, inputs: dict):
+    from app.steps.get_url_from_link import get_link_from_url
+    from app.steps.save_audio_locally import save_audio_locally
+    from core import media_store
+    from app.steps.claims_extractor import extract_claims
+    from app.steps.claim_verifier import verify_claim
+    from app.steps.responce_generator import stream_responce
+    from app.flow import audio_to_text
+    from app.steps.speech_detector import detect_speech
+    from modules.wed_data_extractor.pipeline import get_wed_data
+    from modules.wed_data_extractor.evidence_compressor import compress_evidence
+
+    if name == "link":
+        return get_link_from_url(inputs["url"])
+    if name == "download":
+        # Measure a fresh download, forgetting the saved audio the way eviction does
+        media_store.remove_audio(media_store.audio_name(inputs["audio"]))
+        return await save_audio_locally(inputs["link"]["videoUrl"], inputs["link"]["filename"], audio_urls=inputs["link"].get("audioUrls"))
+    if name == "speech":
+        return detect_speech(inputs["audio"])
+    if name == "transcription":
+        return audio_to_text(inputs["audio"])
+    if name == "claims":
+        return await extract_claims(inputs["transcription"])
+    if name == "web":
+        return await get_wed_data(inputs["claim"])
+    if name == "compress":
+        return await compress_evidence(inputs["claim"], inputs["content"].get("results", []))
+    if name == "verify":
+        return await verify_claim(inputs["claim"], inputs["evidence"])
+    if name == "responce":
+        return "".join([token async for token in stream_responce([{"claim": inputs["claim"], "verfication_result": "INCORRECT"}])])
+    raise ValueError(f"Unknown stage: {name}")
+
+
+async def benchmark_stage(name: str, url: str, iterations: int, warmup: int) -> dict:
+    inputs = await prepare_inputs(url)
+    durations = []
+    for iteration in range(warmup + iterations):
+        started = time.perf_counter()
+        await run_stage(name, inputs)
+        if iteration >= warmup:
+            durations.append(time.perf_counter() - started)
+    seconds = sum(durations)
+    return {
+        "runs": len(durations),
+        "seconds": round(seconds, 3),
+        "throughput": round(len(durations) / seconds, 4) if seconds else 0.0,
+        "p50": percentile(durations, 50),
+        "p95": percentile(durations, 95),
+    }
+
+
+def print_comparison(baseline: dict, current: dict):
+    print(f"{'run':<6} {'stage':<14} {'p50 before':>11} {'p50 after':>10} {'change':>8}")
+    if "stage" in current:
+        # Single-stage reports are compared on their own
+        current = {"runs": {"stage": {"total": current["stage"], "stages": {}}}}
+        baseline = {"runs": {"stage": {"total": baseline.get("stage", {}), "stages": {}}}}
+    for mode, run in current.get("runs", {}).items():
+        before_run = baseline.get("runs", {}).get(mode, {})
+        rows = [("total", before_run.get("total", {}), run["total"])]
+        rows += [(name, before_run.get("stages", {}).get(name, {}), stats) for name, stats in run["stages"].items()]
+        for name, before, after in rows:
+            if before.get("p50") and after.get("p50") is not None:
+                change = f"{(after['p50'] - before['p50']) / before['p50'] * 100:+.1f}%"
+            else:
+                change = "-"
+            print(f"{mode:<6} {name:<14} {str(before.get('p50')):>11} {str(after.get('p50')):>10} {change:>8}")
+            if "downloaded_bytes" in after:
+                print(f"{mode:<6} {name + ' bytes':<14} {str(before.get('downloaded_bytes')):>11} {str(after['downloaded_bytes']):>10}")
+
+
+async def main(args) -> dict:
+    urls = [f"https://www.instagram.com/reel/{reel_id}/" for reel_id in reel_ids()]
+    report = {
+        "meta": {
+            "revision": git_revision(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "iterations": args.iterations,
+            "warmup": args.warmup,
+            "concurrency": args.concurrency,
+            "llm_latency": args.llm_latency,
+            "search_latency": args.search_latency,
+            "audio": args.audio or "generated tone",
+            "reels": len(urls),
+        },
+    }
+    if args.stage:
+        report["meta"]["stage"] = args.stage
+        report["stage"] = await benchmark_stage(args.stage, urls[0], args.iterations, args.warmup)
+    else:
+        report["runs"] = {
+            "cold": await run_checks(urls, args.iterations, args.warmup, args.concurrency, cold=True),
+            "warm": await run_checks(urls, args.iterations, args.warmup, args.concurrency, cold=False),
+        }
+    # ru_maxrss is in KiB on Linux
+    report["peak_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the check pipeline offline against recorded fixtures")
+    parser.add_argument("--iterations", type=int, default=5, help="measured iterations, each checking every fixture reel")
+    parser.add_argument("--warmup", type=int, default=1, help="unmeasured iterations first, e.g. for model loading")
+    parser.add_argument("--concurrency", type=int, default=1, help="reels checked at the same time")
+    parser.add_argument("--stage", choices=STAGE_NAMES, help="benchmark one stage on its own instead of whole checks")
+    parser.add_argument("--audio", help="recording to use as the reels' audio (default: generated tone)")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="seconds the LLM stub takes per answer")
+    parser.add_argument("--search-latency", type=float, default=0.0, help="seconds the saved search takes per query")
+    parser.add_argument("--llm-port", type=int, default=11499)
+    parser.add_argument("--json", help="write the report to this file")
+    parser.add_argument("--compare", help="earlier report to compare the stage medians with")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        work_dir = Path(tmp)
+        fixtures = FixtureServer(build_media(work_dir / "media", args.audio)).start()
+        stub = start_llm_stub(args.llm_port, args.llm_latency)
+        try:
+            configure(fixtures.base_url, args.llm_port, work_dir, args.audio)
+            install_stand_ins(fixtures.base_url, args.search_latency)
+            report = asyncio.run(main(args))
+        finally:
+            os.chdir(ROOT_DIR)
+            stub.terminate()
+            stub.wait()
+            fixtures.stop()
+
+    output = json.dumps(report, indent=2)
+    if args.json:
+        with open(args.json, "w") as f:
+            f.write(output)
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(json.load(f), report)
+    else:
+        print(output)
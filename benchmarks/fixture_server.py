@@ -0,0 +1,194 @@
+"""Local stand-in for Instagram, the reel CDN and the web pages the pipeline reads.
+
+The recorded fixtures in benchmarks/fixtures are served over HTTP so the real
+request code runs unchanged, only pointed at 127.0.0.1:
+
+    /p/<id>/        saved post page (fixtures/instagram/<id>.html)
+    /api/graphql    saved GraphQL reply (fixtures/instagram/<id>.graphql.json)
+    /media/<file>   reel video and its audio-only DASH track, built by build_media()
+    /pages/<name>   saved article (fixtures/pages/<name>.html)
+
+`{base_url}` inside a fixture is replaced with the server's address. With
+any_reel=True, reel ids without a fixture of their own are served as copies
+of TEMPLATE_REEL, so load tests can use as many distinct reels as they like.
+"""
+import json
+import math
+import time
+import shutil
+import struct
+import subprocess
+import threading
+import urllib.parse
+import wave
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import List, Optional
+
+FIXTURES_DIR = Path(__file__).resolve().parent / "fixtures"
+SAMPLE_RATE = 16000
+TEMPLATE_REEL = "DEMOHTML01"
+
+
+def reel_ids() -> List[str]:
+    """Every reel with a saved post page."""
+    return sorted(path.stem for path in (FIXTURES_DIR / "instagram").glob("*.html"))
+
+
+def search_results(base_url: str, query: str) -> List[str]:
+    """Saved search results: the fixture pages whose keyword occurs in the query."""
+    index = json.loads((FIXTURES_DIR / "search.json").read_text())
+    names = [name for keyword, pages in index.items() if keyword in query.lower() for name in pages]
+    if not names:
+        names = sorted(path.stem for path in (FIXTURES_DIR / "pages").glob("*.html"))
+    return [f"{base_url}/pages/{name}" for name in dict.fromkeys(names)]
+
+
+def write_tone(path: Path, seconds: float):
+    """A deterministic warbling tone standing in for reel audio when no recording is given."""
+    with wave.open(str(path), "wb") as writer:
+        writer.setnchannels(1)
+        writer.setsampwidth(2)
+        writer.setframerate(SAMPLE_RATE)
+        frames = bytearray()
+        for i in range(int(seconds * SAMPLE_RATE)):
+            t = i / SAMPLE_RATE
+            frequency = 220 + 80 * math.sin(2 * math.pi * 0.5 * t)
+            envelope = 0.5 + 0.5 * math.sin(2 * math.pi * 3 * t)
+            frames += struct.pack("<h", int(12000 * envelope * math.sin(2 * math.pi * frequency * t)))
+        writer.writeframes(bytes(frames))
+
+
+def ffmpeg_executable() -> str:
+    # audio-extract depends on imageio-ffmpeg, which ships a static ffmpeg binary
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except Exception:
+        executable = shutil.which("ffmpeg")
+        if not executable:
+            raise RuntimeError("ffmpeg is required to build the fixture reels")
+        return executable
+
+
+def build_media(media_dir: Path, audio: Optional[str] = None, seconds: float = 12) -> Path:
+    """Create reel_<id>.mp4 and reel_<id>_audio.m4a for every fixture reel from a recording, or from a generated tone.
+
+    The mp4 carries a 720x1280 test pattern at about the bitrate of a real
+    reel, so downloading it costs what the video of a reel would.
+    """
+    media_dir.mkdir(parents=True, exist_ok=True)
+    source = Path(audio) if audio else media_dir / "tone.wav"
+    if not audio:
+        write_tone(source, seconds)
+    video = media_dir / "video.mp4"
+    track = media_dir / "audio.m4a"
+    subprocess.run(
+        [
+            ffmpeg_executable(), "-y", "-loglevel", "error", "-i", str(source), "-f", "lavfi", "-i", "testsrc2=size=720x1280:rate=30",
+            "-c:v", "libx264", "-preset", "ultrafast", "-b:v", "1000k", "-c:a", "aac", "-b:a", "128k", "-shortest", str(video),
+        ],
+        check=True,
+    )
+    subprocess.run([ffmpeg_executable(), "-y", "-loglevel", "error", "-i", str(source), "-vn", "-c:a", "aac", "-b:a", "64k", str(track)], check=True)
+    for reel_id in reel_ids():
+        shutil.copyfile(video, media_dir / f"reel_{reel_id}.mp4")
+        shutil.copyfile(track, media_dir / f"reel_{reel_id}_audio.m4a")
+    return media_dir
+
+
+def install_stand_ins(base_url: str, search_latency: float = 0.0):
+    """Replace web search with the saved results and give the silent tone a transcript.
+
+    ddgs has no endpoint that could be pointed at the fixture server, so the
+    search is swapped out inside the process running the pipeline.
+    """
+    from app import flow
+    from modules.wed_data_extractor import pipeline
+
+    def saved_search(search_config, timeout=None):
+        time.sleep(search_latency)
+        return search_results(base_url, search_config.get("query", ""))
+
+    transcript = json.loads((FIXTURES_DIR / "llm.json").read_text())["transcription"]
+    audio_to_text = flow.audio_to_text
+
+    def audio_to_text_or_fixture(audio_path, on_segment=None):
+        text = audio_to_text(audio_path, on_segment)
+        return text if text and text.strip() else transcript
+
+    pipeline.get_search_results = saved_search
+    flow.audio_to_text = audio_to_text_or_fixture
+
+
+class FixtureServer:
+    def __init__(self, media_dir: Path, any_reel: bool = False):
+        self.media_dir = media_dir
+        self.any_reel = any_reel
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), self.handler())
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def start(self) -> "FixtureServer":
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def render(self, path: Path) -> Optional[bytes]:
+        if not path.is_file():
+            return None
+        return path.read_text().replace("{base_url}", self.base_url).encode()
+
+    def reel_page(self, reel_id: str) -> Optional[bytes]:
+        body = self.render(FIXTURES_DIR / "instagram" / f"{reel_id}.html")
+        if body is None and self.any_reel:
+            body = self.render(FIXTURES_DIR / "instagram" / f"{TEMPLATE_REEL}.html").replace(TEMPLATE_REEL.encode(), reel_id.encode())
+        return body
+
+    def media(self, name: str) -> Optional[bytes]:
+        path = self.media_dir / name
+        if not path.is_file() and self.any_reel:
+            path = self.media_dir / (f"reel_{TEMPLATE_REEL}_audio.m4a" if name.endswith("_audio.m4a") else f"reel_{TEMPLATE_REEL}.mp4")
+        return path.read_bytes() if path.is_file() else None
+
+    def handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def reply(self, body: Optional[bytes], content_type: str):
+                if body is None:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                parts = [part for part in urllib.parse.urlparse(self.path).path.split("/") if part]
+                if len(parts) == 2 and parts[0] == "p":
+                    self.reply(server.reel_page(parts[1]), "text/html")
+                elif len(parts) == 2 and parts[0] == "pages":
+                    self.reply(server.render(FIXTURES_DIR / "pages" / f"{parts[1]}.html"), "text/html")
+                elif len(parts) == 2 and parts[0] == "media":
+                    self.reply(server.media(parts[1]), "video/mp4")
+                else:
+                    self.send_error(404)
+
+            def do_POST(self):
+                if urllib.parse.urlparse(self.path).path != "/api/graphql":
+                    self.send_error(404)
+                    return
+                form = urllib.parse.parse_qs(self.rfile.read(int(self.headers.get("Content-Length", 0))).decode())
+                shortcode = json.loads(form.get("variables", ["{}"])[0]).get("shortcode", "")
+                body = server.render(FIXTURES_DIR / "instagram" / f"{shortcode}.graphql.json")
+                self.reply(body or json.dumps({"data": {"xdt_shortcode_media": None}}).encode(), "application/json")
+
+        return Handler
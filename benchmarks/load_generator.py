@@ -0,0 +1,374 @@
+"""Simulate many extension clients checking reels over /api/checkAuthenticityWS.
+
+The server runs in production mode against local stand-ins (fixture_server
+for Instagram, the reel video, search results and article pages, and the
+Ollama stub for the LLM), so the only thing being measured is this code on
+this machine:
+
+    python benchmarks/load_generator.py --rates 0.5 1 2 4 8 --duration 60 --workers 2
+
+For every offered rate (new checks per second) clients arrive as a Poisson
+process for --duration seconds. Each client opens its own websocket, sends a
+reel URL and waits for `completed`. URLs are drawn from --reels distinct
+reels with Zipf(--zipf) popularity, so popular reels hit the cache or join a
+check already running for them while the long tail misses. --zipf 0 makes
+every reel equally likely.
+
+Per rate it records time to the first event and to `completed`, how many
+checks were rejected (admission control), failed or timed out, and the CPU,
+memory and queue depth of the server while the rate was offered. The table
+is the saturation curve: the rate at which throughput stops following the
+offered rate and latency climbs is the capacity of the configuration.
+Throughput counts completions until the last client of a rate has finished,
+so --duration should be well above the time one check takes.
+
+The cache is kept from one rate to the next (rates run in the order given)
+unless --restart starts every rate on a fresh server with an empty cache.
+Server resource use is read from /proc, so it is only reported on Linux.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from bisect import bisect_left
+from itertools import accumulate
+from pathlib import Path
+from typing import List, Optional
+import httpx
+import websockets
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from benchmarks.fixture_server import FixtureServer, build_media  # noqa: E402
+from benchmarks.check_pipeline import percentile, start_llm_stub  # noqa: E402
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+class ZipfUrls:
+    """Reel URLs whose popularity follows a Zipf distribution: rank k is drawn with weight 1/k^s."""
+
+    def __init__(self, count: int, exponent: float, rng: random.Random):
+        self.urls = [f"https://www.instagram.com/reel/LOAD{rank:06d}/" for rank in range(1, count + 1)]
+        self.cumulative = list(accumulate(1 / rank ** exponent for rank in range(1, count + 1)))
+        self.rng = rng
+
+    def draw(self) -> str:
+        return self.urls[bisect_left(self.cumulative, self.rng.random() * self.cumulative[-1])]
+
+
+def process_tree(pid: int) -> List[int]:
+    """pid and all of its descendants (uvicorn's workers, the model server)."""
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # The command name may contain spaces, the fields after it do not
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    tree, pending = [], [pid]
+    while pending:
+        current = pending.pop()
+        tree.append(current)
+        pending.extend(children.get(current, []))
+    return tree
+
+
+def tree_usage(pid: int) -> Optional[dict]:
+    """CPU seconds and resident memory of a process tree, or None without /proc."""
+    if not os.path.isdir("/proc"):
+        return None
+    cpu = rss = 0
+    for member in process_tree(pid):
+        try:
+            with open(f"/proc/{member}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            with open(f"/proc/{member}/statm") as f:
+                rss += int(f.read().split()[1]) * PAGE_SIZE
+        except (OSError, IndexError, ValueError):
+            continue
+        # utime and stime, the 14th and 15th fields of stat
+        cpu += (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+    return {"cpu": cpu, "rss": rss}
+
+
+class ResourceSampler:
+    """Samples server CPU, memory and queue depth while a rate is being offered."""
+
+    def __init__(self, pid: int, base_url: str, interval: float = 1.0):
+        self.pid = pid
+        self.base_url = base_url
+        self.interval = interval
+        self.samples: List[dict] = []
+
+    async def run(self):
+        async with httpx.AsyncClient(timeout=2) as client:
+            previous = tree_usage(self.pid)
+            previous_at = time.monotonic()
+            while True:
+                await asyncio.sleep(self.interval)
+                sample = {}
+                usage = tree_usage(self.pid)
+                now = time.monotonic()
+                if usage and previous:
+                    # Percent of one core, like top
+                    sample["cpu_percent"] = 100 * (usage["cpu"] - previous["cpu"]) / (now - previous_at)
+                    sample["rss_mb"] = usage["rss"] / 2 ** 20
+                previous, previous_at = usage, now
+                try:
+                    sample["queue_depth"] = (await client.get(f"{self.base_url}/api/jobs")).json()["queue_depth_all_processes"]
+                except (httpx.HTTPError, KeyError, ValueError):
+                    pass
+                self.samples.append(sample)
+
+    def summary(self) -> dict:
+        def values(key):
+            return [sample[key] for sample in self.samples if key in sample]
+
+        cpu, rss, queue = values("cpu_percent"), values("rss_mb"), values("queue_depth")
+        return {
+            "cpu_percent_avg": round(sum(cpu) / len(cpu), 1) if cpu else None,
+            "cpu_percent_peak": round(max(cpu), 1) if cpu else None,
+            "rss_mb_peak": round(max(rss), 1) if rss else None,
+            "queue_depth_peak": max(queue) if queue else None,
+        }
+
+
+async def follow_check(ws_url: str, url: str, result: dict, started: float):
+    async with websockets.connect(ws_url, max_size=None) as websocket:
+        await websocket.send(url)
+        async for message in websocket:
+            if result["first_event"] is None:
+                result["first_event"] = time.monotonic() - started
+            event = json.loads(message)
+            if event.get("step") == "completed":
+                result["status"] = "completed"
+                result["completed"] = time.monotonic() - started
+                return
+            if event.get("step") == "error":
+                result["status"] = "rejected" if "retry_after" in event else "failed"
+                return
+
+
+async def client(ws_url: str, url: str, timeout: float) -> dict:
+    """One extension client: connect, send the URL and follow the events until the check ends."""
+    started = time.monotonic()
+    result = {"url": url, "status": "failed", "first_event": None, "completed": None}
+    try:
+        await asyncio.wait_for(follow_check(ws_url, url, result, started), timeout)
+    except asyncio.TimeoutError:
+        result["status"] = "timeout"
+    except Exception:
+        result["status"] = "failed"
+    return result
+
+
+async def offer_rate(ws_url: str, urls: ZipfUrls, rate: float, duration: float, timeout: float,
+                     max_clients: int, rng: random.Random) -> List[dict]:
+    """Start clients as a Poisson process at `rate` per second and wait for all of them to finish."""
+    tasks, dropped = [], 0
+    open_clients = asyncio.Semaphore(max_clients)
+
+    async def limited(url: str):
+        try:
+            return await client(ws_url, url, timeout)
+        finally:
+            open_clients.release()
+
+    started = time.monotonic()
+    next_arrival = started + rng.expovariate(rate)
+    while next_arrival < started + duration:
+        await asyncio.sleep(max(0.0, next_arrival - time.monotonic()))
+        if open_clients.locked():
+            # Past the connection limit the client gives up instead of slowing the arrivals down
+            dropped += 1
+        else:
+            await open_clients.acquire()
+            tasks.append(asyncio.create_task(limited(urls.draw())))
+        next_arrival += rng.expovariate(rate)
+    results = await asyncio.gather(*tasks)
+    return results + [{"status": "dropped", "first_event": None, "completed": None}] * dropped
+
+
+def summarise(rate: float, results: List[dict], elapsed: float) -> dict:
+    first_events = [r["first_event"] for r in results if r["first_event"] is not None]
+    completions = [r["completed"] for r in results if r["status"] == "completed"]
+    counts = {status: sum(r["status"] == status for r in results) for status in ("completed", "rejected", "failed", "timeout", "dropped")}
+    return {
+        "offered_rate": rate,
+        "arrivals": len(results),
+        **counts,
+        "error_rate": round(1 - counts["completed"] / len(results), 4) if results else None,
+        # Completions over the arrival window plus the drain afterwards
+        "throughput": round(counts["completed"] / elapsed, 4) if elapsed else 0.0,
+        "first_event_p50": percentile(first_events, 50),
+        "first_event_p95": percentile(first_events, 95),
+        "completed_p50": percentile(completions, 50),
+        "completed_p95": percentile(completions, 95),
+        "completed_p99": percentile(completions, 99),
+        "distinct_reels": len({r["url"] for r in results if "url" in r}),
+    }
+
+
+def start_server(args, work_dir: Path, fixture_url: str) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "FIXTURE_BASE_URL": fixture_url,
+        "SEARCH_LATENCY": str(args.search_latency),
+        "INSTAGRAM_BASE_URL": fixture_url,
+        "OLLAMA_API_BASE": f"http://127.0.0.1:{args.llm_port}",
+        "LLM_PROVIDER": "ollama",
+        "STORE_PATH": str(work_dir / "db" / "cache.db"),
+        "PROMETHEUS_MULTIPROC_DIR": str(work_dir / "db" / "metrics"),
+        "HF_HUB_OFFLINE": "1",
+        "TRANSFORMERS_OFFLINE": "1",
+        # The stand-ins are local, so outbound rate limits would only skew the measurements
+        "OUTBOUND_INSTAGRAM_RATE": "0",
+        "OUTBOUND_PAGE_RATE": "0",
+        # The generated tone is not speech, so detection would end every check early
+        "SPEECH_DETECTION": "true" if args.audio else "false",
+    }
+    command = [
+        sys.executable, str(ROOT_DIR / "run.py"), "--prod", "--app", "benchmarks.offline_app:app",
+        "--workers", str(args.workers), "--host", "127.0.0.1", "--port", str(args.port),
+    ]
+    if args.model_server:
+        command += ["--model-server", "--model-socket", str(work_dir / "models.sock")]
+    # Started from the work directory so downloaded reels stay out of the repository
+    return subprocess.Popen(command, cwd=work_dir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+async def wait_until_ready(base_url: str, server: subprocess.Popen, timeout: float):
+    started = time.monotonic()
+    async with httpx.AsyncClient(timeout=2) as http:
+        while time.monotonic() - started < timeout:
+            if server.poll() is not None:
+                raise RuntimeError("Server exited during startup")
+            try:
+                if (await http.get(f"{base_url}/readyz")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.5)
+    raise RuntimeError(f"Server at {base_url} did not become ready within {timeout:.0f}s")
+
+
+def stop_server(server: subprocess.Popen):
+    server.terminate()
+    try:
+        server.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        server.kill()
+        server.wait()
+
+
+def print_curve(rows: List[dict]):
+    print(
+        f"{'rate/s':>7} {'arrived':>7} {'done':>5} {'err%':>6} {'checks/s':>9} {'first p50':>9} "
+        f"{'done p50':>9} {'done p95':>9} {'cpu%':>6} {'rss MB':>7} {'queue':>6}"
+    )
+    for row in rows:
+        error_rate = f"{row['error_rate'] * 100:.1f}" if row["error_rate"] is not None else "-"
+        print(
+            f"{row['offered_rate']:>7} {row['arrivals']:>7} {row['completed']:>5} {error_rate:>6} {row['throughput']:>9.3f} "
+            f"{str(row['first_event_p50']):>9} {str(row['completed_p50']):>9} {str(row['completed_p95']):>9} "
+            f"{str(row['cpu_percent_avg']):>6} {str(row['rss_mb_peak']):>7} {str(row['queue_depth_peak']):>6}"
+        )
+    # Throughput lags the offered rate whenever the drain is long compared with
+    # --duration, so the knee is found from errors and latency instead
+    baseline_p95 = rows[0]["completed_p95"] if rows else None
+    saturated = next((
+        row for row in rows
+        if (row["error_rate"] or 0) > 0.05
+        or (baseline_p95 and row["completed_p95"] and row["completed_p95"] > 2 * baseline_p95)
+    ), None)
+    if saturated:
+        print(f"Saturated at {saturated['offered_rate']} checks/s (over 5% errors or p95 more than double the first rate's)")
+    else:
+        print("Not saturated at the rates offered")
+
+
+async def run(args, work_dir: Path, fixture_url: str) -> List[dict]:
+    base_url = f"http://127.0.0.1:{args.port}"
+    ws_url = f"ws://127.0.0.1:{args.port}/api/checkAuthenticityWS"
+    rng = random.Random(args.seed)
+    urls = ZipfUrls(args.reels, args.zipf, rng)
+
+    rows = []
+    server = None
+    try:
+        for index, rate in enumerate(args.rates):
+            if server is None or args.restart:
+                if server is not None:
+                    stop_server(server)
+                run_dir = work_dir / f"run{index}"
+                run_dir.mkdir()
+                server = start_server(args, run_dir, fixture_url)
+                await wait_until_ready(base_url, server, args.startup_timeout)
+
+            sampler = ResourceSampler(server.pid, base_url)
+            sampling = asyncio.create_task(sampler.run())
+            started = time.monotonic()
+            try:
+                results = await offer_rate(ws_url, urls, rate, args.duration, args.timeout, args.max_clients, rng)
+            finally:
+                sampling.cancel()
+            row = {**summarise(rate, results, time.monotonic() - started), **sampler.summary()}
+            rows.append(row)
+            print(json.dumps(row), file=sys.stderr, flush=True)
+    finally:
+        if server is not None:
+            stop_server(server)
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offer increasing check rates to the server over websockets and report the saturation curve")
+    parser.add_argument("--rates", type=float, nargs="+", default=[0.5, 1, 2, 4], help="new checks per second to offer, in order")
+    parser.add_argument("--duration", type=float, default=60, help="seconds each rate is offered")
+    parser.add_argument("--reels", type=int, default=200, help="distinct reels the URLs are drawn from")
+    parser.add_argument("--zipf", type=float, default=1.1, help="Zipf exponent of reel popularity (0 for uniform)")
+    parser.add_argument("--max-clients", type=int, default=500, help="open connections at most; further arrivals are dropped")
+    parser.add_argument("--timeout", type=float, default=300, help="seconds a client waits for its check")
+    parser.add_argument("--workers", type=int, default=2, help="server processes")
+    parser.add_argument("--model-server", action="store_true", help="serve the models from one shared process")
+    parser.add_argument("--restart", action="store_true", help="start every rate on a fresh server with an empty cache")
+    parser.add_argument("--audio", help="recording to use as the reels' audio (default: generated tone)")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="seconds the LLM stub takes per answer")
+    parser.add_argument("--search-latency", type=float, default=0.5, help="seconds the saved search takes per query")
+    parser.add_argument("--seed", type=int, default=1, help="seed for arrivals and URL choice")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--llm-port", type=int, default=11499)
+    parser.add_argument("--startup-timeout", type=float, default=300, help="seconds to wait for the models to load")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        work_dir = Path(tmp)
+        fixtures = FixtureServer(build_media(work_dir / "media", args.audio), any_reel=True).start()
+        stub = start_llm_stub(args.llm_port, args.llm_latency)
+        try:
+            rows = asyncio.run(run(args, work_dir, fixtures.base_url))
+        except KeyboardInterrupt:
+            print("\nLoad generator stopped by user", file=sys.stderr)
+            sys.exit(0)
+        finally:
+            stub.terminate()
+            stub.wait()
+            fixtures.stop()
+
+    print_curve(rows)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "rows": rows}, f, indent=2)
@@ -0,0 +1,162 @@
+"""Measure check throughput of the production server at different worker counts.
+
+For each worker count the server is started with `run.py --prod --workers N`,
+the URLs are checked over /api/checkAuthenticityWS by `--concurrency`
+simultaneous clients, and the server is stopped again:
+
+    python benchmarks/load_test.py urls.txt --workers 1 2 4 --requests 40 --concurrency 8
+
+Every run starts from the same cache state: an empty store, or a copy of
+`--store` (e.g. a db/cache.db with the reels already transcribed, to measure
+the claim and verification stages only). Point the LLM at the stubs from
+modules.llm_clients.stubs to take provider latency out of the picture.
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+import httpx
+import websockets
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+
+async def wait_until_ready(base_url: str, timeout: float):
+    started = time.monotonic()
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() - started < timeout:
+            try:
+                response = await client.get(f"{base_url}/api/jobs", timeout=2)
+                if response.status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.5)
+    raise RuntimeError(f"Server at {base_url} did not become ready within {timeout:.0f}s")
+
+
+async def check(ws_url: str, url: str) -> dict:
+    """Run one check over the websocket and report its outcome and latency."""
+    started = time.monotonic()
+    status = "failed"
+    try:
+        async with websockets.connect(ws_url, max_size=None) as websocket:
+            await websocket.send(url)
+            async for message in websocket:
+                event = json.loads(message)
+                if event.get("step") == "completed":
+                    status = "completed"
+                    break
+                if event.get("step") == "error" and "retry_after" in event:
+                    status = "rejected"
+                    break
+    except Exception:
+        status = "failed"
+    return {"url": url, "status": status, "latency": time.monotonic() - started}
+
+
+async def run_load(port: int, urls: list, requests: int, concurrency: int) -> dict:
+    ws_url = f"ws://127.0.0.1:{port}/api/checkAuthenticityWS"
+    pending = [urls[i % len(urls)] for i in range(requests)]
+    results = []
+
+    async def client():
+        while pending:
+            results.append(await check(ws_url, pending.pop(0)))
+
+    started = time.monotonic()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.monotonic() - started
+
+    latencies = sorted(r["latency"] for r in results if r["status"] == "completed")
+    completed = len(latencies)
+    return {
+        "requests": requests,
+        "completed": completed,
+        "rejected": sum(r["status"] == "rejected" for r in results),
+        "failed": sum(r["status"] == "failed" for r in results),
+        "seconds": round(elapsed, 2),
+        "throughput": round(completed / elapsed, 4) if elapsed else 0.0,
+        "p50": round(statistics.median(latencies), 2) if latencies else None,
+        "p95": round(latencies[min(completed - 1, int(0.95 * completed))], 2) if latencies else None,
+    }
+
+
+def start_server(workers: int, port: int, store_path: str) -> subprocess.Popen:
+    env = {**os.environ, "STORE_PATH": store_path, "PROMETHEUS_MULTIPROC_DIR": os.path.join(os.path.dirname(store_path), "metrics")}
+    return subprocess.Popen(
+        [sys.executable, "run.py", "--prod", "--workers", str(workers), "--port", str(port)],
+        cwd=ROOT_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+def stop_server(server: subprocess.Popen):
+    server.terminate()
+    try:
+        server.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        server.kill()
+        server.wait()
+
+
+async def main(args):
+    with open(args.file) as f:
+        urls = [line.strip() for line in f if line.strip()]
+    if not urls:
+        sys.exit("No URLs to check")
+
+    rows = []
+    for workers in args.workers:
+        with tempfile.TemporaryDirectory() as run_dir:
+            store_path = os.path.join(run_dir, "cache.db")
+            if args.store:
+                shutil.copy(args.store, store_path)
+            server = start_server(workers, args.port, store_path)
+            try:
+                await wait_until_ready(f"http://127.0.0.1:{args.port}", args.startup_timeout)
+                row = {"workers": workers, **await run_load(args.port, urls, args.requests, args.concurrency)}
+            finally:
+                stop_server(server)
+        rows.append(row)
+        print(json.dumps(row), file=sys.stderr, flush=True)
+
+    baseline = rows[0]["throughput"] or None
+    print(f"{'workers':>7} {'done':>5} {'rej':>4} {'fail':>4} {'checks/s':>9} {'speedup':>8} {'p50 s':>7} {'p95 s':>7}")
+    for row in rows:
+        speedup = f"{row['throughput'] / baseline:.2f}x" if baseline else "-"
+        print(
+            f"{row['workers']:>7} {row['completed']:>5} {row['rejected']:>4} {row['failed']:>4} "
+            f"{row['throughput']:>9.3f} {speedup:>8} {str(row['p50']):>7} {str(row['p95']):>7}"
+        )
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the production server at several worker counts")
+    parser.add_argument("file", help="file with one reel URL per line, reused round-robin")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="worker counts to compare")
+    parser.add_argument("--requests", type=int, default=40, help="checks per run")
+    parser.add_argument("--concurrency", type=int, default=8, help="simultaneous websocket clients")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--store", help="cache database every run starts from (default: empty)")
+    parser.add_argument("--startup-timeout", type=float, default=120, help="seconds to wait for the models to load")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(main(args))
+    except KeyboardInterrupt:
+        print("\nLoad test stopped by user", file=sys.stderr)
+        sys.exit(0)
@@ -0,0 +1,13 @@
+"""The API server with web search and transcription swapped for the benchmark stand-ins.
+
+Served by benchmarks/load_generator.py through `run.py --app benchmarks.offline_app:app`,
+so every worker process installs the stand-ins before handling checks. The
+fixture server address comes from FIXTURE_BASE_URL; INSTAGRAM_BASE_URL and
+OLLAMA_API_BASE must point at the fixture server and LLM stub as well.
+"""
+import os
+from benchmarks.fixture_server import install_stand_ins
+
+install_stand_ins(os.environ["FIXTURE_BASE_URL"], float(os.getenv("SEARCH_LATENCY", "0")))
+
+from main import app  # noqa: E402,F401
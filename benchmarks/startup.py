@@ -0,0 +1,140 @@
+"""Measure how long the API server takes to import, start listening and become ready.
+
+    python benchmarks/startup.py                      # current tree
+    python benchmarks/startup.py --compare HEAD~1     # also measure another revision
+
+For every tree it reports:
+
+* import: median wall time of `import main` minus a bare interpreter start
+* listening: time from launching uvicorn until it answers HTTP
+* ready: time until /readyz returns 200 (trees without /readyz are ready once listening)
+* the slowest top-level imports from `python -X importtime`
+
+Other revisions are checked out into a temporary git worktree.
+"""
+import argparse
+import json
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+import httpx
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+
+def wall_time(command: list, cwd: Path) -> float:
+    started = time.perf_counter()
+    subprocess.run(command, cwd=cwd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - started
+
+
+def import_seconds(cwd: Path, runs: int) -> float:
+    baseline = statistics.median(wall_time([sys.executable, "-c", "pass"], cwd) for _ in range(runs))
+    with_main = statistics.median(wall_time([sys.executable, "-c", "import main"], cwd) for _ in range(runs))
+    return max(0.0, with_main - baseline)
+
+
+def slowest_imports(cwd: Path, top: int) -> list:
+    """Cumulative import time of the packages imported directly or one level below main."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=cwd, capture_output=True, text=True, check=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # importtime indents nested imports by two spaces per level
+        depth = (len(name) - len(name.lstrip())) // 2
+        if depth <= 2:
+            rows.append({"module": name.strip(), "seconds": round(int(cumulative) / 1e6, 3)})
+    return sorted(rows, key=lambda row: -row["seconds"])[:top]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def server_startup(cwd: Path, timeout: float) -> dict:
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port)],
+        cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    listening = ready = None
+    try:
+        with httpx.Client(timeout=2) as client:
+            while time.perf_counter() - started < timeout:
+                try:
+                    response = client.get(f"{base_url}/readyz")
+                except httpx.HTTPError:
+                    time.sleep(0.05)
+                    continue
+                if listening is None:
+                    listening = time.perf_counter() - started
+                # Older trees have no /readyz and load everything before listening
+                if response.status_code in (200, 404):
+                    ready = time.perf_counter() - started
+                    break
+                if response.json().get("status") == "failed":
+                    break
+                time.sleep(0.1)
+    finally:
+        server.terminate()
+        server.wait()
+    return {
+        "listening": round(listening, 3) if listening is not None else None,
+        "ready": round(ready, 3) if ready is not None else None,
+    }
+
+
+def measure(cwd: Path, label: str, args) -> dict:
+    return {
+        "tree": label,
+        "import": round(import_seconds(cwd, args.runs), 3),
+        **server_startup(cwd, args.timeout),
+        "slowest_imports": slowest_imports(cwd, args.top),
+    }
+
+
+def measure_revision(ref: str, args) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        worktree = Path(tmp) / "tree"
+        subprocess.run(["git", "worktree", "add", "--detach", str(worktree), ref], cwd=ROOT_DIR, check=True, capture_output=True)
+        try:
+            return measure(worktree, ref, args)
+        finally:
+            subprocess.run(["git", "worktree", "remove", "--force", str(worktree)], cwd=ROOT_DIR, check=True, capture_output=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure API server import and startup time")
+    parser.add_argument("--compare", metavar="REF", help="also measure this git revision")
+    parser.add_argument("--runs", type=int, default=5, help="repetitions of the import measurement")
+    parser.add_argument("--timeout", type=float, default=300, help="seconds to wait for the server to become ready")
+    parser.add_argument("--top", type=int, default=8, help="slowest imports to list")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    results = []
+    if args.compare:
+        results.append(measure_revision(args.compare, args))
+    results.append(measure(ROOT_DIR, "working tree", args))
+
+    for result in results:
+        ready = f"{result['ready']}s" if result["ready"] is not None else "never (see /readyz)"
+        print(f"{result['tree']}: import {result['import']}s, listening {result['listening']}s, ready {ready}")
+        for row in result["slowest_imports"]:
+            print(f"    {row['seconds']:>7.3f}s  {row['module']}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
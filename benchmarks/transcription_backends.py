@@ -0,0 +1,162 @@
+"""Compare the transcription backends on a set of recordings.
+
+    python benchmarks/transcription_backends.py clips/ --json backends.json
+    python benchmarks/transcription_backends.py clips/ --backends ctranslate2 --concurrency 1 4 8
+
+clips/ holds audio files (anything ffmpeg reads) and, for the word error
+rate, a reference transcript next to each one with the same name and a .txt
+extension. References are English, because Whisper is asked to translate.
+
+Every backend runs in its own process, so the peak memory reported is that
+backend's alone. For each concurrency level, that many clips are transcribed
+at once the way a check does it (in chunks cut at pauses, see audio_to_text),
+which is what lets the ctranslate2 backend batch chunks of different clips.
+For every backend and level it reports:
+
+* rtf: wall time divided by the audio duration transcribed (lower is faster)
+* wer: word error rate against the references, after lowercasing and
+  removing punctuation
+* peak_rss_mb: the process's peak resident memory, model included
+* chunks_per_batch: how many chunks the decoder took at a time
+"""
+import argparse
+import json
+import os
+import re
+import resource
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+AUDIO_EXTENSIONS = {".wav", ".mp3", ".m4a", ".mp4", ".ogg", ".flac", ".webm"}
+
+
+def words(text: str) -> List[str]:
+    return re.sub(r"[^\w\s']", " ", text.lower()).split()
+
+
+def edit_distance(reference: List[str], hypothesis: List[str]) -> int:
+    previous = list(range(len(hypothesis) + 1))
+    for i, word in enumerate(reference, 1):
+        current = [i]
+        for j, other in enumerate(hypothesis, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (word != other)))
+        previous = current
+    return previous[-1]
+
+
+def find_clips(directory: Path) -> List[dict]:
+    clips = []
+    for path in sorted(directory.iterdir()):
+        if path.suffix.lower() not in AUDIO_EXTENSIONS:
+            continue
+        reference = path.with_suffix(".txt")
+        clips.append({"path": str(path), "reference": reference.read_text() if reference.exists() else None})
+    return clips
+
+
+def peak_rss_mb() -> float:
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def run_backend(clips: List[dict], levels: List[int]) -> dict:
+    """Runs inside the child process, with WHISPER_BACKEND already set."""
+    from app.steps.get_audio_transcription import audio_to_text
+    from modules.model_server.audio import SAMPLE_RATE, load_audio
+    from modules.model_server.models import get_whisper_model, decode_stats
+
+    base_rss = peak_rss_mb()
+    started = time.perf_counter()
+    get_whisper_model()
+    load_seconds = time.perf_counter() - started
+    durations = {clip["path"]: len(load_audio(clip["path"])) / SAMPLE_RATE for clip in clips}
+    audio_seconds = sum(durations.values())
+
+    runs = []
+    for concurrency in levels:
+        before = decode_stats()
+        started = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            texts = list(pool.map(lambda clip: audio_to_text(clip["path"]), clips))
+        wall = time.perf_counter() - started
+
+        errors = reference_words = 0
+        for clip, text in zip(clips, texts):
+            if clip["reference"] is not None:
+                reference = words(clip["reference"])
+                errors += edit_distance(reference, words(text))
+                reference_words += len(reference)
+        after = decode_stats()
+        batches = after.get("batches", 0) - before.get("batches", 0)
+        chunks = after.get("chunks", 0) - before.get("chunks", 0)
+        runs.append({
+            "concurrency": concurrency,
+            "wall": round(wall, 3),
+            "rtf": round(wall / audio_seconds, 4) if audio_seconds else None,
+            "wer": round(errors / reference_words, 4) if reference_words else None,
+            "chunks_per_batch": round(chunks / batches, 2) if batches else None,
+            "texts": {os.path.basename(clip["path"]): text for clip, text in zip(clips, texts)},
+        })
+    return {
+        "load_seconds": round(load_seconds, 3),
+        "audio_seconds": round(audio_seconds, 2),
+        "base_rss_mb": base_rss,
+        "peak_rss_mb": peak_rss_mb(),
+        "runs": runs,
+    }
+
+
+def measure(backend: str, args) -> dict:
+    env = {**os.environ, "WHISPER_BACKEND": backend, "MODEL_SERVER_SOCKET": ""}
+    if args.model:
+        env["WHISPER_MODEL"] = args.model
+    command = [sys.executable, __file__, args.clips, "--child", "--concurrency", *map(str, args.concurrency)]
+    result = subprocess.run(command, cwd=ROOT_DIR, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        return {"backend": backend, "error": result.stderr.strip().splitlines()[-1] if result.stderr.strip() else f"exit {result.returncode}"}
+    return {"backend": backend, **json.loads(result.stdout.strip().splitlines()[-1])}
+
+
+def print_results(results: List[dict]):
+    print(f"{'backend':<12} {'conc':>4} {'rtf':>8} {'wer':>7} {'batch':>6} {'peak MB':>8} {'load s':>7}")
+    for result in results:
+        if "error" in result:
+            print(f"{result['backend']:<12} failed: {result['error']}")
+            continue
+        for run in result["runs"]:
+            wer = f"{run['wer']:.3f}" if run["wer"] is not None else "n/a"
+            batch = f"{run['chunks_per_batch']:.1f}" if run["chunks_per_batch"] is not None else "-"
+            print(
+                f"{result['backend']:<12} {run['concurrency']:>4} {run['rtf']:>8.4f} {wer:>7} {batch:>6} "
+                f"{result['peak_rss_mb']:>8.0f} {result['load_seconds']:>7.1f}"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare real-time factor, memory and word error rate of the transcription backends")
+    parser.add_argument("clips", help="directory of audio files with .txt reference transcripts")
+    parser.add_argument("--backends", nargs="+", default=["whisper", "ctranslate2"])
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 4], help="clips transcribed at once")
+    parser.add_argument("--model", help="Whisper model size (default: WHISPER_MODEL)")
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    clips = find_clips(Path(args.clips))
+    if not clips:
+        sys.exit(f"No audio files in {args.clips}")
+    if args.child:
+        print(json.dumps(run_backend(clips, args.concurrency)))
+        sys.exit(0)
+
+    results = [measure(backend, args) for backend in args.backends]
+    print_results(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
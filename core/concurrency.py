@@ -0,0 +1,91 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from core.config import concurrency_settings, metrics_settings, model_settings, transcription_settings
+from core.deadline import Deadline
+from core.metrics import RESOURCE_IN_USE, RESOURCE_WAITING, RESOURCE_WAIT
+
+
+class ResourcePool:
+    """Named concurrency limit around a scarce resource (Whisper, LLM, embedding, outbound HTTP).
+
+    Callers beyond the limit wait their turn instead of oversubscribing the
+    CPU, so each running call keeps its normal speed under load.
+    """
+
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = limit
+        self.semaphore = asyncio.Semaphore(limit)
+        self.active = 0
+        self.waiting = 0
+        self._update_gauges()
+
+    def _update_gauges(self):
+        # Set explicitly rather than with set_function so multiprocess mode can aggregate them
+        RESOURCE_IN_USE.labels(pool=self.name).set(self.active)
+        RESOURCE_WAITING.labels(pool=self.name).set(self.waiting)
+
+    async def _acquire(self):
+        start = time.perf_counter()
+        self.waiting += 1
+        self._update_gauges()
+        try:
+            await self.semaphore.acquire()
+        finally:
+            self.waiting -= 1
+            self._update_gauges()
+        if metrics_settings.enabled:
+            RESOURCE_WAIT.labels(pool=self.name).observe(time.perf_counter() - start)
+        self.active += 1
+        self._update_gauges()
+
+    def _release(self):
+        self.active -= 1
+        self.semaphore.release()
+        self._update_gauges()
+
+    @asynccontextmanager
+    async def acquire(self, deadline: Deadline = None):
+        """Hold a slot for the duration of the block.
+
+        With a deadline, waiting for the slot is bounded by the time left and
+        raises DeadlineExceeded when it runs out.
+        """
+        await (deadline.within(self._acquire()) if deadline else self._acquire())
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def run_in_thread(self, func, *args, **kwargs):
+        """Run a blocking call in a worker thread once a slot is free.
+
+        A thread cannot be interrupted, so if the caller is cancelled the slot
+        stays taken until the thread actually finishes; otherwise cancelled
+        work would keep burning CPU outside the limit.
+        """
+        await self._acquire()
+        future = asyncio.ensure_future(asyncio.to_thread(func, *args, **kwargs))
+        future.add_done_callback(lambda _: self._release())
+        return await asyncio.shield(future)
+
+    def stats(self) -> dict:
+        return {"limit": self.limit, "active": self.active, "waiting": self.waiting}
+
+
+whisper_pool = ResourcePool("whisper", concurrency_settings.whisper_limit)
+llm_pool = ResourcePool("llm", concurrency_settings.llm_limit)
+embedding_pool = ResourcePool("embedding", concurrency_settings.embedding_limit)
+http_pool = ResourcePool("http", concurrency_settings.http_limit)
+
+# The ctranslate2 backend decodes the chunks of concurrent transcriptions as one
+# batch and runs one batch at a time itself, in this process or in the model
+# server. Queued on the Whisper limit, every batch would hold a single chunk, so
+# chunked transcriptions get WHISPER_MAX_BATCH slots of their own instead.
+if model_settings.whisper_backend == "ctranslate2" and transcription_settings.chunk_seconds:
+    transcription_pool = ResourcePool("transcription", max(concurrency_settings.whisper_limit, model_settings.whisper_max_batch))
+else:
+    transcription_pool = whisper_pool
+
+pools = {pool.name: pool for pool in (whisper_pool, transcription_pool, llm_pool, embedding_pool, http_pool)}
@@ -4,7 +4,163 @@ import os
 load_dotenv()
 
 class LLMSettings:
-    provider: str = "ollama" # ollama or groq
-    api_key: str = os.getenv("GROQ_API_KEY") if provider == "groq" else None
+    provider: str = os.getenv("LLM_PROVIDER", "ollama") # ollama, groq or auto (latency-aware router)
+    api_key: str = os.getenv("GROQ_API_KEY")
+    ollama_base_url: str = os.getenv("OLLAMA_API_BASE", "http://localhost:11434")
+    groq_base_url: str = os.getenv("GROQ_BASE_URL", "https://api.groq.com")
+    timeout: float = float(os.getenv("LLM_TIMEOUT", "180"))
+
+    # Router settings, only used when provider is "auto"
+    router_providers: list = os.getenv("LLM_ROUTER_PROVIDERS", "ollama,groq").split(",")
+    router_window: int = int(os.getenv("LLM_ROUTER_WINDOW", "100")) # samples kept per provider
+    router_max_error_rate: float = float(os.getenv("LLM_ROUTER_MAX_ERROR_RATE", "0.5"))
+    router_cooldown: float = float(os.getenv("LLM_ROUTER_COOLDOWN", "30")) # seconds an unhealthy provider is skipped
+    attempt_timeout: float = float(os.getenv("LLM_ATTEMPT_TIMEOUT", "60")) # seconds one provider may take before the router falls back to the next
+    hedge_enabled: bool = os.getenv("LLM_HEDGE", "false").lower() == "true"
+    hedge_percentile: float = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+    hedge_min_delay: float = float(os.getenv("LLM_HEDGE_MIN_DELAY", "2")) # never hedge earlier than this
+    hedge_initial_delay: float = float(os.getenv("LLM_HEDGE_INITIAL_DELAY", "30")) # hedge delay until a provider has enough latency samples
 
 llm_settings = LLMSettings()
+
+class EvidenceSettings:
+    token_budget: int = int(os.getenv("EVIDENCE_TOKEN_BUDGET", "600")) # evidence tokens sent to verify_claim
+    chars_per_token: float = float(os.getenv("EVIDENCE_CHARS_PER_TOKEN", "4")) # rough estimate for English text
+    dedupe_threshold: float = float(os.getenv("EVIDENCE_DEDUPE_THRESHOLD", "0.9")) # cosine above which sentences are duplicates
+    min_sentence_chars: int = int(os.getenv("EVIDENCE_MIN_SENTENCE_CHARS", "25"))
+
+evidence_settings = EvidenceSettings()
+
+class MetricsSettings:
+    enabled: bool = os.getenv("METRICS_ENABLED", "true").lower() == "true" # serve /metrics and record histograms
+
+metrics_settings = MetricsSettings()
+
+class JobSettings:
+    workers: int = int(os.getenv("JOB_WORKERS", "2")) # checks processed concurrently
+    retention: float = float(os.getenv("JOB_RETENTION", "600")) # seconds a finished job's events stay replayable
+    disconnect_grace: float = float(os.getenv("JOB_DISCONNECT_GRACE", "5")) # seconds to wait for a reconnect before cancelling
+    background_limit: int = int(os.getenv("JOB_BACKGROUND_LIMIT", "2")) # cacheable stages allowed to outlive a cancelled check
+    background_timeout: float = float(os.getenv("JOB_BACKGROUND_TIMEOUT", "300")) # seconds such a stage may keep running
+
+job_settings = JobSettings()
+
+class BatchSettings:
+    workers: int = int(os.getenv("BATCH_WORKERS", "4")) # reels checked concurrently within a batch, and the most a request may ask for
+    max_urls: int = int(os.getenv("BATCH_MAX_URLS", "1000"))
+
+batch_settings = BatchSettings()
+
+class ConcurrencySettings:
+    whisper_limit: int = int(os.getenv("WHISPER_CONCURRENCY", "1")) # concurrent transcriptions
+    llm_limit: int = int(os.getenv("LLM_CONCURRENCY", "2")) # concurrent LLM calls
+    embedding_limit: int = int(os.getenv("EMBEDDING_CONCURRENCY", "2")) # concurrent MiniLM encode calls
+    http_limit: int = int(os.getenv("HTTP_CONCURRENCY", "16")) # concurrent outbound requests
+    max_queue_depth: int = int(os.getenv("MAX_QUEUE_DEPTH", "20")) # queued jobs before new ones are rejected
+
+concurrency_settings = ConcurrencySettings()
+
+class DeadlineSettings:
+    budget: float = float(os.getenv("DEADLINE_SECONDS", "120")) # end-to-end budget for one check
+    responce_reserve: float = float(os.getenv("DEADLINE_RESPONCE_RESERVE", "20")) # kept back for the final verdict
+    min_responce_time: float = float(os.getenv("DEADLINE_MIN_RESPONCE_TIME", "5")) # below this the verdict is composed without the LLM
+    seconds_per_page: float = float(os.getenv("DEADLINE_SECONDS_PER_PAGE", "5")) # budget assumed per scraped page when sizing fan-out
+
+deadline_settings = DeadlineSettings()
+
+class OutboundSettings:
+    instagram_rate: float = float(os.getenv("OUTBOUND_INSTAGRAM_RATE", "2")) # requests per second to Instagram; 0 for no limit
+    search_rate: float = float(os.getenv("OUTBOUND_SEARCH_RATE", "1")) # web searches per second; 0 for no limit
+    page_rate: float = float(os.getenv("OUTBOUND_PAGE_RATE", "5")) # requests per second to each scraped site; 0 for no limit
+    burst: int = int(os.getenv("OUTBOUND_BURST", "5")) # requests a destination may get at once after a quiet spell
+    max_wait: float = float(os.getenv("OUTBOUND_MAX_WAIT", "5")) # longest a call waits for its turn before failing
+    breaker_window: int = int(os.getenv("OUTBOUND_BREAKER_WINDOW", "20")) # recent calls the failure rate is computed over
+    breaker_min_calls: int = int(os.getenv("OUTBOUND_BREAKER_MIN_CALLS", "5")) # calls needed before a breaker can open
+    breaker_failure_rate: float = float(os.getenv("OUTBOUND_BREAKER_FAILURE_RATE", "0.5")) # share of failed calls that opens the breaker
+    breaker_cooldown: float = float(os.getenv("OUTBOUND_BREAKER_COOLDOWN", "30")) # seconds an open breaker fails fast before a trial call
+    retries: int = int(os.getenv("OUTBOUND_RETRIES", "2")) # attempts after the first for Instagram and search; pages are not retried
+    retry_budget: float = float(os.getenv("OUTBOUND_RETRY_BUDGET", "0.2")) # retries allowed as a share of a destination's recent calls
+    retry_backoff: float = float(os.getenv("OUTBOUND_RETRY_BACKOFF", "0.5")) # base seconds of the jittered exponential backoff
+    search_fallback_ttl: float = float(os.getenv("OUTBOUND_SEARCH_FALLBACK_TTL", "86400")) # seconds past search results are kept for when search fails
+    max_hosts: int = int(os.getenv("OUTBOUND_MAX_HOSTS", "1000")) # scraped sites whose breaker and rate limit are remembered
+    host_idle: float = float(os.getenv("OUTBOUND_HOST_IDLE", "600")) # seconds after which an unused site with a closed breaker is forgotten
+
+outbound_settings = OutboundSettings()
+
+class RetrievalSettings:
+    vector_weight: float = float(os.getenv("RETRIEVAL_VECTOR_WEIGHT", "0.7")) # weight of MiniLM cosine similarity in a passage's score
+    lexical_weight: float = float(os.getenv("RETRIEVAL_LEXICAL_WEIGHT", "0.3")) # weight of BM25, scaled to the best passage, in a passage's score
+    corpus_path: str = os.getenv("RETRIEVAL_CORPUS", "") # .jsonl file or directory of local reference texts searched with the fetched pages; empty for none
+    corpus_candidates: int = int(os.getenv("RETRIEVAL_CORPUS_CANDIDATES", "5")) # best BM25 matches from the corpus ranked with the fetched pages
+
+retrieval_settings = RetrievalSettings()
+
+class PageCacheSettings:
+    enabled: bool = os.getenv("PAGE_CACHE", "true").lower() == "true" # keep the text of scraped pages in the store
+    max_bytes: int = int(os.getenv("PAGE_CACHE_MAX_BYTES", str(256 * 1024 ** 2))) # compressed page text kept before the least recently used is evicted
+    default_ttl: float = float(os.getenv("PAGE_CACHE_DEFAULT_TTL", "86400")) # seconds a page without caching headers is served without revalidating
+    max_ttl: float = float(os.getenv("PAGE_CACHE_MAX_TTL", "604800")) # upper bound on the freshness a page's own headers can claim
+
+page_cache_settings = PageCacheSettings()
+
+class StoreSettings:
+    path: str = os.getenv("STORE_PATH", "db/cache.db") # SQLite file shared by all server processes
+    busy_timeout: float = float(os.getenv("STORE_BUSY_TIMEOUT", "30")) # seconds to wait for another process's write
+    lease_poll_interval: float = float(os.getenv("STORE_LEASE_POLL_INTERVAL", "1")) # how often to check on a stage another process is running
+    queue_lease_ttl: float = float(os.getenv("STORE_QUEUE_LEASE_TTL", "3600")) # upper bound on how long a queued job counts against admission
+
+store_settings = StoreSettings()
+
+class MediaSettings:
+    dir: str = os.getenv("MEDIA_DIR", "reels") # downloaded reel audio and temporary videos
+    max_bytes: int = int(os.getenv("MEDIA_MAX_BYTES", str(5 * 1024 ** 3))) # saved audio kept on disk before the least recently used is evicted; 0 keeps all
+    temp_max_age: float = float(os.getenv("MEDIA_TEMP_MAX_AGE", "3600")) # seconds before an unfinished download or unreferenced file counts as orphaned
+    eviction_grace: float = float(os.getenv("MEDIA_EVICTION_GRACE", "600")) # audio used this recently is never evicted, since a check may still be reading it
+
+media_settings = MediaSettings()
+
+class ModelSettings:
+    server_socket: str = os.getenv("MODEL_SERVER_SOCKET", "") # unix socket of a shared model server; empty loads the models in-process
+    embedding_model: str = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+    whisper_model: str = os.getenv("WHISPER_MODEL", "base")
+    whisper_backend: str = os.getenv("WHISPER_BACKEND", "whisper") # whisper (openai-whisper on PyTorch) or ctranslate2 (faster-whisper, quantized)
+    whisper_compute_type: str = os.getenv("WHISPER_COMPUTE_TYPE", "int8") # weight type of the ctranslate2 backend: int8, int8_float32, float32
+    whisper_max_batch: int = int(os.getenv("WHISPER_MAX_BATCH", "8")) # chunks from different requests decoded together by the ctranslate2 backend
+    whisper_batch_wait: float = float(os.getenv("WHISPER_BATCH_WAIT", "0.05")) # seconds to wait for more chunks to fill a batch
+    max_batch: int = int(os.getenv("MODEL_SERVER_MAX_BATCH", "64")) # texts from different requests encoded together
+    batch_wait: float = float(os.getenv("MODEL_SERVER_BATCH_WAIT", "0.01")) # seconds to wait for more requests to fill a batch
+    timeout: float = float(os.getenv("MODEL_SERVER_TIMEOUT", "600")) # seconds a worker waits for the model server
+    warmup: bool = os.getenv("MODEL_WARMUP", "true").lower() == "true" # load models in the background at startup instead of on the first check
+
+model_settings = ModelSettings()
+
+class InstagramSettings:
+    base_url: str = os.getenv("INSTAGRAM_BASE_URL", "https://www.instagram.com") # where post pages and GraphQL are fetched from
+    link_ttl: float = float(os.getenv("INSTAGRAM_LINK_TTL", "3600")) # seconds resolved media URLs without an expiry of their own are reused
+    link_refresh_margin: float = float(os.getenv("INSTAGRAM_LINK_REFRESH_MARGIN", "300")) # media URLs expiring sooner than this are resolved again before a download
+
+instagram_settings = InstagramSettings()
+
+class TranscriptionSettings:
+    chunk_seconds: float = float(os.getenv("TRANSCRIBE_CHUNK_SECONDS", "30")) # audio transcribed per step; 0 transcribes the whole file at once
+    cut_window: float = float(os.getenv("TRANSCRIBE_CUT_WINDOW", "8")) # seconds before each chunk boundary searched for a pause to cut at
+    early_claims_words: int = int(os.getenv("EARLY_CLAIMS_MIN_WORDS", "40")) # transcript words before claim extraction starts on the prefix; 0 waits for the full transcript
+
+transcription_settings = TranscriptionSettings()
+
+class SpeechSettings:
+    enabled: bool = os.getenv("SPEECH_DETECTION", "true").lower() == "true" # skip transcription and claims for reels without speech
+    silence_db: float = float(os.getenv("SPEECH_SILENCE_DB", "-45")) # frames quieter than this (dBFS) count as silent
+    min_active_ratio: float = float(os.getenv("SPEECH_MIN_ACTIVE_RATIO", "0.1")) # below this share of non-silent frames the reel has no speech
+    no_speech_threshold: float = float(os.getenv("SPEECH_NO_SPEECH_THRESHOLD", "0.6")) # Whisper no-speech probability above which the reel has no speech
+    probe_seconds: float = float(os.getenv("SPEECH_PROBE_SECONDS", "30")) # audio Whisper listens to for the no-speech probability
+
+speech_settings = SpeechSettings()
+
+class ProfileSettings:
+    slow_seconds: float = float(os.getenv("PROFILE_SLOW_SECONDS", "0")) # profile every check and keep those slower than this; 0 only profiles checks that ask for it
+    interval: float = float(os.getenv("PROFILE_INTERVAL", "0.01")) # seconds between stack samples
+    dir: str = os.getenv("PROFILE_DIR", "db/profiles")
+    keep: int = int(os.getenv("PROFILE_KEEP", "100")) # newest profiles kept on disk; 0 keeps all
+
+profile_settings = ProfileSettings()
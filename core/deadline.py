@@ -0,0 +1,49 @@
+import asyncio
+import time
+from core.config import deadline_settings
+
+# Never hand a stage less than this, even when the budget is nearly gone
+MIN_TIMEOUT = 0.5
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class Deadline:
+    """End-to-end time budget for one check, passed down through every stage.
+
+    Stages size their own timeouts and fan-out from the time remaining rather
+    than using fixed values, so a check never runs much past its budget.
+    """
+
+    def __init__(self, seconds: float = None, expires_at: float = None):
+        self.budget = seconds or deadline_settings.budget
+        self.expires_at = expires_at if expires_at is not None else time.monotonic() + self.budget
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def timeout(self, cap: float, share: float = 1.0) -> float:
+        """Timeout for one stage: a share of the time left, never more than its usual cap."""
+        return max(MIN_TIMEOUT, min(cap, self.remaining() * share))
+
+    def reserve(self, seconds: float) -> "Deadline":
+        """A deadline that expires `seconds` earlier, keeping that time back for later stages."""
+        return Deadline(self.budget, expires_at=self.expires_at - seconds)
+
+    def fan_out(self, wanted: int, seconds_each: float, minimum: int = 1) -> int:
+        """How many parallel items (e.g. pages) the remaining time can pay for."""
+        affordable = int(self.remaining() // seconds_each) if seconds_each > 0 else wanted
+        return max(minimum, min(wanted, affordable))
+
+    async def within(self, awaitable, cap: float = None):
+        """Await something within the remaining time (or cap), raising DeadlineExceeded."""
+        timeout = self.remaining() if cap is None else self.timeout(cap)
+        try:
+            return await asyncio.wait_for(awaitable, timeout)
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded(f"Timed out after {timeout:.1f}s")
@@ -0,0 +1,185 @@
+"""Size-bounded storage for downloaded reel media.
+
+Audio is saved as <MEDIA_DIR>/audio/<shard>/<name>, the shard being the first
+two hex digits of the name's MD5, so no directory holds more than a small
+share of the files. It is still referred to as /reels/audio/<name>.
+
+The size and last use of every audio file are kept in the SQLite store. Once
+the audio takes more than MEDIA_MAX_BYTES, the least recently used files are
+deleted together with the cached downloads that point at them, so a cached
+video_and_audio entry always refers to a file that exists and an evicted
+reel is simply downloaded again.
+
+Files are written under a temporary name from temp_path() and renamed into
+place when complete; videos only live in <MEDIA_DIR>/video while their audio
+is extracted. sweep(), run at startup, removes what crashed processes left
+behind and brings the bookkeeping in line with the disk.
+"""
+import hashlib
+import logging
+import os
+import time
+import uuid
+from pathlib import Path
+from core import store
+from core.config import media_settings
+from core.metrics import MEDIA_EVICTIONS
+
+logger = logging.getLogger(__name__)
+
+ROOT_DIR = Path(media_settings.dir).absolute()
+VIDEO_DIR = ROOT_DIR / "video"
+AUDIO_DIR = ROOT_DIR / "audio"
+
+AUDIO_URL_PREFIX = "/reels/audio/"
+TEMP_MARKER = ".part-"
+
+
+def shard(name: str) -> str:
+    return hashlib.md5(name.encode()).hexdigest()[:2]
+
+
+def audio_path(name: str) -> Path:
+    return AUDIO_DIR / shard(name) / name
+
+
+def audio_url(name: str) -> str:
+    return f"{AUDIO_URL_PREFIX}{name}"
+
+
+def audio_name(url: str) -> str:
+    return os.path.basename(url or "")
+
+
+def temp_path(path: Path) -> Path:
+    """A unique name beside path to write it under; the extension is kept for tools that go by it."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    return path.with_name(f"{path.stem}{TEMP_MARKER}{uuid.uuid4().hex[:8]}{path.suffix}")
+
+
+def is_temp(path: Path) -> bool:
+    return TEMP_MARKER in path.name
+
+
+def has_audio(url: str) -> bool:
+    return audio_path(audio_name(url)).is_file()
+
+
+def add_audio(name: str):
+    """Record a newly saved audio file, evicting others if that exceeds the budget."""
+    store.record_media(name, audio_path(name).stat().st_size)
+    enforce_budget(keep=name)
+
+
+def touch_audio(name: str):
+    store.touch_media(name)
+
+
+def remove_audio(name: str):
+    audio_path(name).unlink(missing_ok=True)
+    store.forget_media(name)
+    store.forget_audio(audio_url(name))
+
+
+def remove_all_audio() -> int:
+    """Remove every saved audio file along with its records."""
+    names = [name for name, _, _ in store.media_by_last_use()]
+    for name in names:
+        remove_audio(name)
+    return len(names)
+
+
+def enforce_budget(keep: str = None) -> int:
+    """Evict the least recently used audio until the total is within MEDIA_MAX_BYTES."""
+    if not media_settings.max_bytes:
+        return 0
+    usage = store.media_usage()
+    if usage <= media_settings.max_bytes:
+        return 0
+
+    recent = time.time() - media_settings.eviction_grace
+    evicted = 0
+    for name, size, accessed_at in store.media_by_last_use():
+        if usage <= media_settings.max_bytes or accessed_at > recent:
+            break
+        if name == keep:
+            continue
+        remove_audio(name)
+        usage -= size
+        evicted += 1
+    MEDIA_EVICTIONS.inc(evicted)
+    if usage > media_settings.max_bytes:
+        logger.warning(f"Saved audio takes {usage} bytes, over MEDIA_MAX_BYTES, but the rest was used in the last {media_settings.eviction_grace:.0f}s")
+    elif evicted:
+        logger.info(f"Evicted {evicted} audio files to stay within {media_settings.max_bytes} bytes")
+    return evicted
+
+
+def sweep() -> dict:
+    """Remove leftovers of crashed processes and reconcile the store with the disk.
+
+    Files younger than MEDIA_TEMP_MAX_AGE are left alone, since another
+    process may still be writing them or about to cache them.
+    """
+    counts = {"removed": 0, "migrated": 0, "registered": 0, "forgotten": 0}
+    if not store.acquire_lease("media:sweep", media_settings.temp_max_age):
+        return counts
+    try:
+        cutoff = time.time() - media_settings.temp_max_age
+
+        def remove_if_old(path: Path) -> bool:
+            if path.stat().st_mtime >= cutoff:
+                return False
+            path.unlink(missing_ok=True)
+            counts["removed"] += 1
+            return True
+
+        # Videos are only kept while their audio is extracted
+        for path in VIDEO_DIR.iterdir() if VIDEO_DIR.is_dir() else []:
+            if path.is_file():
+                remove_if_old(path)
+
+        # Audio saved before sharding lies directly in AUDIO_DIR
+        for path in AUDIO_DIR.iterdir() if AUDIO_DIR.is_dir() else []:
+            if not path.is_file():
+                continue
+            if is_temp(path):
+                remove_if_old(path)
+                continue
+            target = audio_path(path.name)
+            target.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(path, target)
+            counts["migrated"] += 1
+
+        referenced = store.cached_audio_urls()
+        tracked = {name for name, _, _ in store.media_by_last_use()}
+        on_disk = set()
+        for path in AUDIO_DIR.glob("*/*"):
+            if not path.is_file():
+                continue
+            if is_temp(path):
+                remove_if_old(path)
+                continue
+            # Audio no cached download points at is unreachable
+            if audio_url(path.name) not in referenced and remove_if_old(path):
+                continue
+            on_disk.add(path.name)
+            if path.name not in tracked:
+                stat = path.stat()
+                store.record_media(path.name, stat.st_size, stat.st_mtime)
+                counts["registered"] += 1
+
+        for name in tracked - on_disk:
+            store.forget_media(name)
+            counts["forgotten"] += 1
+        for url in referenced:
+            if url.startswith(AUDIO_URL_PREFIX) and not has_audio(url):
+                counts["forgotten"] += store.forget_audio(url)
+
+        counts["evicted"] = enforce_budget()
+        logger.info(f"Media sweep: {counts}")
+    except Exception as e:
+        logger.error(f"Media sweep failed: {e}")
+    finally:
+        store.release_lease("media:sweep")
+    return counts
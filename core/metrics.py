@@ -0,0 +1,168 @@
+import os
+import time
+from contextlib import contextmanager
+from typing import List
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, generate_latest, multiprocess
+from core.config import metrics_settings
+
+CLAIM_EXTRACTION_TOTAL = Counter(
+    "instacheck_claim_extraction_total",
+    "Claim extraction attempts by outcome (ok, repaired, failed)",
+    ["outcome"],
+)
+
+SPEECH_CHECKS_TOTAL = Counter(
+    "instacheck_speech_checks_total",
+    "Speech detection results (speech, silent, no_speech)",
+    ["outcome"],
+)
+SPEECH_SKIPPED_AUDIO = Counter(
+    "instacheck_speech_skipped_audio_seconds_total",
+    "Seconds of audio not transcribed because the reel had no speech",
+)
+
+DOWNLOAD_BYTES = Counter(
+    "instacheck_download_bytes_total",
+    "Bytes downloaded to get reels' audio, by source (dash_audio, mp4)",
+    ["source"],
+)
+
+MEDIA_EVICTIONS = Counter(
+    "instacheck_media_evictions_total",
+    "Saved reel audio files deleted to stay within MEDIA_MAX_BYTES",
+)
+
+# Rolling statistics of the LLM router (LLM_PROVIDER=auto), one series per process
+LLM_PROVIDER_LATENCY = Gauge(
+    "instacheck_llm_provider_latency_seconds",
+    "Recent latency percentiles (p50, p95) of each LLM provider",
+    ["provider", "quantile"],
+    multiprocess_mode="liveall",
+)
+LLM_PROVIDER_ERROR_RATE = Gauge(
+    "instacheck_llm_provider_error_rate",
+    "Share of recent calls to each LLM provider that failed",
+    ["provider"],
+    multiprocess_mode="liveall",
+)
+LLM_PROVIDER_HEALTHY = Gauge(
+    "instacheck_llm_provider_healthy",
+    "1 while the LLM provider is used, 0 while it is cooling down",
+    ["provider"],
+    multiprocess_mode="liveall",
+)
+
+OUTBOUND_CALLS = Counter(
+    "instacheck_outbound_calls_total",
+    "Calls to outside services by destination (instagram, search, pages) and outcome (ok, failure, retried, rejected, rate_limited)",
+    ["destination", "outcome"],
+)
+OUTBOUND_BREAKERS_OPEN = Gauge(
+    "instacheck_outbound_breakers_open",
+    "Open circuit breakers by destination; pages has one per scraped site",
+    ["destination"],
+    multiprocess_mode="livesum",
+)
+
+PAGE_CACHE_REQUESTS = Counter(
+    "instacheck_page_cache_requests_total",
+    "Scraped page lookups by outcome (hit, revalidated, miss, stale)",
+    ["outcome"],
+)
+PAGE_CACHE_EVICTIONS = Counter(
+    "instacheck_page_cache_evictions_total",
+    "Cached pages deleted to stay within PAGE_CACHE_MAX_BYTES",
+)
+
+STAGE_DURATION = Histogram(
+    "instacheck_stage_duration_seconds",
+    "Duration of each check pipeline stage",
+    ["stage", "cache"],
+    buckets=(0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300),
+)
+
+STAGE_PAYLOAD = Histogram(
+    "instacheck_stage_payload_bytes",
+    "Size of the payload produced by each check pipeline stage",
+    ["stage"],
+    buckets=(100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000, 100_000_000),
+)
+
+# Gauges are summed over live processes when several server workers share PROMETHEUS_MULTIPROC_DIR
+JOB_QUEUE_DEPTH = Gauge("instacheck_job_queue_depth", "Jobs waiting for a worker", multiprocess_mode="livesum")
+JOB_WORKERS_BUSY = Gauge("instacheck_job_workers_busy", "Workers currently running a job", multiprocess_mode="livesum")
+JOB_WORKERS_TOTAL = Gauge("instacheck_job_workers_total", "Size of the job worker pool", multiprocess_mode="livesum")
+JOBS_TOTAL = Counter("instacheck_jobs_total", "Finished jobs by final status", ["status"])
+JOBS_CANCELLED = Counter("instacheck_jobs_cancelled_total", "Jobs cancelled after their clients disconnected, by stage", ["stage"])
+BACKGROUND_STAGES = Counter(
+    "instacheck_background_stages_total",
+    "Cacheable stages of cancelled checks, by whether they were finished in the background",
+    ["stage", "outcome"],
+)
+JOBS_REJECTED = Counter("instacheck_jobs_rejected_total", "Jobs rejected because the admission queue was full")
+
+RESOURCE_IN_USE = Gauge("instacheck_resource_in_use", "Slots in use per resource pool", ["pool"], multiprocess_mode="livesum")
+RESOURCE_WAITING = Gauge("instacheck_resource_waiting", "Callers waiting per resource pool", ["pool"], multiprocess_mode="livesum")
+RESOURCE_WAIT = Histogram(
+    "instacheck_resource_wait_seconds",
+    "Time spent waiting for a resource pool slot",
+    ["pool"],
+    buckets=(0.001, 0.01, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120),
+)
+
+
+def latest_metrics() -> bytes:
+    """Exposition text for /metrics, aggregated over all processes in multiprocess mode."""
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        return generate_latest(REGISTRY)
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry)
+
+
+def mark_process_dead():
+    """Drop this process's live gauges from the multiprocess directory on shutdown."""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        multiprocess.mark_process_dead(os.getpid())
+
+
+class StageTimings:
+    """Per-request record of how long each pipeline stage took.
+
+    Usage:
+        with timings.stage("transcription") as stage:
+            ...
+            stage["cache"] = "hit"
+            stage["bytes"] = len(text)
+
+    Histograms are only updated when metrics are enabled; the per-request
+    record is always kept so it can be attached to the completed event.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: List[dict] = []
+        self.current = None
+
+    @contextmanager
+    def stage(self, name: str):
+        record = {"stage": name, "cache": None, "bytes": None}
+        # Restore the enclosing stage, if any, so nothing is reported as running after it ends
+        previous, self.current = self.current, name
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            self.current = previous
+            record["duration"] = round(time.perf_counter() - start, 4)
+            self.stages.append(record)
+            if metrics_settings.enabled:
+                STAGE_DURATION.labels(stage=name, cache=record["cache"] or "none").observe(record["duration"])
+                if record["bytes"] is not None:
+                    STAGE_PAYLOAD.labels(stage=name).observe(record["bytes"])
+
+    def total(self) -> float:
+        return round(time.perf_counter() - self.started, 4)
+
+    def as_dict(self) -> dict:
+        return {"total": self.total(), "stages": self.stages}
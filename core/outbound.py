@@ -0,0 +1,329 @@
+"""Circuit breakers, rate limits and retries for calls to outside services.
+
+Every destination (Instagram, web search, the pages that are scraped) gets:
+
+* a token bucket that spaces out requests; when the destination answers
+  429 or reports a rate limit, the rate is halved, and it creeps back up
+  with every success
+* a circuit breaker over the outcomes of its recent calls; once the failure
+  rate crosses OUTBOUND_BREAKER_FAILURE_RATE, calls fail fast with
+  BreakerOpen for OUTBOUND_BREAKER_COOLDOWN seconds instead of each waiting
+  for its own timeout, then a single trial call decides whether it closes
+* retries with jittered exponential backoff, limited by a retry budget so
+  retries stay a small share of the traffic during an outage
+
+Scraped pages get a breaker and a bucket per host, without retries: a page
+that does not load is simply left out. Hosts unused for OUTBOUND_HOST_IDLE
+seconds are forgotten unless their breaker is open, and at most
+OUTBOUND_MAX_HOSTS are kept, least recently used first to go. Breakers and
+buckets are per process.
+"""
+import asyncio
+import logging
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Callable, Optional, Tuple
+from urllib.parse import urlsplit
+from core.config import outbound_settings
+from core.metrics import OUTBOUND_CALLS, OUTBOUND_BREAKERS_OPEN
+
+logger = logging.getLogger(__name__)
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class BreakerOpen(Exception):
+    def __init__(self, destination: str, retry_after: float):
+        super().__init__(f"{destination} is failing, not retrying for {retry_after:.0f}s")
+        self.destination = destination
+        self.retry_after = retry_after
+
+
+class RateLimited(Exception):
+    """No request slot for the destination came up within OUTBOUND_MAX_WAIT."""
+
+
+class CircuitBreaker:
+    """Opens when too many of the last calls failed, and lets one trial call through after the cooldown."""
+
+    def __init__(self, name: str, on_change: Callable[[str, str], None] = None):
+        self.name = name
+        self.on_change = on_change
+        self.outcomes = deque(maxlen=outbound_settings.breaker_window)
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.trial_running = False
+        self.lock = threading.Lock()
+
+    def before_call(self):
+        with self.lock:
+            if self.state == CLOSED:
+                return
+            retry_after = self.opened_at + outbound_settings.breaker_cooldown - time.monotonic()
+            if self.state == OPEN and retry_after <= 0:
+                self._set_state(HALF_OPEN)
+            if self.state == HALF_OPEN and not self.trial_running:
+                self.trial_running = True
+                return
+        raise BreakerOpen(self.name, max(retry_after, 0))
+
+    def record(self, success: bool):
+        with self.lock:
+            if self.state == HALF_OPEN:
+                self.trial_running = False
+                if success:
+                    self.outcomes.clear()
+                    self._set_state(CLOSED)
+                else:
+                    self._open()
+                return
+            self.outcomes.append(success)
+            if (
+                self.state == CLOSED
+                and len(self.outcomes) >= outbound_settings.breaker_min_calls
+                and self.outcomes.count(False) / len(self.outcomes) >= outbound_settings.breaker_failure_rate
+            ):
+                self._open()
+
+    def release_trial(self):
+        """Give up a trial call that was not made, so the next call can be the trial."""
+        with self.lock:
+            self.trial_running = False
+
+    def _open(self):
+        self.opened_at = time.monotonic()
+        self._set_state(OPEN)
+        logger.warning(f"Circuit breaker for {self.name} opened for {outbound_settings.breaker_cooldown:.0f}s")
+
+    def _set_state(self, state: str):
+        previous, self.state = self.state, state
+        if self.on_change and previous != state:
+            self.on_change(previous, state)
+
+
+class TokenBucket:
+    """Spaces out calls to at most `rate` per second, with bursts of up to `burst`.
+
+    A rate of 0 means no limit.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self, max_wait: float) -> float:
+        """Take a token and return how long to wait before using it; raises RateLimited past max_wait."""
+        if not self.max_rate:
+            return 0.0
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            wait = max(0.0, (1 - self.tokens) / self.rate)
+            if wait > max_wait:
+                raise RateLimited(f"No request slot within {max_wait:.0f}s")
+            self.tokens -= 1
+            return wait
+
+    def slow_down(self):
+        with self.lock:
+            self.rate = max(self.max_rate / 10, self.rate / 2)
+
+    def speed_up(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+
+
+class RetryBudget:
+    """Allows retries as a share of the calls made in the last window, plus a few per window regardless."""
+
+    def __init__(self, ratio: float, window: float = 10.0, minimum: int = 3):
+        self.ratio = ratio
+        self.window = window
+        self.minimum = minimum
+        self.calls = deque()
+        self.retries = deque()
+        self.lock = threading.Lock()
+
+    def _trim(self, now: float):
+        for times in (self.calls, self.retries):
+            while times and times[0] < now - self.window:
+                times.popleft()
+
+    def record_call(self):
+        with self.lock:
+            now = time.monotonic()
+            self._trim(now)
+            self.calls.append(now)
+
+    def try_retry(self) -> bool:
+        with self.lock:
+            now = time.monotonic()
+            self._trim(now)
+            if len(self.retries) >= self.minimum + self.ratio * len(self.calls):
+                return False
+            self.retries.append(now)
+            return True
+
+
+def throttled(error: Optional[Exception], status: Optional[int]) -> bool:
+    # ddgs reports rate limits with its own exception class
+    return status == 429 or (error is not None and "ratelimit" in type(error).__name__.lower())
+
+
+def failed_status(status: Optional[int]) -> bool:
+    """Statuses that say the destination is in trouble; other errors such as 404 are the request's."""
+    return status is not None and (status == 429 or status >= 500)
+
+
+class Destination:
+    """One outside service, or one host of one, guarded by a breaker, a rate limit and retries.
+
+    call() and call_async() run a function that makes a single request. An
+    exception, or a returned response with a 429 or 5xx status, counts as a
+    failure and is retried; when the retries run out the last exception is
+    raised or the last response returned, so callers handle it as before.
+    """
+
+    def __init__(self, name: str, rate: float, retries: int, label: str = None, budget: RetryBudget = None):
+        self.name = name
+        self.label = label or name
+        self.retries = retries
+        self.bucket = TokenBucket(rate, outbound_settings.burst)
+        self.budget = budget or RetryBudget(outbound_settings.retry_budget)
+        self.breaker = CircuitBreaker(name, self._breaker_changed)
+
+    def _breaker_changed(self, previous: str, state: str):
+        if state == OPEN:
+            OUTBOUND_BREAKERS_OPEN.labels(destination=self.label).inc()
+        elif previous == OPEN:
+            OUTBOUND_BREAKERS_OPEN.labels(destination=self.label).dec()
+
+    def _start(self) -> float:
+        try:
+            self.breaker.before_call()
+        except BreakerOpen:
+            OUTBOUND_CALLS.labels(destination=self.label, outcome="rejected").inc()
+            raise
+        try:
+            return self.bucket.reserve(outbound_settings.max_wait)
+        except RateLimited:
+            # The call never reached the destination, so it says nothing about its health
+            self.breaker.release_trial()
+            OUTBOUND_CALLS.labels(destination=self.label, outcome="rate_limited").inc()
+            raise
+
+    def _finish(self, error: Optional[Exception], result) -> bool:
+        """Record the outcome; True if the call failed."""
+        status = getattr(result, "status_code", None)
+        failed = error is not None or failed_status(status)
+        self.breaker.record(not failed)
+        if throttled(error, status):
+            self.bucket.slow_down()
+        elif not failed:
+            self.bucket.speed_up()
+        OUTBOUND_CALLS.labels(destination=self.label, outcome="failure" if failed else "ok").inc()
+        return failed
+
+    def _backoff(self, attempt: int) -> Optional[float]:
+        """Seconds to wait before the next attempt, or None if there is none."""
+        # Once the breaker has opened, a retry would only be rejected
+        if attempt >= self.retries or self.breaker.state != CLOSED or not self.budget.try_retry():
+            return None
+        OUTBOUND_CALLS.labels(destination=self.label, outcome="retried").inc()
+        return random.uniform(0, outbound_settings.retry_backoff * 2 ** attempt)
+
+    def call(self, func: Callable, *args, **kwargs):
+        self.budget.record_call()
+        attempt = 0
+        while True:
+            time.sleep(self._start())
+            error = result = None
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                error = e
+            if not self._finish(error, result):
+                return result
+            delay = self._backoff(attempt)
+            if delay is None:
+                if error is not None:
+                    raise error
+                return result
+            time.sleep(delay)
+            attempt += 1
+
+    async def call_async(self, func: Callable, *args, **kwargs):
+        self.budget.record_call()
+        attempt = 0
+        while True:
+            await asyncio.sleep(self._start())
+            error = result = None
+            try:
+                result = await func(*args, **kwargs)
+            except asyncio.CancelledError:
+                self.breaker.release_trial()
+                raise
+            except Exception as e:
+                error = e
+            if not self._finish(error, result):
+                return result
+            delay = self._backoff(attempt)
+            if delay is None:
+                if error is not None:
+                    raise error
+                return result
+            await asyncio.sleep(delay)
+            attempt += 1
+
+
+class HostDestinations:
+    """A Destination per host, for requests that go to many different sites."""
+
+    def __init__(self, label: str, rate: float, retries: int):
+        self.label = label
+        self.rate = rate
+        self.retries = retries
+        # Shared by all hosts so an outage of many sites does not multiply retries
+        self.budget = RetryBudget(outbound_settings.retry_budget)
+        # Least recently used first, with when each host was last used
+        self.hosts: "OrderedDict[str, Tuple[Destination, float]]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    def for_url(self, url: str) -> Destination:
+        host = urlsplit(url).netloc.lower()
+        now = time.monotonic()
+        with self.lock:
+            if host in self.hosts:
+                destination = self.hosts.pop(host)[0]
+            else:
+                destination = Destination(f"{self.label}:{host}", self.rate, self.retries, self.label, self.budget)
+                self._prune(now)
+            self.hosts[host] = (destination, now)
+            return destination
+
+    def _prune(self, now: float):
+        """Forget idle hosts whose breaker is closed, and the least recently used ones beyond the cap."""
+        # Room for the host being added
+        limit = max(outbound_settings.max_hosts - 1, 0)
+        for host, (destination, last_used) in list(self.hosts.items()):
+            if now - last_used < outbound_settings.host_idle and len(self.hosts) <= limit:
+                break
+            if destination.breaker.state == CLOSED:
+                del self.hosts[host]
+        # Failing hosts are remembered while there is room, but never past the cap
+        while len(self.hosts) > limit:
+            destination = self.hosts.popitem(last=False)[1][0]
+            if destination.breaker.state == OPEN:
+                OUTBOUND_BREAKERS_OPEN.labels(destination=self.label).dec()
+
+
+instagram = Destination("instagram", outbound_settings.instagram_rate, outbound_settings.retries)
+search = Destination("search", outbound_settings.search_rate, outbound_settings.retries)
+pages = HostDestinations("pages", outbound_settings.page_rate, retries=0)
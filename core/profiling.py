@@ -0,0 +1,204 @@
+"""Sampling profiles of individual checks.
+
+While at least one capture is active, a background thread takes the Python
+stack of every thread in the process every PROFILE_INTERVAL seconds: the
+event loop thread as well as the worker threads that run Whisper, the
+embeddings and blocking HTTP. Each sample is counted, as a folded stack, in
+every active capture, prefixed with the stage that capture's check is in.
+
+Usage:
+    capture = start_capture()
+    ...
+    capture.stop()
+    save_profile(capture, url, timings.as_dict())
+
+Threads are shared by every check in the process, so a profile also contains
+the work of checks that ran at the same time; `overlapping_captures` in its
+metadata says how many other profiled checks did. Profiles are saved as JSON
+in PROFILE_DIR and can be turned into the folded text that flame graph tools
+(flamegraph.pl, speedscope) read.
+"""
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+from core.config import profile_settings
+
+logger = logging.getLogger(__name__)
+
+# Innermost frames of a thread that is waiting rather than working: an idle
+# event loop (uvloop polls in C, so its Python stack ends at asyncio.run), an
+# executor thread waiting for work, a lock or queue wait
+IDLE_FRAMES = {
+    ("selectors.py", "select"), ("runners.py", "run"), ("threading.py", "wait"), ("queue.py", "get"), ("thread.py", "_worker"),
+}
+
+PROFILE_NAME = re.compile(r"^[\w.-]+\.json$")
+REEL_ID = re.compile(r"instagram\.com/(?:p|reels?|share)/([\w-]+)")
+
+
+def fold(frame) -> List[str]:
+    """Frames of a stack from the outermost call to the innermost."""
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)})")
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+def is_idle(frame) -> bool:
+    code = frame.f_code
+    return (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES
+
+
+class ProfileCapture:
+    """Samples collected for one check."""
+
+    def __init__(self, sampler: "StackSampler", stage=None):
+        self.sampler = sampler
+        # Called for every sample to label it with the check's current stage
+        self.stage = stage or (lambda: None)
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.idle_samples = 0
+        self.overlapping = 0
+        self.started = time.time()
+        self.duration: Optional[float] = None
+
+    def record(self, thread: str, stack: List[str]):
+        self.stacks[";".join([self.stage() or "queued", thread, *stack])] += 1
+
+    def stop(self):
+        if self.duration is None:
+            self.duration = round(time.time() - self.started, 4)
+            self.sampler.remove(self)
+
+
+class StackSampler:
+    """One thread that samples every thread's stack while any capture is active."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.captures: Set[ProfileCapture] = set()
+        self.lock = threading.Lock()
+        self.thread: Optional[threading.Thread] = None
+
+    def add(self, capture: ProfileCapture):
+        with self.lock:
+            for other in self.captures:
+                other.overlapping += 1
+                capture.overlapping += 1
+            self.captures.add(capture)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+                self.thread.start()
+
+    def remove(self, capture: ProfileCapture):
+        with self.lock:
+            self.captures.discard(capture)
+
+    def _run(self):
+        own = threading.get_ident()
+        while True:
+            # Held for the whole pass so a capture never changes after stop() returns
+            with self.lock:
+                if not self.captures:
+                    self.thread = None
+                    return
+                self._sample(own)
+            time.sleep(self.interval)
+
+    def _sample(self, own: int):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            idle = is_idle(frame)
+            stack = None if idle else fold(frame)
+            for capture in self.captures:
+                capture.samples += 1
+                if idle:
+                    capture.idle_samples += 1
+                else:
+                    capture.record(names.get(ident, str(ident)), stack)
+
+
+sampler = StackSampler(profile_settings.interval)
+
+
+def start_capture(stage=None) -> ProfileCapture:
+    capture = ProfileCapture(sampler, stage)
+    sampler.add(capture)
+    return capture
+
+
+def reel_id(url: str) -> str:
+    match = REEL_ID.search(url or "")
+    return match.group(1) if match else "unknown"
+
+
+def save_profile(capture: ProfileCapture, url: str, timings: dict, reason: str = "requested") -> Path:
+    """Write a stopped capture to PROFILE_DIR, removing the oldest profiles beyond PROFILE_KEEP."""
+    directory = Path(profile_settings.dir)
+    directory.mkdir(parents=True, exist_ok=True)
+    started = time.strftime("%Y%m%dT%H%M%S", time.gmtime(capture.started))
+    name = f"{started}_{reel_id(url)}_{os.getpid()}_{int(capture.started * 1000) % 1000:03d}.json"
+    profile = {
+        "meta": {
+            "name": name,
+            "url": url,
+            "reel_id": reel_id(url),
+            "reason": reason,
+            "started_at": capture.started,
+            "duration": capture.duration,
+            "interval": sampler.interval,
+            "samples": capture.samples,
+            "idle_samples": capture.idle_samples,
+            "overlapping_captures": capture.overlapping,
+            "pid": os.getpid(),
+            "timings": timings,
+        },
+        "stacks": dict(capture.stacks.most_common()),
+    }
+    path = directory / name
+    path.write_text(json.dumps(profile))
+    logger.info(f"Saved profile of {url} ({capture.duration}s, {reason}) to {path}")
+
+    if profile_settings.keep:
+        for old in sorted(directory.glob("*.json"))[:-profile_settings.keep]:
+            old.unlink(missing_ok=True)
+    return path
+
+
+def profile_path(name: str) -> Optional[Path]:
+    """Path of a saved profile, or None for unknown or unsafe names."""
+    if not PROFILE_NAME.match(name):
+        return None
+    path = Path(profile_settings.dir) / name
+    return path if path.is_file() else None
+
+
+def list_profiles() -> List[Dict]:
+    """Metadata of the saved profiles, newest first."""
+    directory = Path(profile_settings.dir)
+    profiles = []
+    for path in sorted(directory.glob("*.json"), reverse=True) if directory.is_dir() else []:
+        try:
+            meta = json.loads(path.read_text())["meta"]
+        except (OSError, ValueError, KeyError):
+            continue
+        profiles.append({**meta, "size": path.stat().st_size})
+    return profiles
+
+
+def folded(profile: dict) -> str:
+    """The profile in the folded stack format flame graph tools read."""
+    return "".join(f"{stack} {count}\n" for stack, count in profile["stacks"].items())
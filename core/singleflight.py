@@ -0,0 +1,39 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class SharedCache:
+    """Single-flight memo for work shared between concurrent checks, e.g. a batch.
+
+    The first caller for a key runs the coroutine; concurrent and later
+    callers with the same key await the same task. Failed or cancelled work
+    is dropped so the next caller retries it.
+    """
+
+    def __init__(self):
+        self.tasks: Dict[Hashable, asyncio.Future] = {}
+        self.embeddings: Dict[str, Any] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def has(self, key: Hashable) -> bool:
+        return key in self.tasks
+
+    async def run(self, key: Hashable, factory: Callable[[], Awaitable]):
+        task = self.tasks.get(key)
+        if task is None:
+            self.misses += 1
+            task = asyncio.ensure_future(factory())
+            self.tasks[key] = task
+            task.add_done_callback(lambda t: self._forget_failed(key, t))
+        else:
+            self.hits += 1
+        # Shielded so one caller going away does not cancel the work for the others
+        return await asyncio.shield(task)
+
+    def _forget_failed(self, key: Hashable, task: asyncio.Future):
+        if (task.cancelled() or task.exception() is not None) and self.tasks.get(key) is task:
+            del self.tasks[key]
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "embeddings": len(self.embeddings)}
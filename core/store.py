@@ -0,0 +1,281 @@
+"""SQLite-backed store shared by every server process on the machine.
+
+It holds the per-reel stage cache that used to live in db/data.json, resolved
+lookups (Instagram share links and signed media URLs, and recent web search
+results to fall back on when search fails), the compressed text of scraped
+pages, the size and last use of every saved media file (for the media store's
+LRU eviction), and the leases that coordinate worker processes: who is
+currently running a cacheable stage for a reel (cross-process single-flight)
+and how many jobs are queued across all processes (admission control).
+
+SQLite in WAL mode handles concurrent readers and serialises writers, so
+processes never overwrite each other's entries. A lease names its owning
+process; leases of processes that died are ignored and cleaned up.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Optional
+from core.config import store_settings
+
+logger = logging.getLogger(__name__)
+
+# Identifies this process as a lease owner; the pid lets others detect it died
+OWNER = f"{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialised = False
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    url_key TEXT NOT NULL,
+    field TEXT NOT NULL,
+    value TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (url_key, field)
+);
+CREATE TABLE IF NOT EXISTS metadata (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    expires_at REAL
+);
+CREATE TABLE IF NOT EXISTS pages (
+    url TEXT PRIMARY KEY,
+    text BLOB NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    fresh_until REAL NOT NULL,
+    size INTEGER NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS pages_accessed_at ON pages (accessed_at);
+CREATE TABLE IF NOT EXISTS media (
+    name TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS media_accessed_at ON media (accessed_at);
+CREATE TABLE IF NOT EXISTS leases (
+    name TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+
+def connect() -> sqlite3.Connection:
+    """Connection for the calling thread; sqlite3 connections must not be shared between threads."""
+    global _initialised
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        return conn
+
+    os.makedirs(os.path.dirname(store_settings.path) or ".", exist_ok=True)
+    conn = sqlite3.connect(store_settings.path, timeout=store_settings.busy_timeout, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    with _init_lock:
+        if not _initialised:
+            conn.executescript(SCHEMA)
+            import_legacy_cache(conn)
+            _initialised = True
+    _local.conn = conn
+    return conn
+
+
+def import_legacy_cache(conn: sqlite3.Connection):
+    """Copy entries from the old db/data.json cache the first time the store is opened."""
+    legacy_path = os.path.join(os.path.dirname(store_settings.path), "data.json")
+    if not os.path.exists(legacy_path):
+        return
+    if conn.execute("SELECT 1 FROM cache LIMIT 1").fetchone():
+        return
+    try:
+        with open(legacy_path, "r") as f:
+            data = json.load(f)
+    except (json.JSONDecodeError, OSError) as e:
+        logger.warning(f"Could not import legacy cache {legacy_path}: {e}")
+        return
+    rows = [
+        (url_key, field, json.dumps(value), time.time())
+        for url_key, entry in data.items() for field, value in entry.items()
+    ]
+    conn.executemany("INSERT OR IGNORE INTO cache VALUES (?, ?, ?, ?)", rows)
+    logger.info(f"Imported {len(rows)} cached fields from {legacy_path}")
+
+
+def get_entry(url_key: str) -> dict:
+    """All cached fields for one reel."""
+    rows = connect().execute("SELECT field, value FROM cache WHERE url_key = ?", (url_key,)).fetchall()
+    return {field: json.loads(value) for field, value in rows}
+
+
+def get_field(url_key: str, field: str) -> Optional[Any]:
+    row = connect().execute("SELECT value FROM cache WHERE url_key = ? AND field = ?", (url_key, field)).fetchone()
+    return json.loads(row[0]) if row else None
+
+
+def set_field(url_key: str, field: str, value: Any):
+    connect().execute(
+        "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)",
+        (url_key, field, json.dumps(value), time.time()),
+    )
+
+
+def delete_field(url_key: str, field: str):
+    connect().execute("DELETE FROM cache WHERE url_key = ? AND field = ?", (url_key, field))
+
+
+def clear_cache():
+    """Forget every cached stage result, resolved lookup and scraped page."""
+    connect().execute("DELETE FROM cache")
+    connect().execute("DELETE FROM metadata")
+    connect().execute("DELETE FROM pages")
+
+
+def forget_audio(audio_url: str) -> int:
+    """Drop the cached downloads that point at audio_url, so the next check downloads it again."""
+    return connect().execute(
+        "DELETE FROM cache WHERE field = 'video_and_audio' AND json_extract(value, '$.audio') = ?", (audio_url,)
+    ).rowcount
+
+
+def cached_audio_urls() -> set:
+    rows = connect().execute("SELECT json_extract(value, '$.audio') FROM cache WHERE field = 'video_and_audio'").fetchall()
+    return {row[0] for row in rows if row[0]}
+
+
+def get_metadata(key: str, stale: bool = False) -> Optional[Any]:
+    """A resolved lookup, or None if it was never stored or has expired; stale also returns expired ones."""
+    row = connect().execute(
+        "SELECT value FROM metadata WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)", (key, 0 if stale else time.time())
+    ).fetchone()
+    return json.loads(row[0]) if row else None
+
+
+def set_metadata(key: str, value: Any, expires_at: Optional[float] = None):
+    """Store a resolved lookup; without expires_at it is kept for good."""
+    connect().execute("INSERT OR REPLACE INTO metadata VALUES (?, ?, ?)", (key, json.dumps(value), expires_at))
+
+
+def get_page(url: str) -> Optional[dict]:
+    row = connect().execute(
+        "SELECT text, etag, last_modified, fresh_until FROM pages WHERE url = ?", (url,)
+    ).fetchone()
+    if not row:
+        return None
+    return {"text": row[0], "etag": row[1], "last_modified": row[2], "fresh_until": row[3]}
+
+
+def save_page(url: str, text: bytes, etag: Optional[str], last_modified: Optional[str], fresh_until: float):
+    connect().execute(
+        "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (url, text, etag, last_modified, fresh_until, len(text), time.time()),
+    )
+
+
+def touch_page(url: str, fresh_until: Optional[float] = None):
+    """Mark a page used, and fresh until fresh_until once it has been revalidated."""
+    if fresh_until is None:
+        connect().execute("UPDATE pages SET accessed_at = ? WHERE url = ?", (time.time(), url))
+    else:
+        connect().execute("UPDATE pages SET accessed_at = ?, fresh_until = ? WHERE url = ?", (time.time(), fresh_until, url))
+
+
+def evict_pages(max_bytes: int) -> int:
+    """Delete the least recently used pages until the rest take at most max_bytes; returns how many."""
+    conn = connect()
+    usage = conn.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+    if usage <= max_bytes:
+        return 0
+    evicted = 0
+    for url, size in conn.execute("SELECT url, size FROM pages ORDER BY accessed_at").fetchall():
+        if usage <= max_bytes:
+            break
+        conn.execute("DELETE FROM pages WHERE url = ?", (url,))
+        usage -= size
+        evicted += 1
+    return evicted
+
+
+def record_media(name: str, size: int, accessed_at: Optional[float] = None):
+    connect().execute("INSERT OR REPLACE INTO media VALUES (?, ?, ?)", (name, size, accessed_at or time.time()))
+
+
+def touch_media(name: str):
+    connect().execute("UPDATE media SET accessed_at = ? WHERE name = ?", (time.time(), name))
+
+
+def forget_media(name: str):
+    connect().execute("DELETE FROM media WHERE name = ?", (name,))
+
+
+def media_usage() -> int:
+    return connect().execute("SELECT COALESCE(SUM(size), 0) FROM media").fetchone()[0]
+
+
+def media_by_last_use() -> list:
+    """(name, size, accessed_at) of every saved media file, least recently used first."""
+    return connect().execute("SELECT name, size, accessed_at FROM media ORDER BY accessed_at").fetchall()
+
+
+def owner_alive(owner: str) -> bool:
+    pid = int(owner.split(":", 1)[0])
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def acquire_lease(name: str, ttl: float) -> bool:
+    """Take the named lease for this process unless another live process holds an unexpired one.
+
+    A lease this process already holds is simply renewed, so callers that
+    may race within the process need their own single-flight in front.
+    """
+    conn = connect()
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute("SELECT owner, expires_at FROM leases WHERE name = ?", (name,)).fetchone()
+        if row and row[0] != OWNER and row[1] > now and owner_alive(row[0]):
+            conn.execute("COMMIT")
+            return False
+        conn.execute("INSERT OR REPLACE INTO leases VALUES (?, ?, ?)", (name, OWNER, now + ttl))
+        conn.execute("COMMIT")
+        return True
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def release_lease(name: str):
+    connect().execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, OWNER))
+
+
+def count_leases(prefix: str) -> int:
+    """Live leases whose name starts with prefix, removing expired or orphaned ones."""
+    conn = connect()
+    now = time.time()
+    rows = conn.execute(
+        "SELECT name, owner, expires_at FROM leases WHERE substr(name, 1, ?) = ?", (len(prefix), prefix)
+    ).fetchall()
+    stale = [name for name, owner, expires_at in rows if expires_at <= now or not owner_alive(owner)]
+    if stale:
+        conn.executemany("DELETE FROM leases WHERE name = ?", [(name,) for name in stale])
+    return len(rows) - len(stale)
+
+
+def release_owned_leases():
+    """Drop every lease held by this process, e.g. on shutdown."""
+    connect().execute("DELETE FROM leases WHERE owner = ?", (OWNER,))
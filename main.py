@@ -1,8 +1,39 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from contextlib import asynccontextmanager
+import asyncio
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Response, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from app.flow import check_authenticity
+from fastapi.responses import StreamingResponse, FileResponse, PlainTextResponse
+from prometheus_client import CONTENT_TYPE_LATEST
+from pydantic import BaseModel
+from typing import List, Optional
+from app.batch import run_batch
+from app.jobs import job_manager, AdmissionRejected, Job
+from app.warmup import warmup, is_ready, state as warmup_state
+from core.config import metrics_settings, batch_settings, llm_settings
+from core.concurrency import pools
+from core.deadline import Deadline
+from core.media_store import sweep as sweep_media
+from core.metrics import latest_metrics, mark_process_dead
+from core.profiling import list_profiles, profile_path, folded
+from modules.llm_clients.client import llm_router
 import json
-app = FastAPI()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await job_manager.start()
+    # Models load in the background so the server answers health checks while booting
+    warmup_task = asyncio.create_task(warmup())
+    # Leftovers of crashed processes are removed without delaying startup
+    sweep_task = asyncio.create_task(asyncio.to_thread(sweep_media))
+    yield
+    warmup_task.cancel()
+    await asyncio.gather(sweep_task, return_exceptions=True)
+    await job_manager.stop()
+    mark_process_dead()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -13,9 +44,156 @@ app.add_middleware(
 )
 
 
+class JobRequest(BaseModel):
+    url: str
+    deadline: Optional[float] = None  # seconds, including time spent queued
+    profile: bool = False  # save a sampling profile of the check
+
+
+class BatchRequest(BaseModel):
+    urls: List[str]
+    workers: Optional[int] = None  # capped at BATCH_WORKERS
+    deadline: Optional[float] = None  # seconds per reel
+
+
+# Verdict tokens, transcript chunks and queue positions, which clients that
+# show every event as one line (such as the browser extension) cannot render
+STREAM_STEPS = {"partial", "transcript", "queued"}
+
+
+async def follow_job(websocket: WebSocket, job: Job, after: int = -1, extra: dict = None, stream: bool = False):
+    """Forward job events until the job finishes or the client disconnects.
+
+    Listening for the disconnect alongside the forwarding means a closed tab
+    is noticed straight away, not only when the next send fails. Incremental
+    events are only sent to clients that asked for them with `stream`.
+    """
+    async def forward():
+        async for event in job.stream(after):
+            if not stream and event.get("step") in STREAM_STEPS:
+                continue
+            await websocket.send_text(json.dumps({**event, **(extra or {})}))
+
+    async def wait_for_disconnect():
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+
+    job_manager.attach(job)
+    tasks = [asyncio.create_task(forward()), asyncio.create_task(wait_for_disconnect())]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        job_manager.detach(job)
+
+
+@app.get("/healthz")
+async def healthz():
+    return {"status": "ok"}
+
+
+@app.get("/readyz")
+async def readyz(response: Response):
+    if not is_ready():
+        response.status_code = 503
+    return warmup_state
+
+
+@app.get("/metrics")
+async def metrics():
+    if not metrics_settings.enabled:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return Response(latest_metrics(), media_type=CONTENT_TYPE_LATEST)
+
+
+@app.post("/api/jobs")
+async def submit_job(request: JobRequest):
+    if not request.url:
+        raise HTTPException(status_code=400, detail="URL is required")
+    try:
+        job = await job_manager.submit(
+            request.url, deadline=Deadline(request.deadline) if request.deadline else None, profile=request.profile
+        )
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    return job.summary()
+
+
+@app.get("/api/jobs")
+async def job_stats():
+    stats = {**job_manager.stats(), "pools": {name: pool.stats() for name, pool in pools.items()}}
+    if llm_settings.provider == "auto":
+        stats["llm_providers"] = llm_router.snapshot()
+    return stats
+
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = job_manager.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {**job.summary(), "last_event": job.events[-1] if job.events else None}
+
+
+@app.post("/api/checkAuthenticityBatch")
+async def check_authenticity_batch(request: BatchRequest):
+    """Check a list of reels and stream one NDJSON line per reel as each completes."""
+    if not request.urls:
+        raise HTTPException(status_code=400, detail="At least one URL is required")
+    if len(request.urls) > batch_settings.max_urls:
+        raise HTTPException(status_code=400, detail=f"At most {batch_settings.max_urls} URLs per batch")
+
+    async def lines():
+        async for result in run_batch(request.urls, request.workers, request.deadline):
+            yield json.dumps(result) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@app.get("/api/profiles")
+async def get_profiles():
+    return await asyncio.to_thread(list_profiles)
+
+
+@app.get("/api/profiles/{name}")
+async def get_profile(name: str, format: str = "json"):
+    """Download a saved profile as JSON, or as folded stacks with format=folded."""
+    path = profile_path(name)
+    if not path:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if format == "folded":
+        return PlainTextResponse(folded(json.loads(path.read_text())))
+    return FileResponse(path, media_type="application/json", filename=name)
+
+
+@app.websocket("/api/jobs/{job_id}/events")
+async def job_events_endpoint(websocket: WebSocket, job_id: str, after: int = -1, stream: bool = False):
+    """Replay the events after `after` (a seq number) and follow the job until it finishes."""
+    await websocket.accept()
+    try:
+        job = job_manager.get(job_id)
+        if not job:
+            await websocket.send_text(json.dumps({"step": "error", "message": "Job not found"}))
+            return
+        await follow_job(websocket, job, after, stream=stream)
+    except WebSocketDisconnect:
+        print("WebSocket disconnected")
+    finally:
+        try:
+            await websocket.close()
+        except:
+            pass
+
+
 @app.websocket("/api/checkAuthenticityWS")
-async def check_authenticity_endpoint(websocket: WebSocket):
+async def check_authenticity_endpoint(websocket: WebSocket, profile: bool = False, stream: bool = False):
     await websocket.accept()
+    # The budget starts now, so time spent queued counts against it
+    deadline = Deadline()
     try:
         data = await websocket.receive_text()
         url = data
@@ -24,8 +202,15 @@ async def check_authenticity_endpoint(websocket: WebSocket):
             await websocket.close()
             return
 
-        await check_authenticity(websocket, url)
-        
+        # The check runs as a background job, so a reconnect for the same reel
+        # replays its progress instead of starting the pipeline again
+        try:
+            job = await job_manager.submit(url, cancel_on_disconnect=True, deadline=deadline, profile=profile)
+        except AdmissionRejected as e:
+            await websocket.send_text(json.dumps({"step": "error", "message": str(e), "retry_after": e.retry_after}))
+            return
+        await follow_job(websocket, job, extra={"job_id": job.id}, stream=stream)
+
     except WebSocketDisconnect:
         print("WebSocket disconnected")
     except json.JSONDecodeError:
@@ -36,4 +221,4 @@ async def check_authenticity_endpoint(websocket: WebSocket):
         try:
             await websocket.close()
         except:
-            pass
\ No newline at end of file
+            pass
@@ -1,94 +1,218 @@
-from groq import Groq
-import requests
+from typing import AsyncIterator, TYPE_CHECKING
+import asyncio
+import httpx
+import json
+import time
 from core.config import llm_settings
+from modules.llm_clients.router import LLMRouter, Provider
+from core.concurrency import llm_pool
+from core.deadline import Deadline
 import logging
-import os
+
+if TYPE_CHECKING:
+    from groq import AsyncGroq
 
 logger = logging.getLogger(__name__)
 
-# Read Ollama base URL from environment, fallback to localhost
-OLLAMA_BASE_URL = os.getenv("OLLAMA_API_BASE", "http://localhost:11434")
-
-
-async def get_llm_client(prompt: str):
-    if llm_settings.provider == "ollama":
-        try:
-            if not check_ollama_connection(OLLAMA_BASE_URL):
-                logger.error("Ollama is not running")
-                return None
-            
-            models = list_available_models(OLLAMA_BASE_URL)
-            if "gpt-oss:20b" not in models:
-                logger.error("gpt-oss:20b model is not available")
-                return None
-            
-            api_url = f"{OLLAMA_BASE_URL}/api/generate"
-            payload = {
-                "model": "gpt-oss:20b",
-                "prompt": prompt,
-                "stream": False,
-                "options": {
-                    "temperature": 0.0,  # Lower temperature for more consistent JSON output
-                    "top_p": 0.9
-                }
-            }
-            
-            response = requests.post(
-                api_url,
-                json=payload,
-                headers={"Content-Type": "application/json"},
-                timeout=180
-            )
-            response.raise_for_status()
-            result = response.json().get("response", "").strip()
-            return result
-        except Exception as e:
-            logger.error(f"Error getting llm client: {e}")
-            return None
-    
-    elif llm_settings.provider == "groq":
-        try:
-            if not llm_settings.api_key:
-                logger.error("Groq API key is not set")
-                return None
-            
-            client = Groq(
-                api_key=llm_settings.api_key,
-            )
-
-            chat_completion = client.chat.completions.create(
-                messages=[
-                    {
-                        "role": "user",
-                        "content": prompt,
-                    }
-                ],
-                model="openai/gpt-oss-20b",
-            )
-
-            return chat_completion.choices[0].message.content
-        except Exception as e:
-            logger.error(f"Error getting llm client: {e}")
-            return None
-
-
-def check_ollama_connection(base_url: str = OLLAMA_BASE_URL) -> bool:
-    """Check if Ollama is running and accessible."""
+OLLAMA_BASE_URL = llm_settings.ollama_base_url
+OLLAMA_MODEL = "gpt-oss:20b"
+GROQ_MODEL = "openai/gpt-oss-20b"
+
+# How long a successful Ollama model check is trusted before asking /api/tags again
+OLLAMA_CHECK_TTL = 30
+
+_ollama_checked_at = 0.0
+_groq_client = None
+
+
+async def get_llm_client(prompt: str, json_schema: dict = None, deadline: Deadline = None):
+    """Return the LLM response text, or None on failure.
+
+    When json_schema is given the provider is asked for JSON output: Ollama
+    constrains decoding to the schema, Groq is switched to JSON mode. With a
+    deadline the call, including waiting for an LLM slot, is bounded by the
+    time the check has left. That bound is only the overall cap: with
+    LLM_PROVIDER=auto the router gives each provider attempt its own share,
+    so a stalled provider leaves time to fall back.
+    """
+    timeout = deadline.timeout(llm_settings.timeout) if deadline else llm_settings.timeout
     try:
-        response = requests.get(f"{base_url}/api/tags", timeout=5)
-        response.raise_for_status()
-        return True
-    except:
-        return False
+        return await asyncio.wait_for(generate(prompt, json_schema=json_schema, timeout=timeout), timeout)
+    except asyncio.TimeoutError:
+        logger.error(f"LLM call timed out after {timeout:.1f}s")
+        return None
+    except Exception as e:
+        logger.error(f"Error getting llm client: {e}")
+        return None
 
 
-def list_available_models(base_url: str = OLLAMA_BASE_URL) -> list:
-    """Get list of available models in Ollama."""
+async def generate(prompt: str, **options) -> str:
+    async with llm_pool.acquire():
+        if llm_settings.provider == "auto":
+            return await llm_router.generate(prompt, **options)
+
+        provider = PROVIDERS.get(llm_settings.provider)
+        if not provider:
+            raise ValueError(f"Unknown LLM provider: {llm_settings.provider}")
+        return await provider.generate(prompt, **options)
+
+
+async def stream_llm_client(prompt: str, deadline: Deadline = None) -> AsyncIterator[str]:
+    """Yield the LLM response incrementally, one text chunk at a time.
+
+    Errors are logged and end the stream early, mirroring get_llm_client
+    returning None; callers should treat an empty stream as a failure. When
+    the deadline runs out the stream stops and callers keep the partial text.
+    Without a deadline the call, including waiting for an LLM slot, is
+    bounded by LLM_TIMEOUT as in get_llm_client.
+    """
+    deadline = deadline or Deadline(llm_settings.timeout)
     try:
-        response = requests.get(f"{base_url}/api/tags", timeout=10)
+        provider = None
+        if llm_settings.provider != "auto":
+            provider = PROVIDERS.get(llm_settings.provider)
+            if not provider:
+                logger.error(f"Unknown LLM provider: {llm_settings.provider}")
+                return
+
+        async with llm_pool.acquire(deadline=deadline):
+            # Time spent waiting for the slot comes out of the stream's budget
+            timeout = deadline.timeout(llm_settings.timeout)
+            stream = provider.stream(prompt, timeout=timeout) if provider else llm_router.stream(prompt, timeout=timeout)
+            try:
+                async for token in stream:
+                    yield token
+                    if deadline and deadline.expired():
+                        logger.warning("Time budget ran out while streaming, stopping early")
+                        break
+            finally:
+                await stream.aclose()
+    except Exception as e:
+        logger.error(f"Error streaming from llm client: {e}")
+        return
+
+
+async def ollama_generate(prompt: str, json_schema: dict = None, timeout: float = None) -> str:
+    await ensure_ollama_model()
+    payload = build_ollama_payload(prompt, stream=False)
+    if json_schema:
+        payload["format"] = json_schema
+    async with httpx.AsyncClient(timeout=httpx.Timeout(timeout or llm_settings.timeout, connect=10)) as client:
+        response = await client.post(
+            f"{OLLAMA_BASE_URL}/api/generate",
+            json=payload,
+        )
         response.raise_for_status()
-        models = response.json().get("models", [])
-        return [model.get("name", "") for model in models]
+        return response.json().get("response", "").strip()
+
+
+async def ollama_stream(prompt: str, timeout: float = None) -> AsyncIterator[str]:
+    await ensure_ollama_model()
+    async with httpx.AsyncClient(timeout=httpx.Timeout(timeout or llm_settings.timeout, connect=10)) as client:
+        async with client.stream(
+            "POST",
+            f"{OLLAMA_BASE_URL}/api/generate",
+            json=build_ollama_payload(prompt, stream=True),
+        ) as response:
+            response.raise_for_status()
+            # Ollama streams newline-delimited JSON objects
+            async for line in response.aiter_lines():
+                if not line.strip():
+                    continue
+                chunk = json.loads(line)
+                token = chunk.get("response", "")
+                if token:
+                    yield token
+                if chunk.get("done"):
+                    break
+
+
+async def groq_generate(prompt: str, json_schema: dict = None, timeout: float = None) -> str:
+    extra = {"response_format": {"type": "json_object"}} if json_schema else {}
+    chat_completion = await get_groq_client().chat.completions.create(
+        messages=[
+            {
+                "role": "user",
+                "content": prompt,
+            }
+        ],
+        model=GROQ_MODEL,
+        timeout=timeout or llm_settings.timeout,
+        **extra,
+    )
+    return chat_completion.choices[0].message.content
+
+
+async def groq_stream(prompt: str, timeout: float = None) -> AsyncIterator[str]:
+    stream = await get_groq_client().chat.completions.create(
+        messages=[
+            {
+                "role": "user",
+                "content": prompt,
+            }
+        ],
+        model=GROQ_MODEL,
+        stream=True,
+        timeout=timeout or llm_settings.timeout,
+    )
+    async for chunk in stream:
+        if not chunk.choices:
+            continue
+        token = chunk.choices[0].delta.content
+        if token:
+            yield token
+
+
+def get_groq_client() -> "AsyncGroq":
+    """Return a shared Groq client so connections are reused across calls."""
+    global _groq_client
+    if not llm_settings.api_key:
+        raise RuntimeError("Groq API key is not set")
+    if _groq_client is None:
+        from groq import AsyncGroq
+        _groq_client = AsyncGroq(
+            api_key=llm_settings.api_key,
+            base_url=llm_settings.groq_base_url,
+            timeout=llm_settings.timeout,
+        )
+    return _groq_client
+
+
+async def ensure_ollama_model():
+    """Raise if Ollama is unreachable or the model is missing, caching a successful check."""
+    global _ollama_checked_at
+    if time.monotonic() - _ollama_checked_at < OLLAMA_CHECK_TTL:
+        return
+
+    try:
+        async with httpx.AsyncClient(timeout=5) as client:
+            response = await client.get(f"{OLLAMA_BASE_URL}/api/tags")
+            response.raise_for_status()
     except Exception as e:
-        logger.error(f"Could not fetch available models: {e}")
-        return []
+        raise RuntimeError(f"Ollama is not running: {e}")
+
+    models = [model.get("name", "") for model in response.json().get("models", [])]
+    if OLLAMA_MODEL not in models:
+        raise RuntimeError(f"{OLLAMA_MODEL} model is not available")
+    _ollama_checked_at = time.monotonic()
+
+
+def build_ollama_payload(prompt: str, stream: bool = False) -> dict:
+    """Build the /api/generate request body shared by the streaming and blocking calls."""
+    return {
+        "model": OLLAMA_MODEL,
+        "prompt": prompt,
+        "stream": stream,
+        "options": {
+            "temperature": 0.0,  # Lower temperature for more consistent JSON output
+            "top_p": 0.9
+        }
+    }
+
+
+PROVIDERS = {
+    "ollama": Provider(generate=ollama_generate, stream=ollama_stream),
+    "groq": Provider(generate=groq_generate, stream=groq_stream),
+}
+
+llm_router = LLMRouter(PROVIDERS)
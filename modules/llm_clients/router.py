@@ -0,0 +1,244 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, NamedTuple, Optional
+from core.config import llm_settings
+from core.metrics import LLM_PROVIDER_LATENCY, LLM_PROVIDER_ERROR_RATE, LLM_PROVIDER_HEALTHY
+
+logger = logging.getLogger(__name__)
+
+# Hedging only kicks in once a provider has enough samples for a meaningful percentile
+MIN_SAMPLES_FOR_HEDGE = 10
+# Error rate is only trusted once this many outcomes have been seen
+MIN_SAMPLES_FOR_HEALTH = 3
+
+
+class Provider(NamedTuple):
+    generate: Callable[..., Awaitable[str]]
+    stream: Callable[..., AsyncIterator[str]]
+
+
+class ProviderStats:
+    """Rolling latency and error statistics for a single LLM provider."""
+
+    def __init__(self, name: str, window: int):
+        self.name = name
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)
+        self.unhealthy_until = 0.0
+
+    def record_success(self, latency: float):
+        self.latencies.append(latency)
+        self.outcomes.append(True)
+        self.export()
+
+    def record_censored(self, elapsed: float):
+        """A call abandoned after `elapsed` seconds (a lost hedge): its latency was at least that."""
+        self.latencies.append(elapsed)
+        self.export()
+
+    def record_failure(self):
+        self.outcomes.append(False)
+        if len(self.outcomes) >= MIN_SAMPLES_FOR_HEALTH and self.error_rate() >= llm_settings.router_max_error_rate:
+            self.unhealthy_until = time.monotonic() + llm_settings.router_cooldown
+            logger.warning(f"LLM provider {self.name} marked unhealthy for {llm_settings.router_cooldown}s")
+        self.export()
+
+    def export(self):
+        """Publish the rolling statistics as gauges for /metrics."""
+        for quantile in (50, 95):
+            value = self.percentile(quantile)
+            if value is not None:
+                LLM_PROVIDER_LATENCY.labels(provider=self.name, quantile=f"p{quantile}").set(value)
+        LLM_PROVIDER_ERROR_RATE.labels(provider=self.name).set(self.error_rate())
+        LLM_PROVIDER_HEALTHY.labels(provider=self.name).set(1 if self.is_healthy() else 0)
+
+    def percentile(self, p: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+    def is_healthy(self) -> bool:
+        return time.monotonic() >= self.unhealthy_until
+
+    def snapshot(self) -> dict:
+        return {
+            "provider": self.name,
+            "healthy": self.is_healthy(),
+            "samples": len(self.latencies),
+            "error_rate": round(self.error_rate(), 4),
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+        }
+
+
+class LLMRouter:
+    """Routes prompts to the fastest healthy provider, with fallback and optional hedging.
+
+    Providers are ranked by median latency; providers without samples come after
+    the measured ones, in LLM_PROVIDERS order, so a provider never looks fast for
+    lack of data. When hedging is enabled and the primary has not
+    answered within its configured latency percentile, the same prompt is sent to
+    the next provider and whichever finishes first wins, the other is cancelled.
+    """
+
+    def __init__(self, providers: Dict[str, Provider]):
+        names = [name.strip() for name in llm_settings.router_providers if name.strip() in providers]
+        self.providers = {name: providers[name] for name in names}
+        self.stats = {name: ProviderStats(name, llm_settings.router_window) for name in names}
+
+    def rank(self) -> List[str]:
+        def latency_key(name):
+            p50 = self.stats[name].percentile(50)
+            return (p50 is None, p50 or 0.0)
+
+        healthy = sorted([n for n in self.providers if self.stats[n].is_healthy()], key=latency_key)
+        # Unhealthy providers stay as a last resort rather than failing outright
+        unhealthy = sorted([n for n in self.providers if not self.stats[n].is_healthy()], key=latency_key)
+        return healthy + unhealthy
+
+    def hedge_delay(self, name: str) -> float:
+        stats = self.stats[name]
+        if len(stats.latencies) < MIN_SAMPLES_FOR_HEDGE:
+            # Too few samples for a percentile, so only a provider that is clearly stalled is hedged
+            return llm_settings.hedge_initial_delay
+        return max(llm_settings.hedge_min_delay, stats.percentile(llm_settings.hedge_percentile))
+
+    def attempt_timeout(self, remaining: float, providers_left: int) -> float:
+        """Time one provider attempt may take out of the remaining budget.
+
+        The last provider left may use all of it; earlier ones are cut off
+        after LLM_ATTEMPT_TIMEOUT so a stalled provider leaves time to fall back.
+        """
+        if providers_left <= 1:
+            return remaining
+        return min(remaining, llm_settings.attempt_timeout)
+
+    async def _call(self, name: str, prompt: str, **options) -> str:
+        start = time.monotonic()
+        try:
+            result = await self.providers[name].generate(prompt, **options)
+            if not result:
+                raise ValueError("empty response")
+        except asyncio.CancelledError:
+            # A cancelled hedge loser is not a provider failure
+            raise
+        except Exception:
+            self.stats[name].record_failure()
+            raise
+        self.stats[name].record_success(time.monotonic() - start)
+        return result
+
+    async def _hedged(self, primary: str, secondary: str, prompt: str, tried: set, **options) -> str:
+        tried.add(primary)
+        primary_task = asyncio.create_task(self._call(primary, prompt, **options))
+        names = {primary_task: primary}
+        started = {primary_task: time.monotonic()}
+        pending = {primary_task}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=self.hedge_delay(primary))
+            if done:
+                return primary_task.result()
+
+            logger.info(f"LLM provider {primary} is slow, hedging with {secondary}")
+            tried.add(secondary)
+            secondary_task = asyncio.create_task(self._call(secondary, prompt, **options))
+            names[secondary_task], started[secondary_task] = secondary, time.monotonic()
+            pending.add(secondary_task)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        # The loser was at least this slow; without the sample a stalled
+                        # provider would never be measured and would stay ranked first
+                        for loser in pending:
+                            self.stats[names[loser]].record_censored(time.monotonic() - started[loser])
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def generate(self, prompt: str, timeout: float = None, **options) -> str:
+        """Generate with the best provider within timeout seconds; options (json_schema) go to the provider."""
+        ends_at = time.monotonic() + (timeout or llm_settings.timeout)
+        tried = set()
+        errors = []
+        while True:
+            order = [name for name in self.rank() if name not in tried]
+            remaining = ends_at - time.monotonic()
+            if not order or remaining <= 0:
+                break
+            primary = order[0]
+            hedged = llm_settings.hedge_enabled and len(order) > 1
+            # A hedged attempt already brings in the next provider if the first stalls
+            attempt_timeout = remaining if hedged else self.attempt_timeout(remaining, len(order))
+            try:
+                if hedged:
+                    call = self._hedged(primary, order[1], prompt, tried, timeout=attempt_timeout, **options)
+                else:
+                    tried.add(primary)
+                    call = self._call(primary, prompt, timeout=attempt_timeout, **options)
+                return await asyncio.wait_for(call, attempt_timeout)
+            except asyncio.TimeoutError:
+                self.stats[primary].record_failure()
+                logger.warning(f"LLM provider {primary} did not answer within {attempt_timeout:.0f}s, falling back")
+                errors.append(f"{primary}: timed out after {attempt_timeout:.0f}s")
+            except Exception as e:
+                logger.warning(f"LLM provider {primary} failed, falling back: {e}")
+                errors.append(f"{primary}: {e}")
+        raise RuntimeError(f"All LLM providers failed ({'; '.join(errors) or 'time budget spent'})")
+
+    async def stream(self, prompt: str, timeout: float = None, **options) -> AsyncIterator[str]:
+        """Stream from the best provider, falling back only if nothing was yielded yet.
+
+        Providers other than the last are given LLM_ATTEMPT_TIMEOUT to send
+        their first token, so a stalled one leaves time for the next.
+        """
+        ends_at = time.monotonic() + (timeout or llm_settings.timeout)
+        errors = []
+        ranked = self.rank()
+        for index, name in enumerate(ranked):
+            remaining = ends_at - time.monotonic()
+            if remaining <= 0:
+                break
+            start = time.monotonic()
+            stream = self.providers[name].stream(prompt, timeout=remaining, **options)
+            yielded = False
+            try:
+                try:
+                    first = await asyncio.wait_for(stream.__anext__(), self.attempt_timeout(remaining, len(ranked) - index))
+                except StopAsyncIteration:
+                    raise ValueError("empty response")
+                except asyncio.TimeoutError:
+                    raise TimeoutError("no first token in time")
+                yielded = True
+                yield first
+                async for token in stream:
+                    yield token
+            except Exception as e:
+                self.stats[name].record_failure()
+                if yielded:
+                    # Output from two providers cannot be spliced together
+                    raise
+                logger.warning(f"LLM provider {name} failed to stream, falling back: {e}")
+                errors.append(f"{name}: {e}")
+                continue
+            finally:
+                await stream.aclose()
+            self.stats[name].record_success(time.monotonic() - start)
+            return
+        raise RuntimeError(f"All LLM providers failed ({'; '.join(errors) or 'time budget spent'})")
+
+    def snapshot(self) -> List[dict]:
+        return [self.stats[name].snapshot() for name in self.providers]
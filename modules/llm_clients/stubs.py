@@ -0,0 +1,144 @@
+"""Local stand-ins for the Ollama and Groq HTTP APIs.
+
+They let the router, hedging and streaming be exercised offline. Each stub
+can inject latency, jitter, stalls and errors:
+
+    python -m modules.llm_clients.stubs ollama --port 11435 --latency 2 --stall-rate 0.1
+    python -m modules.llm_clients.stubs groq --port 11436 --latency 0.5
+
+Then point the app at them with OLLAMA_API_BASE=http://localhost:11435,
+GROQ_BASE_URL=http://localhost:11436, GROQ_API_KEY=stub and LLM_PROVIDER=auto.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+import uvicorn
+
+DEFAULT_RESPONSE = "CORRECT. The evidence provided supports the claim. (stub response)"
+DEFAULT_JSON_RESPONSE = '{"claims": []}'
+
+
+class StubBehaviour:
+    def __init__(self, latency: float = 0.5, jitter: float = 0.1, error_rate: float = 0.0,
+                 stall_rate: float = 0.0, stall_seconds: float = 600, response: str = DEFAULT_RESPONSE,
+                 json_response: str = DEFAULT_JSON_RESPONSE):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.stall_rate = stall_rate
+        self.stall_seconds = stall_seconds
+        self.response = response
+        self.json_response = json_response
+
+    async def wait(self):
+        """Sleep for the simulated processing time, or fail/stall as configured."""
+        if random.random() < self.error_rate:
+            raise HTTPException(status_code=503, detail="stub injected error")
+        if random.random() < self.stall_rate:
+            await asyncio.sleep(self.stall_seconds)
+        await asyncio.sleep(max(0.0, random.gauss(self.latency, self.jitter)))
+
+    def answer(self, prompt: str, json_mode: bool = False) -> str:
+        return self.json_response if json_mode else self.response
+
+    def tokens(self, text: str):
+        words = text.split(" ")
+        return [word if i == 0 else " " + word for i, word in enumerate(words)]
+
+
+def create_ollama_stub(behaviour: StubBehaviour, model: str = "gpt-oss:20b") -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/api/tags")
+    async def tags():
+        return {"models": [{"name": model}]}
+
+    @app.post("/api/generate")
+    async def generate(request: Request):
+        body = await request.json()
+        await behaviour.wait()
+        text = behaviour.answer(body.get("prompt", ""), json_mode=bool(body.get("format")))
+
+        if not body.get("stream", True):
+            return {"model": model, "response": text, "done": True}
+
+        async def lines():
+            for token in behaviour.tokens(text):
+                yield json.dumps({"model": model, "response": token, "done": False}) + "\n"
+                await asyncio.sleep(0.01)
+            yield json.dumps({"model": model, "response": "", "done": True}) + "\n"
+
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    return app
+
+
+def create_groq_stub(behaviour: StubBehaviour) -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/openai/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        prompt = body["messages"][-1]["content"]
+        await behaviour.wait()
+        text = behaviour.answer(prompt, json_mode=bool(body.get("response_format")))
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+
+        if not body.get("stream"):
+            return JSONResponse({
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": body.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            })
+
+        async def events():
+            for token in behaviour.tokens(text):
+                chunk = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": body.get("model"),
+                    "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}],
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+                await asyncio.sleep(0.01)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local LLM provider stub")
+    parser.add_argument("provider", choices=["ollama", "groq"])
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--latency", type=float, default=0.5, help="mean response latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.1, help="latency standard deviation in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 503")
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="fraction of requests that hang")
+    parser.add_argument("--stall-seconds", type=float, default=600)
+    parser.add_argument("--response", default=DEFAULT_RESPONSE, help="text returned for free-text prompts")
+    parser.add_argument("--json-response", default=DEFAULT_JSON_RESPONSE, help="text returned for JSON-mode prompts")
+    args = parser.parse_args()
+
+    behaviour = StubBehaviour(
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        stall_rate=args.stall_rate,
+        stall_seconds=args.stall_seconds,
+        response=args.response,
+        json_response=args.json_response,
+    )
+    app = create_ollama_stub(behaviour) if args.provider == "ollama" else create_groq_stub(behaviour)
+    uvicorn.run(app, host="127.0.0.1", port=args.port)
@@ -0,0 +1,70 @@
+"""Decoding audio for Whisper and splitting it into chunks at pauses.
+
+Audio is decoded the way Whisper does it (16 kHz mono float32 through
+ffmpeg), but without importing Whisper, so API workers that use the model
+server can split a reel themselves and send only the samples.
+"""
+import subprocess
+from typing import List, Tuple
+import numpy as np
+
+SAMPLE_RATE = 16000
+FRAME_SECONDS = 0.03
+# Energy is averaged over this many frames so a single quiet frame inside a word is not taken for a pause
+SMOOTHING_FRAMES = 10
+
+
+def load_audio(path: str) -> np.ndarray:
+    result = subprocess.run(
+        ["ffmpeg", "-nostdin", "-threads", "0", "-i", path, "-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le", "-ar", str(SAMPLE_RATE), "-"],
+        capture_output=True, check=True,
+    )
+    return np.frombuffer(result.stdout, np.int16).astype(np.float32) / 32768.0
+
+
+def frame_rms(audio: np.ndarray) -> np.ndarray:
+    """RMS level of consecutive FRAME_SECONDS frames."""
+    frame = int(SAMPLE_RATE * FRAME_SECONDS)
+    count = len(audio) // frame
+    return np.sqrt(np.mean(audio[:count * frame].reshape(count, frame) ** 2, axis=1))
+
+
+def frame_energy(audio: np.ndarray) -> np.ndarray:
+    """Frame RMS smoothed over SMOOTHING_FRAMES."""
+    energy = frame_rms(audio)
+    if len(energy) == 0:
+        return energy
+    window = min(SMOOTHING_FRAMES, len(energy))
+    return np.convolve(energy, np.ones(window) / window, mode="same")
+
+
+def active_ratio(audio: np.ndarray, silence_db: float) -> float:
+    """Share of frames louder than silence_db dBFS."""
+    energy = frame_rms(audio)
+    if len(energy) == 0:
+        return 0.0
+    return float(np.mean(20 * np.log10(np.maximum(energy, 1e-10)) > silence_db))
+
+
+def split_on_pauses(audio: np.ndarray, chunk_seconds: float, cut_window: float) -> List[Tuple[int, int]]:
+    """Sample ranges of at most chunk_seconds, each ending at the quietest point of its last cut_window seconds.
+
+    Cutting in a pause keeps words whole, so every chunk can be transcribed
+    on its own without losing or duplicating text at the boundary.
+    """
+    chunk = int(chunk_seconds * SAMPLE_RATE)
+    if not chunk or len(audio) <= chunk:
+        return [(0, len(audio))]
+
+    frame = int(SAMPLE_RATE * FRAME_SECONDS)
+    energy = frame_energy(audio)
+    ranges = []
+    start = 0
+    while len(audio) - start > chunk:
+        last = (start + chunk) // frame
+        first = max(start // frame + 1, last - int(cut_window / FRAME_SECONDS))
+        cut = (first + int(np.argmin(energy[first:last]))) * frame if first < last else start + chunk
+        ranges.append((start, cut))
+        start = cut
+    ranges.append((start, len(audio)))
+    return ranges
@@ -0,0 +1,186 @@
+"""Transcription backends.
+
+WHISPER_BACKEND selects the engine behind transcribe(), transcribe_samples()
+and no_speech_probability():
+
+* whisper - openai-whisper on PyTorch, the default.
+* ctranslate2 - the same Whisper weights converted for CTranslate2 and run
+  through faster-whisper, quantized to WHISPER_COMPUTE_TYPE (int8 by
+  default). It needs a fraction of the memory and CPU time on CPU-only nodes,
+  and it can decode chunks of different reels as one batch, which PyTorch
+  Whisper cannot.
+
+A backend transcribes either a file path or 16 kHz mono float32 samples and
+translates to English. Backends with `batched = True` implement
+transcribe_batch() for lists of chunks of at most 30 s; DecodeBatcher feeds
+it the chunks that different threads submit at about the same time.
+"""
+import logging
+import threading
+import time
+from typing import List, Optional, Tuple, Union
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Whisper's input window; longer chunks cannot be decoded in one batched step
+WINDOW_SAMPLES = 16000 * 30
+
+
+class WhisperBackend:
+    """openai-whisper on PyTorch."""
+
+    batched = False
+
+    def __init__(self, model_name: str, compute_type: str = None):
+        import whisper
+        self.model = whisper.load_model(model_name)
+
+    def transcribe(self, audio: Union[str, np.ndarray], prompt: Optional[str] = None) -> str:
+        return self.model.transcribe(audio, task="translate", initial_prompt=prompt)["text"]
+
+    def transcribe_batch(self, items: List[Tuple[np.ndarray, Optional[str]]]) -> List[str]:
+        return [self.transcribe(samples, prompt) for samples, prompt in items]
+
+    def no_speech_prob(self, samples: np.ndarray) -> float:
+        """Only the encoder and the first decoding step run, a fraction of transcribing the window."""
+        import whisper
+        model = self.model
+        mel = whisper.log_mel_spectrogram(whisper.pad_or_trim(samples), n_mels=getattr(model.dims, "n_mels", 80)).to(model.device)
+        options = whisper.DecodingOptions(task="translate", sample_len=1, without_timestamps=True, fp16=model.device.type == "cuda")
+        return float(whisper.decode(model, mel, options).no_speech_prob)
+
+
+class CTranslate2Backend:
+    """Quantized Whisper on CTranslate2, through faster-whisper."""
+
+    batched = True
+
+    def __init__(self, model_name: str, compute_type: str = "int8"):
+        from faster_whisper import WhisperModel
+        self.model = WhisperModel(model_name, device="cpu", compute_type=compute_type)
+
+    def transcribe(self, audio: Union[str, np.ndarray], prompt: Optional[str] = None) -> str:
+        segments, _ = self.model.transcribe(audio, task="translate", initial_prompt=prompt, beam_size=1)
+        return "".join(segment.text for segment in segments)
+
+    def tokenizers(self, encoder_output) -> list:
+        """A translate tokenizer per batch item, for the language detected in that item."""
+        from faster_whisper.tokenizer import Tokenizer
+        multilingual = self.model.model.is_multilingual
+        if not multilingual:
+            return [Tokenizer(self.model.hf_tokenizer, False)] * encoder_output.shape[0]
+        languages = [result[0][0][2:-2] for result in self.model.model.detect_language(encoder_output)]
+        return [Tokenizer(self.model.hf_tokenizer, True, task="translate", language=language) for language in languages]
+
+    def encode(self, chunks: List[np.ndarray]):
+        from faster_whisper.audio import pad_or_trim
+        features = np.stack([pad_or_trim(self.model.feature_extractor(samples)) for samples in chunks])
+        return self.model.encode(features)
+
+    def transcribe_batch(self, items: List[Tuple[np.ndarray, Optional[str]]]) -> List[str]:
+        if any(len(samples) > WINDOW_SAMPLES for samples, _ in items):
+            return [self.transcribe(samples, prompt) for samples, prompt in items]
+
+        # CTranslate2 needs <|startoftranscript|> at the same position in every
+        # prompt of a batch, so chunks with and without previous text are
+        # decoded separately and previous texts are cut to the shortest one
+        texts = [None] * len(items)
+        for prompted in (False, True):
+            group = [index for index, (_, prompt) in enumerate(items) if bool(prompt) == prompted]
+            if group:
+                for index, text in zip(group, self.decode([items[index] for index in group])):
+                    texts[index] = text
+        return texts
+
+    def decode(self, items: List[Tuple[np.ndarray, Optional[str]]]) -> List[str]:
+        encoder_output = self.encode([samples for samples, _ in items])
+        tokenizers = self.tokenizers(encoder_output)
+        previous = [tokenizer.encode(" " + prompt.strip()) if prompt else [] for tokenizer, (_, prompt) in zip(tokenizers, items)]
+        keep = min(min(len(tokens) for tokens in previous), self.model.max_length // 2 - 1)
+        prompts = [
+            self.model.get_prompt(tokenizer, tokens[len(tokens) - keep:], without_timestamps=True)
+            for tokenizer, tokens in zip(tokenizers, previous)
+        ]
+        results = self.model.model.generate(encoder_output, prompts, beam_size=1, max_length=self.model.max_length, suppress_blank=True)
+        return [tokenizer.decode(result.sequences_ids[0]) for tokenizer, result in zip(tokenizers, results)]
+
+    def no_speech_prob(self, samples: np.ndarray) -> float:
+        encoder_output = self.encode([samples[:WINDOW_SAMPLES]])
+        tokenizer = self.tokenizers(encoder_output)[0]
+        prompt = self.model.get_prompt(tokenizer, [], without_timestamps=True)
+        # max_length counts the prompt, so this stops after the first generated token
+        result = self.model.model.generate(encoder_output, [prompt], max_length=len(prompt) + 1, return_no_speech_prob=True)[0]
+        return float(result.no_speech_prob)
+
+
+BACKENDS = {
+    "whisper": WhisperBackend,
+    "ctranslate2": CTranslate2Backend,
+}
+
+
+def load_backend(name: str, model_name: str, compute_type: str):
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown WHISPER_BACKEND {name!r}, expected one of {', '.join(BACKENDS)}")
+    logger.info(f"Loading Whisper model {model_name} on the {name} backend")
+    return BACKENDS[name](model_name, compute_type)
+
+
+class DecodeBatcher:
+    """Runs chunks submitted from different threads through a batched backend together.
+
+    The thread that finds the decoder free waits up to max_wait for more
+    chunks, then decodes the oldest max_batch waiting chunks, its own among
+    them or not; threads whose chunk was not in that batch take the next one.
+    """
+
+    def __init__(self, backend, max_batch: int, max_wait: float):
+        self.backend = backend
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.pending: List[dict] = []
+        self.lock = threading.Lock()
+        # Held while a batch is collected and decoded, so one batch runs at a time
+        self.decoding = threading.Lock()
+        self.batches = 0
+        self.chunks = 0
+
+    def transcribe(self, samples: np.ndarray, prompt: Optional[str] = None) -> str:
+        item = {"samples": samples, "prompt": prompt, "done": threading.Event(), "text": None, "error": None}
+        with self.lock:
+            self.pending.append(item)
+        while not item["done"].is_set():
+            with self.decoding:
+                if not item["done"].is_set():
+                    self._run_batch()
+        if item["error"] is not None:
+            raise item["error"]
+        return item["text"]
+
+    def _run_batch(self):
+        with self.lock:
+            waiting = len(self.pending)
+        if waiting < self.max_batch and self.max_wait:
+            time.sleep(self.max_wait)
+        with self.lock:
+            batch, self.pending = self.pending[:self.max_batch], self.pending[self.max_batch:]
+        try:
+            texts = self.backend.transcribe_batch([(item["samples"], item["prompt"]) for item in batch])
+        except Exception as e:
+            for item in batch:
+                item["error"] = e
+                item["done"].set()
+            return
+        self.batches += 1
+        self.chunks += len(batch)
+        for item, text in zip(batch, texts):
+            item["text"] = text
+            item["done"].set()
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "chunks": self.chunks,
+            "avg_chunks_per_batch": round(self.chunks / self.batches, 2) if self.batches else 0.0,
+        }
@@ -0,0 +1,42 @@
+"""Message framing shared by the model server and its clients.
+
+A message is a JSON header followed by an optional binary payload (e.g. a
+float32 embedding matrix), each preceded by its length.
+"""
+import asyncio
+import json
+import socket
+import struct
+from typing import Tuple
+
+LENGTHS = struct.Struct("!II")
+
+
+def pack(header: dict, payload: bytes = b"") -> bytes:
+    encoded = json.dumps(header).encode()
+    return LENGTHS.pack(len(encoded), len(payload)) + encoded + payload
+
+
+async def read_message(reader: asyncio.StreamReader) -> Tuple[dict, bytes]:
+    header_size, payload_size = LENGTHS.unpack(await reader.readexactly(LENGTHS.size))
+    header = json.loads(await reader.readexactly(header_size))
+    payload = await reader.readexactly(payload_size) if payload_size else b""
+    return header, payload
+
+
+def recv_exactly(sock: socket.socket, size: int) -> bytes:
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ConnectionError("Model server closed the connection")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def recv_message(sock: socket.socket) -> Tuple[dict, bytes]:
+    header_size, payload_size = LENGTHS.unpack(recv_exactly(sock, LENGTHS.size))
+    header = json.loads(recv_exactly(sock, header_size))
+    payload = recv_exactly(sock, payload_size) if payload_size else b""
+    return header, payload
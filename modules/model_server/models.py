@@ -0,0 +1,121 @@
+"""Access to the Whisper and sentence-embedding models.
+
+Callers use encode(), transcribe(), transcribe_samples() and
+no_speech_probability(). When MODEL_SERVER_SOCKET is set the
+work is sent to the shared model server, so this process never imports torch
+or loads weights. Otherwise the models are loaded in-process on first use and
+kept for the life of the process. Transcription runs on the backend selected
+by WHISPER_BACKEND (see backends.py).
+"""
+import logging
+import socket
+import threading
+from typing import List, Optional
+import numpy as np
+from core.config import model_settings
+from modules.model_server.backends import DecodeBatcher, load_backend
+from modules.model_server.ipc import pack, recv_message
+
+logger = logging.getLogger(__name__)
+
+_load_lock = threading.Lock()
+_embedding_model = None
+_whisper_model = None
+_decode_batcher = None
+
+
+def get_embedding_model():
+    global _embedding_model
+    with _load_lock:
+        if _embedding_model is None:
+            from sentence_transformers import SentenceTransformer
+            logger.info(f"Loading embedding model {model_settings.embedding_model}")
+            _embedding_model = SentenceTransformer(model_settings.embedding_model)
+    return _embedding_model
+
+
+def get_whisper_model():
+    """The transcription backend, loaded on first use."""
+    global _whisper_model, _decode_batcher
+    with _load_lock:
+        if _whisper_model is None:
+            _whisper_model = load_backend(model_settings.whisper_backend, model_settings.whisper_model, model_settings.whisper_compute_type)
+            if _whisper_model.batched:
+                _decode_batcher = DecodeBatcher(_whisper_model, model_settings.whisper_max_batch, model_settings.whisper_batch_wait)
+    return _whisper_model
+
+
+def transcribe_chunk(samples: np.ndarray, prompt: Optional[str] = None) -> str:
+    """Transcribe samples in this process, batched with chunks from other threads when the backend can."""
+    model = get_whisper_model()
+    if _decode_batcher is not None:
+        return _decode_batcher.transcribe(samples, prompt)
+    return model.transcribe(samples, prompt)
+
+
+def decode_stats() -> dict:
+    return _decode_batcher.stats() if _decode_batcher is not None else {}
+
+
+def request(header: dict, payload: bytes = b""):
+    """Send one request to the model server and return its (header, payload) reply."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(model_settings.timeout)
+        sock.connect(model_settings.server_socket)
+        sock.sendall(pack(header, payload))
+        reply, reply_payload = recv_message(sock)
+    if "error" in reply:
+        raise RuntimeError(f"Model server error: {reply['error']}")
+    return reply, reply_payload
+
+
+def encode(texts: List[str], batch_size: int = 32, normalize_embeddings: bool = False, **kwargs) -> np.ndarray:
+    """Embed texts into a (len(texts), dim) float32 matrix."""
+    if not model_settings.server_socket:
+        return get_embedding_model().encode(
+            texts, batch_size=batch_size, show_progress_bar=False, normalize_embeddings=normalize_embeddings
+        )
+
+    reply, payload = request({"op": "encode", "texts": list(texts)})
+    vectors = np.frombuffer(payload, dtype=np.float32).reshape(reply["shape"])
+    if normalize_embeddings:
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.maximum(norms, 1e-12)
+    return vectors
+
+
+def transcribe(audio_path: str) -> str:
+    """Translate-transcribe an audio file to English text."""
+    if not model_settings.server_socket:
+        return get_whisper_model().transcribe(audio_path)
+
+    reply, _ = request({"op": "transcribe", "audio_path": audio_path})
+    return reply["text"]
+
+
+def transcribe_samples(samples: np.ndarray, prompt: Optional[str] = None) -> str:
+    """Translate-transcribe 16 kHz mono samples, e.g. one chunk of a longer clip.
+
+    prompt is the text before this chunk; Whisper uses it to keep names and
+    spelling consistent from one chunk to the next.
+    """
+    samples = np.ascontiguousarray(samples, dtype=np.float32)
+    if not model_settings.server_socket:
+        return transcribe_chunk(samples, prompt)
+
+    reply, _ = request({"op": "transcribe_samples", "prompt": prompt}, samples.tobytes())
+    return reply["text"]
+
+
+def detect_no_speech(samples: np.ndarray) -> float:
+    """Whisper's probability that the first 30 s window of samples contains no speech."""
+    return get_whisper_model().no_speech_prob(samples)
+
+
+def no_speech_probability(samples: np.ndarray) -> float:
+    samples = np.ascontiguousarray(samples, dtype=np.float32)
+    if not model_settings.server_socket:
+        return detect_no_speech(samples)
+
+    reply, _ = request({"op": "no_speech_prob"}, samples.tobytes())
+    return reply["no_speech_prob"]
@@ -0,0 +1,182 @@
+"""Model server: one process owning Whisper and the embedding model for all API workers.
+
+    python -m modules.model_server.server --socket /tmp/instacheck-models.sock
+
+Workers started with MODEL_SERVER_SOCKET pointing at the socket send their
+encode and transcribe calls here instead of loading the models themselves.
+Encode requests arriving from different workers within MODEL_SERVER_BATCH_WAIT
+are run as one batch of up to MODEL_SERVER_MAX_BATCH texts. PyTorch Whisper
+cannot batch different files, so its transcriptions are queued and run
+WHISPER_CONCURRENCY at a time; with WHISPER_BACKEND=ctranslate2, chunks from
+different workers are decoded together in batches of up to WHISPER_MAX_BATCH.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time
+from typing import List, Tuple
+import numpy as np
+from core.config import model_settings, concurrency_settings
+from modules.model_server.ipc import pack, read_message
+from modules.model_server.models import get_embedding_model, get_whisper_model, detect_no_speech, transcribe_chunk, decode_stats
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    datefmt='%Y-%m-%d %H:%M:%S'
+)
+logger = logging.getLogger(__name__)
+
+
+class EncodeBatcher:
+    """Collects encode requests for a short window and runs them through the model together."""
+
+    def __init__(self, max_batch: int, max_wait: float):
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.batches = 0
+        self.requests = 0
+        self.texts = 0
+
+    async def encode(self, texts: List[str]) -> np.ndarray:
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((texts, future))
+        return await future
+
+    async def next_batch(self) -> List[Tuple[List[str], asyncio.Future]]:
+        loop = asyncio.get_running_loop()
+        items = [await self.queue.get()]
+        size = len(items[0][0])
+        closes_at = loop.time() + self.max_wait
+        while size < self.max_batch:
+            remaining = closes_at - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self.queue.get(), remaining)
+            except asyncio.TimeoutError:
+                break
+            items.append(item)
+            size += len(item[0])
+        return items
+
+    async def run(self):
+        model = get_embedding_model()
+        while True:
+            items = await self.next_batch()
+            texts = [text for item_texts, _ in items for text in item_texts]
+            try:
+                vectors = await asyncio.to_thread(model.encode, texts, batch_size=32, show_progress_bar=False)
+            except Exception as e:
+                for _, future in items:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.requests += len(items)
+            self.texts += len(texts)
+            offset = 0
+            for item_texts, future in items:
+                if not future.done():
+                    future.set_result(vectors[offset:offset + len(item_texts)])
+                offset += len(item_texts)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "requests": self.requests,
+            "texts": self.texts,
+            "avg_requests_per_batch": round(self.requests / self.batches, 2) if self.batches else 0.0,
+        }
+
+
+class ModelServer:
+    def __init__(self):
+        self.batcher = EncodeBatcher(model_settings.max_batch, model_settings.batch_wait)
+        self.whisper_slots = asyncio.Semaphore(concurrency_settings.whisper_limit)
+        self.transcriptions = 0
+
+    async def handle(self, header: dict, payload: bytes) -> bytes:
+        op = header.get("op")
+        if op == "encode":
+            vectors = np.asarray(await self.batcher.encode(header["texts"]), dtype=np.float32)
+            return pack({"shape": list(vectors.shape)}, vectors.tobytes())
+        if op == "transcribe":
+            async with self.whisper_slots:
+                started = time.perf_counter()
+                text = await asyncio.to_thread(get_whisper_model().transcribe, header["audio_path"])
+            self.transcriptions += 1
+            logger.info(f"Transcribed {os.path.basename(header['audio_path'])} in {time.perf_counter() - started:.1f}s")
+            return pack({"text": text})
+        if op == "transcribe_samples":
+            samples = np.frombuffer(payload, dtype=np.float32).copy()
+            if get_whisper_model().batched:
+                # The decode batcher runs one batch at a time, so chunks must reach it concurrently to be batched
+                text = await asyncio.to_thread(transcribe_chunk, samples, header.get("prompt"))
+            else:
+                async with self.whisper_slots:
+                    text = await asyncio.to_thread(transcribe_chunk, samples, header.get("prompt"))
+            self.transcriptions += 1
+            return pack({"text": text})
+        if op == "no_speech_prob":
+            samples = np.frombuffer(payload, dtype=np.float32).copy()
+            async with self.whisper_slots:
+                probability = await asyncio.to_thread(detect_no_speech, samples)
+            return pack({"no_speech_prob": probability})
+        if op == "stats":
+            return pack({"encode": self.batcher.stats(), "transcriptions": self.transcriptions, "decode": decode_stats()})
+        if op == "ping":
+            return pack({"ok": True})
+        return pack({"error": f"Unknown op: {op}"})
+
+    async def serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    header, payload = await read_message(reader)
+                except asyncio.IncompleteReadError:
+                    return
+                try:
+                    reply = await self.handle(header, payload)
+                except Exception as e:
+                    logger.error(f"Model server request {header.get('op')} failed: {e}")
+                    reply = pack({"error": str(e)})
+                writer.write(reply)
+                await writer.drain()
+        finally:
+            writer.close()
+
+
+async def main(socket_path: str):
+    server = ModelServer()
+    # Load both models before accepting connections so the first request is not slow
+    await asyncio.to_thread(get_embedding_model)
+    await asyncio.to_thread(get_whisper_model)
+
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    unix_server = await asyncio.start_unix_server(server.serve_connection, path=socket_path)
+    os.chmod(socket_path, 0o600)
+    batcher = asyncio.create_task(server.batcher.run())
+    logger.info(f"Model server listening on {socket_path}")
+    try:
+        async with unix_server:
+            await unix_server.serve_forever()
+    finally:
+        batcher.cancel()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve Whisper and embedding models to API workers over a unix socket")
+    parser.add_argument("--socket", default=model_settings.server_socket or "/tmp/instacheck-models.sock")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(main(args.socket))
+    except KeyboardInterrupt:
+        print("\nModel server stopped by user")
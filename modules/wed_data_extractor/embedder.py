@@ -1,7 +1,5 @@
-from sentence_transformers import SentenceTransformer
-from sklearn.neighbors import NearestNeighbors
+from modules.model_server.models import encode
 
-model = SentenceTransformer('all-MiniLM-L6-v2')
 nn_model = None
 doc_texts = []
 embeddings_cache = None
@@ -13,15 +11,16 @@ def embed_and_search(docs, query):
     if len(doc_texts) == 0:
         return []
     
-    embeddings_cache = model.encode(doc_texts)
+    embeddings_cache = encode(doc_texts)
     
+    from sklearn.neighbors import NearestNeighbors
     nn_model = NearestNeighbors(
         n_neighbors=min(5, len(doc_texts)), 
         metric='cosine'
     )
     nn_model.fit(embeddings_cache)
     
-    q_embed = model.encode([query])
+    q_embed = encode([query])
     distances, indices = nn_model.kneighbors(q_embed)
     
     return [doc_texts[i] for i in indices[0] if 0 <= i < len(doc_texts)]
@@ -0,0 +1,93 @@
+import logging
+import re
+from typing import Dict, List
+import numpy as np
+from core.config import evidence_settings
+from core.singleflight import SharedCache
+from modules.wed_data_extractor.relevant_content_extractor import encode_texts
+
+logger = logging.getLogger(__name__)
+
+SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+")
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, int(len(text) / evidence_settings.chars_per_token))
+
+
+def split_sentences(text: str) -> List[str]:
+    sentences = [s.strip() for s in SENTENCE_SPLIT.split(text or "")]
+    return [s for s in sentences if len(s) >= evidence_settings.min_sentence_chars]
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12)
+
+
+def truncate_to_budget(results: List[Dict], token_budget: int) -> List[Dict]:
+    """Whole snippets in retrieval order, the last one cut short, until the budget is spent."""
+    truncated = []
+    chars_left = int(token_budget * evidence_settings.chars_per_token)
+    for result in results:
+        snippet = result.get('snippet')
+        if not snippet or chars_left <= 0:
+            continue
+        truncated.append({"url": result['url'], "text": snippet[:chars_left]})
+        chars_left -= len(snippet)
+    return truncated
+
+
+async def compress_evidence(claim: str, results: List[Dict], token_budget: int = None,
+                            query_embedding=None, shared: SharedCache = None) -> List[Dict]:
+    """Pack the sentences most relevant to the claim into a token budget.
+
+    Sentences from every retrieved snippet are scored by cosine similarity to
+    the claim, near-identical sentences across sources are dropped, and the
+    best ones are packed greedily until the budget is spent. Returns one
+    {"url", "text"} entry per source that contributed, in retrieval order.
+
+    query_embedding is the claim's embedding from retrieval, so it is not
+    encoded twice; sentences are encoded through the batch's shared cache.
+    """
+    token_budget = token_budget or evidence_settings.token_budget
+
+    candidates = []
+    for source_idx, result in enumerate(results):
+        for sentence_idx, sentence in enumerate(split_sentences(result.get('snippet', ''))):
+            candidates.append((source_idx, sentence_idx, sentence))
+
+    if not candidates:
+        return truncate_to_budget(results, token_budget)
+
+    try:
+        sentence_embeddings = normalize(await encode_texts([c[2] for c in candidates], shared))
+        if query_embedding is None:
+            query_embedding = (await encode_texts([claim], shared))[0]
+        claim_embedding = normalize(query_embedding)
+    except Exception as e:
+        logger.error(f"Evidence compression failed, using truncated snippets: {e}")
+        return truncate_to_budget(results, token_budget)
+
+    scores = sentence_embeddings @ claim_embedding
+
+    selected = []
+    used_tokens = 0
+    for idx in np.argsort(-scores):
+        tokens = estimate_tokens(candidates[idx][2])
+        if used_tokens + tokens > token_budget:
+            continue
+        if selected and np.max(sentence_embeddings[selected] @ sentence_embeddings[idx]) >= evidence_settings.dedupe_threshold:
+            continue
+        selected.append(idx)
+        used_tokens += tokens
+
+    # Regroup by source so attribution survives, keeping the original sentence order
+    by_source = {}
+    for idx in sorted(selected, key=lambda i: (candidates[i][0], candidates[i][1])):
+        by_source.setdefault(candidates[idx][0], []).append(candidates[idx][2])
+
+    compressed = [{"url": results[source_idx]['url'], "text": " ".join(sentences)}
+                  for source_idx, sentences in by_source.items()]
+    logger.info(f"Compressed evidence from {len(candidates)} to {len(selected)} sentences (~{used_tokens} tokens)")
+    return compressed
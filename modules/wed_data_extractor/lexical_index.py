@@ -0,0 +1,120 @@
+"""BM25 over evidence passages, and the optional local corpus.
+
+MiniLM similarity blurs exactly what claims hinge on (numbers, names,
+dates), so passages are also scored by BM25 and the two are fused in
+relevant_content_extractor. The index is a sparse term-passage matrix of
+BM25 weights; its columns are the posting lists, so scoring a query sums the
+columns of its terms in one vectorized operation.
+
+RETRIEVAL_CORPUS points at reference material kept on disk: a .jsonl file of
+{"url", "text"} objects or a directory of .txt and .md files. It is split
+into passages and indexed once per process; for each claim its best BM25
+matches join the fetched pages as candidates.
+"""
+import json
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+import numpy as np
+from core.config import retrieval_settings
+
+logger = logging.getLogger(__name__)
+
+# Unlike CountVectorizer's default, one-character tokens such as "5" are kept
+TOKEN_PATTERN = r"(?u)\b\w+\b"
+K1 = 1.5
+B = 0.75
+
+# Corpus documents are cut into passages of about the length of a page snippet
+PASSAGE_CHARS = 1000
+
+_corpus = None
+_corpus_lock = threading.Lock()
+
+
+class BM25Index:
+    def __init__(self, texts: List[str]):
+        from sklearn.feature_extraction.text import CountVectorizer
+        self.size = len(texts)
+        # Without stop words, a passage sharing only "the" and "of" with a claim scores 0
+        self.vectorizer = CountVectorizer(token_pattern=TOKEN_PATTERN, stop_words="english", dtype=np.float32)
+        try:
+            counts = self.vectorizer.fit_transform(texts).tocsc()
+        except ValueError:
+            # No passage has a word that is not a stop word
+            self.weights = None
+            return
+
+        lengths = np.asarray(counts.sum(axis=1)).ravel()
+        document_frequency = np.diff(counts.indptr)
+        idf = np.log((self.size - document_frequency + 0.5) / (document_frequency + 0.5) + 1).astype(np.float32)
+
+        # Turn every stored term count into its BM25 weight in place
+        rows = counts.indices
+        columns = np.repeat(np.arange(counts.shape[1]), document_frequency)
+        norm = K1 * (1 - B + B * lengths / max(lengths.mean(), 1))
+        counts.data = idf[columns] * counts.data * (K1 + 1) / (counts.data + norm[rows])
+        self.weights = counts
+
+    def scores(self, query: str) -> np.ndarray:
+        """BM25 score of every passage for the query, 0 for passages sharing no term with it."""
+        if self.weights is None:
+            return np.zeros(self.size, dtype=np.float32)
+        analyze = self.vectorizer.build_analyzer()
+        vocabulary = self.vectorizer.vocabulary_
+        terms = sorted({vocabulary[token] for token in analyze(query) if token in vocabulary})
+        if not terms:
+            return np.zeros(self.size, dtype=np.float32)
+        return np.asarray(self.weights[:, terms].sum(axis=1)).ravel()
+
+
+def split_passages(text: str) -> List[str]:
+    passages, current = [], ""
+    for word in text.split():
+        if current and len(current) + len(word) + 1 > PASSAGE_CHARS:
+            passages.append(current)
+            current = word
+        else:
+            current = f"{current} {word}" if current else word
+    if current:
+        passages.append(current)
+    return passages
+
+
+def read_corpus(path: Path) -> List[Dict[str, str]]:
+    documents = []
+    if path.is_dir():
+        for file in sorted(path.rglob("*")):
+            if file.suffix.lower() in (".txt", ".md") and file.is_file():
+                documents.append({"url": file.resolve().as_uri(), "text": file.read_text(errors="replace")})
+    else:
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    documents.append({"url": entry["url"], "text": entry["text"]})
+    return [{"url": doc["url"], "text": passage} for doc in documents for passage in split_passages(doc["text"])]
+
+
+def load_corpus() -> Optional[dict]:
+    """The local corpus passages and their index, built on first use; None if no corpus is configured."""
+    global _corpus
+    if not retrieval_settings.corpus_path:
+        return None
+    with _corpus_lock:
+        if _corpus is None:
+            passages = read_corpus(Path(retrieval_settings.corpus_path))
+            _corpus = {"passages": passages, "index": BM25Index([p["text"] for p in passages])}
+            logger.info(f"Indexed {len(passages)} passages of the local corpus {retrieval_settings.corpus_path}")
+    return _corpus
+
+
+def corpus_candidates(query: str, limit: int) -> List[Dict[str, str]]:
+    """The corpus passages that match the query best by BM25, for ranking with the fetched pages."""
+    corpus = load_corpus()
+    if not corpus or not corpus["passages"] or limit <= 0:
+        return []
+    scores = corpus["index"].scores(query)
+    best = np.argsort(-scores)[:limit]
+    return [corpus["passages"][i] for i in best if scores[i] > 0]
@@ -0,0 +1,115 @@
+"""Cache of scraped pages' cleaned text, kept zlib-compressed in the store.
+
+Pages are keyed by their normalized URL. A page is served without any
+request until it goes stale: after its Cache-Control max-age or Expires
+(capped at PAGE_CACHE_MAX_TTL), or PAGE_CACHE_DEFAULT_TTL when it sends
+neither. A stale page is revalidated with If-None-Match / If-Modified-Since
+from its ETag and Last-Modified, so an unchanged page costs a 304 and no
+body. Pages marked no-store are not kept. Once the compressed text takes
+more than PAGE_CACHE_MAX_BYTES, the least recently used pages are evicted.
+"""
+import logging
+import time
+import zlib
+from email.utils import parsedate_to_datetime
+from typing import Mapping, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+from core import store
+from core.config import page_cache_settings
+from core.metrics import PAGE_CACHE_REQUESTS, PAGE_CACHE_EVICTIONS
+
+logger = logging.getLogger(__name__)
+
+# Query parameters that only track where a visitor came from
+TRACKING_PARAMS = ("utm_", "fbclid", "gclid", "mc_cid", "mc_eid")
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def normalize_url(url: str) -> str:
+    """The same page under one key: lowercase scheme and host, no default port, fragment or tracking parameters, sorted query."""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+    query = sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not key.lower().startswith(TRACKING_PARAMS)
+    )
+    return urlunsplit((scheme, host, parts.path or "/", urlencode(query), ""))
+
+
+def fresh_until(headers: Mapping[str, str], now: float) -> Optional[float]:
+    """Until when a response may be served without revalidating, or None if it must not be stored."""
+    directives = {}
+    for directive in (headers.get("cache-control") or "").lower().split(","):
+        name, _, value = directive.strip().partition("=")
+        directives[name] = value.strip('"')
+    if "no-store" in directives or "private" in directives:
+        return None
+    if "no-cache" in directives:
+        return now
+
+    lifetime = None
+    for name in ("s-maxage", "max-age"):
+        if directives.get(name, "").isdigit():
+            lifetime = int(directives[name])
+            break
+    if lifetime is None and headers.get("expires"):
+        try:
+            lifetime = parsedate_to_datetime(headers["expires"]).timestamp() - now
+        except (TypeError, ValueError):
+            # An invalid Expires means already expired
+            lifetime = 0
+    if lifetime is None:
+        lifetime = page_cache_settings.default_ttl
+    return now + max(0, min(lifetime, page_cache_settings.max_ttl))
+
+
+def lookup(url: str) -> Optional[dict]:
+    """The cached page with its text decompressed and whether it is still fresh, or None."""
+    if not page_cache_settings.enabled:
+        return None
+    page = store.get_page(normalize_url(url))
+    if page is None:
+        return None
+    page["text"] = zlib.decompress(page["text"]).decode()
+    page["fresh"] = page["fresh_until"] > time.time()
+    return page
+
+
+def conditional_headers(page: Optional[dict]) -> dict:
+    """Headers that let the server answer 304 if the cached page is still current."""
+    headers = {}
+    if page and page.get("etag"):
+        headers["If-None-Match"] = page["etag"]
+    if page and page.get("last_modified"):
+        headers["If-Modified-Since"] = page["last_modified"]
+    return headers
+
+
+def record(url: str, outcome: str, headers: Mapping[str, str] = None):
+    """Count a lookup; hits and revalidations also mark the page as used."""
+    PAGE_CACHE_REQUESTS.labels(outcome=outcome).inc()
+    if outcome == "hit":
+        store.touch_page(normalize_url(url))
+    elif outcome == "revalidated":
+        # A 304 carries the page's current caching headers
+        now = time.time()
+        store.touch_page(normalize_url(url), fresh_until(headers or {}, now) or now)
+
+
+def save(url: str, text: str, headers: Mapping[str, str]):
+    """Store a page fetched in full, unless its headers forbid it."""
+    if not page_cache_settings.enabled:
+        return
+    until = fresh_until(headers, time.time())
+    if until is None:
+        return
+    store.save_page(
+        normalize_url(url), zlib.compress(text.encode()), headers.get("etag"), headers.get("last-modified"), until
+    )
+    evicted = store.evict_pages(page_cache_settings.max_bytes)
+    if evicted:
+        PAGE_CACHE_EVICTIONS.inc(evicted)
+        logger.info(f"Evicted {evicted} cached pages to stay within {page_cache_settings.max_bytes} bytes")
@@ -1,20 +1,49 @@
 from typing import Dict, Any
+import json
 from modules.wed_data_extractor.search import get_search_results
 from modules.wed_data_extractor.scraper import scrape_all_urls
 from modules.wed_data_extractor.embedder import embed_and_search
 from modules.wed_data_extractor.queryOptimizer import optimize_query
 from modules.wed_data_extractor.relevant_content_extractor import relevant_content_extractor
 from fastapi import WebSocket
+from core.metrics import StageTimings
+from core.singleflight import SharedCache
+from core.concurrency import http_pool
+from core.config import deadline_settings
+from core.deadline import Deadline
 
-async def get_wed_data(query: str,websocket: WebSocket = None) -> Dict[str, Any]:
+# Search is cheap compared to scraping, so it never gets more than this
+SEARCH_TIMEOUT = 10
+
+async def get_wed_data(query: str,websocket: WebSocket = None, timings: StageTimings = None, shared: SharedCache = None, deadline: Deadline = None) -> Dict[str, Any]:
     if not query or not isinstance(query, str):
         return {"summary": [], "sources": [], "error": "Invalid query"}
+    timings = timings or StageTimings()
     
-    optimized_query = optimize_query(query)
-    urls = get_search_results(optimized_query)
+    with timings.stage("search") as stage:
+        optimized_query = optimize_query(query)
+        max_results = optimized_query.get('max_results') or 10
+        search_timeout = SEARCH_TIMEOUT
+        if deadline:
+            # Only scrape as many pages as the remaining budget can pay for
+            max_results = deadline.fan_out(max_results, deadline_settings.seconds_per_page, minimum=3)
+            search_timeout = deadline.timeout(SEARCH_TIMEOUT)
+        search_timeout = max(1, int(search_timeout))
+        if shared is None:
+            optimized_query['max_results'] = max_results
+            urls = await http_pool.run_in_thread(get_search_results, optimized_query, search_timeout)
+        else:
+            # Identical searches across a batch are only sent once. The key leaves out
+            # the budget-dependent limit, so the full result list is shared and each
+            # check takes as many URLs as its own budget allows
+            key = ("search", json.dumps(optimized_query, sort_keys=True))
+            stage["cache"] = "hit" if shared.has(key) else "miss"
+            urls = await shared.run(key, lambda: http_pool.run_in_thread(get_search_results, optimized_query, search_timeout))
+        urls = urls[:max_results]
+        stage["bytes"] = sum(len(url) for url in urls)
     
     if not urls:
         return {"summary": [], "sources": [], "error": "No search results found"}
-    results = await relevant_content_extractor(urls, query,websocket=websocket)
+    results, query_embedding = await relevant_content_extractor(urls, query,websocket=websocket, timings=timings, shared=shared, deadline=deadline)
 
-    return {"sources": urls , "results": results}
+    return {"sources": urls , "results": results, "query_embedding": query_embedding}
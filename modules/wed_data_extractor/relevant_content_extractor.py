@@ -1,65 +1,148 @@
 import httpx
 from bs4 import BeautifulSoup
-from sentence_transformers import SentenceTransformer
-from sklearn.neighbors import NearestNeighbors
 import asyncio
 import json
+import numpy as np
 from fastapi import WebSocket
-
-model = SentenceTransformer('all-MiniLM-L6-v2')
+from core.metrics import StageTimings
+from core.singleflight import SharedCache
+from core.concurrency import embedding_pool, http_pool
+from core import outbound
+from modules.wed_data_extractor import page_cache
+from modules.wed_data_extractor.lexical_index import BM25Index, corpus_candidates
+from core.config import retrieval_settings
+from core.deadline import Deadline
+from modules.model_server.models import encode
 
 def clean_text(html):
     soup = BeautifulSoup(html, 'html.parser')
     return ' '.join(soup.stripped_strings)
 
-async def fetch_url(client, url,websocket:WebSocket=None):
-    """Fetch a single URL asynchronously and return cleaned text."""
+# Per-page fetch timeout when no deadline is given
+FETCH_TIMEOUT = 10
+
+async def fetch_url(client, url,websocket:WebSocket=None, timeout:float=FETCH_TIMEOUT):
+    """Fetch a single URL asynchronously and return cleaned text.
+
+    Fresh pages come from the page cache without a request; stale ones are
+    revalidated, and served from the cache if the site cannot be reached or
+    answers with an error. Error pages are never returned as evidence.
+    """
+    cached = None
     try:
         if websocket:
             await websocket.send_text(json.dumps({"step": "processing", "message": f"Reading: {url}"}))
-        resp = await client.get(url, timeout=10)
+        cached = page_cache.lookup(url)
+        if cached and cached["fresh"]:
+            page_cache.record(url, "hit")
+            return {"url": url, "text": cached["text"], "cache": "hit"}
+
+        async def get():
+            async with http_pool.acquire():
+                return await client.get(url, timeout=timeout, headers=page_cache.conditional_headers(cached))
+
+        # Sites that keep failing are skipped until their breaker lets a trial through
+        resp = await outbound.pages.for_url(url).call_async(get)
+        if cached and resp.status_code == 304:
+            page_cache.record(url, "revalidated", resp.headers)
+            return {"url": url, "text": cached["text"], "cache": "revalidated"}
+        if resp.status_code != 200:
+            # A 429, 5xx or 404 body is an error page, not evidence; the last good copy is
+            if cached:
+                page_cache.record(url, "stale")
+                return {"url": url, "text": cached["text"], "cache": "stale"}
+            page_cache.record(url, "miss")
+            return None
         text = clean_text(resp.text)
-        return {"url": url, "text": text}
+        page_cache.record(url, "miss")
+        page_cache.save(url, text, resp.headers)
+        return {"url": url, "text": text, "cache": "miss"}
     except Exception:
+        if cached:
+            page_cache.record(url, "stale")
+            return {"url": url, "text": cached["text"], "cache": "stale"}
         return None
 
-async def relevant_content_extractor(urls, query, top_k=5,websocket:WebSocket=None):
-    """Scrapes URLs concurrently, embeds, and returns relevant content with similarity scores."""
+async def encode_texts(texts, shared: SharedCache = None):
+    """Embed texts off the event loop, reusing embeddings already computed for the batch."""
+    if shared is None:
+        return await embedding_pool.run_in_thread(encode, texts, batch_size=8)
+
+    missing = list(dict.fromkeys(t for t in texts if t not in shared.embeddings))
+    if missing:
+        vectors = await embedding_pool.run_in_thread(encode, missing, batch_size=8)
+        shared.embeddings.update(zip(missing, vectors))
+    return np.array([shared.embeddings[t] for t in texts])
+
+def cosine_scores(embeddings, query_embedding) -> np.ndarray:
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    query_embedding = np.asarray(query_embedding, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=1) * np.linalg.norm(query_embedding)
+    return embeddings @ query_embedding / np.maximum(norms, 1e-12)
+
+def fuse_scores(vector_scores, lexical_scores) -> np.ndarray:
+    """Weighted sum of cosine similarity and BM25 scaled so the best passage scores 1."""
+    best = lexical_scores.max() if len(lexical_scores) else 0
+    lexical = lexical_scores / best if best > 0 else np.zeros_like(vector_scores)
+    return retrieval_settings.vector_weight * vector_scores + retrieval_settings.lexical_weight * lexical
+
+async def relevant_content_extractor(urls, query, top_k=5,websocket:WebSocket=None, timings:StageTimings=None, shared:SharedCache=None, deadline:Deadline=None):
+    """Scrapes URLs concurrently and returns the passages most relevant to the query.
+
+    Passages are ranked by MiniLM cosine similarity and BM25 fused with
+    RETRIEVAL_VECTOR_WEIGHT and RETRIEVAL_LEXICAL_WEIGHT. Returns the
+    passages and the query's embedding (None if nothing was fetched), which
+    evidence compression reuses.
+    """
+    timings = timings or StageTimings()
+    # Leave half of what is left for embedding, verification and the verdict
+    timeout = deadline.timeout(FETCH_TIMEOUT, share=0.5) if deadline else FETCH_TIMEOUT
+
     # 1. Scrape pages concurrently
-    async with httpx.AsyncClient() as client:
-        tasks = [fetch_url(client, url,websocket=websocket) for url in urls]
-        docs = await asyncio.gather(*tasks)
+    with timings.stage("scrape") as stage:
+        async with httpx.AsyncClient() as client:
+            if shared is None:
+                tasks = [fetch_url(client, url,websocket=websocket, timeout=timeout) for url in urls]
+            else:
+                # Pages already fetched for another reel in the batch are reused
+                tasks = [shared.run(("page", url), lambda url=url: fetch_url(client, url,websocket=websocket, timeout=timeout)) for url in urls]
+            docs = await asyncio.gather(*tasks)
 
-    # Filter out failed fetches
-    docs = [doc for doc in docs if doc]
+        # Filter out failed fetches
+        docs = [doc for doc in docs if doc]
+        stage["bytes"] = sum(len(doc['text']) for doc in docs)
+        stage["pages"] = {outcome: sum(doc["cache"] == outcome for doc in docs) for outcome in ("hit", "revalidated", "miss", "stale")}
+        stage["cache"] = "hit" if docs and not stage["pages"]["miss"] else "miss"
 
-    if not docs:
-        return []
+    # The local corpus's best matches for the claim compete with the fetched pages
+    if retrieval_settings.corpus_path:
+        corpus_docs = await embedding_pool.run_in_thread(corpus_candidates, query, retrieval_settings.corpus_candidates)
+        docs += [{**doc, "cache": "corpus"} for doc in corpus_docs]
 
-    # 2. Prepare embeddings
-    doc_texts = [doc['text'][:1000] for doc in docs]  
-    embeddings = model.encode(doc_texts, batch_size=8, show_progress_bar=False)
+    if not docs:
+        return [], None
 
-    # 3. Fit Nearest Neighbors
-    nn_model = NearestNeighbors(
-        n_neighbors=min(top_k, len(doc_texts)), 
-        metric='cosine'
-    )
-    nn_model.fit(embeddings)
+    with timings.stage("embed") as stage:
+        # 2. Embed the passages and the query
+        doc_texts = [doc['text'][:1000] for doc in docs]
+        embeddings = await encode_texts(doc_texts, shared)
+        q_embed = await encode_texts([query], shared)
+        vector_scores = cosine_scores(embeddings, q_embed[0])
+        stage["bytes"] = sum(len(text) for text in doc_texts)
 
-    # 4. Query embedding
-    q_embed = model.encode([query])
-    distances, indices = nn_model.kneighbors(q_embed)
+    with timings.stage("lexical") as stage:
+        # 3. Score the same passages by BM25, for exact numbers, names and dates
+        lexical_scores = BM25Index(doc_texts).scores(query)
+        stage["bytes"] = sum(len(text) for text in doc_texts)
 
-    # 5. Collect results with scores
+    # 4. Collect the best passages by fused score
+    scores = fuse_scores(vector_scores, lexical_scores)
     results = []
-    for idx, dist in zip(indices[0], distances[0]):
-        if 0 <= idx < len(doc_texts):
-            similarity = float(1 - dist) 
-            results.append({
-                "url": docs[idx]['url'],
-                "snippet": doc_texts[idx],
-                "score": round(similarity, 4)
-            })
-
-    return results
+    for idx in np.argsort(-scores, kind="stable")[:top_k]:
+        results.append({
+            "url": docs[idx]['url'],
+            "snippet": doc_texts[idx],
+            "score": round(float(scores[idx]), 4)
+        })
+
+    return results, q_embed[0]
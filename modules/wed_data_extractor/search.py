@@ -1,9 +1,20 @@
-from ddgs import DDGS
 from typing import List, Dict, Union
+import hashlib
+import json
 import logging
+import time
+from core import outbound
+from core import store
+from core.config import outbound_settings
 
 
-def get_search_results(search_config: Dict[str, Union[str, int, None]]) -> List[str]:
+def run_ddgs(query: str, timeout: int, **options) -> list:
+    from ddgs import DDGS
+    with DDGS(timeout=timeout) as ddgs:
+        return list(ddgs.text(query=query, **options))
+
+
+def get_search_results(search_config: Dict[str, Union[str, int, None]], timeout: int = 5) -> List[str]:
     logger = logging.getLogger(__name__)
     
     try:
@@ -20,16 +31,26 @@ def get_search_results(search_config: Dict[str, Union[str, int, None]]) -> List[
         
         logger.info(f"Performing DDGS search with query: '{query}', max_results: {max_results}")
         
-        # Initialize DDGS and perform search
-        with DDGS() as ddgs:
-            results = list(ddgs.text(
-                query=query.strip(),
+        # Results of the last successful search for the same query stand in when search fails
+        options = {key: value for key, value in search_config.items() if key != 'max_results'}
+        fallback_key = "search:" + hashlib.sha1(json.dumps(options, sort_keys=True).encode()).hexdigest()
+        try:
+            results = outbound.search.call(
+                run_ddgs,
+                query.strip(),
+                timeout,
                 region=region,
                 safesearch=safesearch,
                 timelimit=timelimit,
                 max_results=max_results,
                 backend=backend
-            ))
+            )
+        except Exception as e:
+            fallback = store.get_metadata(fallback_key)
+            if fallback is None:
+                raise
+            logger.warning(f"Search failed ({e}), using {len(fallback)} earlier results for query: '{query}'")
+            return fallback[:max_results]
         
         # Extract URLs from results
         urls = []
@@ -43,6 +64,8 @@ def get_search_results(search_config: Dict[str, Union[str, int, None]]) -> List[
         
         if not urls:
             logger.warning(f"No valid URLs found for query: '{query}'")
+        else:
+            store.set_metadata(fallback_key, urls, time.time() + outbound_settings.search_fallback_ttl)
             
         return urls
         
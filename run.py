@@ -1,18 +1,75 @@
+import argparse
+import os
+import shutil
+import signal
 import subprocess
 import sys
+import time
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the InstaCheck API server")
+    parser.add_argument("--prod", action="store_true", help="production mode: several workers, no auto-reload")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", "2")), help="server processes in production mode")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--model-server", action="store_true", help="load Whisper and MiniLM once in a shared model server process")
+    parser.add_argument("--model-socket", default=os.getenv("MODEL_SERVER_SOCKET") or "/tmp/instacheck-models.sock")
+    parser.add_argument("--model-startup-timeout", type=float, default=600, help="seconds to wait for the model server to load")
+    parser.add_argument("--app", default="main:app", help="ASGI application to serve")
+    args = parser.parse_args()
+
+    command = [
+        sys.executable, "-m", "uvicorn",
+        args.app,
+        # Import the app from the repository even when started from another directory
+        "--app-dir", os.path.dirname(os.path.abspath(__file__)),
+        "--host", args.host,
+        "--port", str(args.port),
+    ]
+    env = os.environ.copy()
+    if args.prod:
+        command += ["--workers", str(args.workers)]
+        # Each worker writes its metrics here so /metrics can aggregate all of them;
+        # files left over from a previous run would be counted again
+        metrics_dir = env.setdefault("PROMETHEUS_MULTIPROC_DIR", os.path.join("db", "metrics"))
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+        os.makedirs(metrics_dir, exist_ok=True)
+    else:
+        command += ["--reload"]
+
+    model_server = None
     try:
-        subprocess.run([
-            sys.executable, "-m", "uvicorn", 
-            "main:app", 
-            "--host", "0.0.0.0", 
-            "--port", "8000",
-            "--reload"
-        ], check=True)
+        if args.model_server:
+            # API workers then talk to this process instead of loading the models themselves
+            if os.path.exists(args.model_socket):
+                os.remove(args.model_socket)
+            model_server = subprocess.Popen(
+                [sys.executable, "-m", "modules.model_server.server", "--socket", args.model_socket],
+                env=env, cwd=os.path.dirname(os.path.abspath(__file__)),
+            )
+            started = time.monotonic()
+            while not os.path.exists(args.model_socket):
+                if model_server.poll() is not None:
+                    print("Model server exited during startup")
+                    sys.exit(1)
+                if time.monotonic() - started > args.model_startup_timeout:
+                    print("Model server did not start in time")
+                    sys.exit(1)
+                time.sleep(0.5)
+            env["MODEL_SERVER_SOCKET"] = args.model_socket
+
+        server = subprocess.Popen(command, env=env)
+        # Pass a terminate (docker stop, a benchmark harness) on to uvicorn so its workers exit too
+        signal.signal(signal.SIGTERM, lambda *_: server.terminate())
+        if server.wait() != 0:
+            raise subprocess.CalledProcessError(server.returncode, command)
     except subprocess.CalledProcessError as e:
         print(f"Error running uvicorn: {e}")
         sys.exit(1)
     except KeyboardInterrupt:
         print("\nServer stopped by user")
         sys.exit(0)
+    finally:
+        if model_server:
+            model_server.terminate()
+            model_server.wait()